@@ -0,0 +1,151 @@
+"""Mergeable partial aggregates for single-pass reductions over Dask chunks.
+
+Each chunk is reduced to a small summary (count, mean, M2, min, max and NaN
+count per channel); summaries are merged pairwise with Chan et al.'s parallel
+update, which stays numerically stable where a naive sum of squares would not.
+"""
+import functools
+
+import dask
+import numpy as np
+
+# Rows of the leading axis converted to float64 at a time, bounding the
+# temporary memory needed per chunk.
+SLAB_BYTES = 16 * 1024**2
+
+
+def empty_moments(channels):
+    return {
+        "count": np.zeros(channels, dtype=np.int64),
+        "mean": np.zeros(channels, dtype=np.float64),
+        "m2": np.zeros(channels, dtype=np.float64),
+        "min": np.full(channels, np.inf),
+        "max": np.full(channels, -np.inf),
+        "nan_count": np.zeros(channels, dtype=np.int64),
+    }
+
+
+def channel_moments(block):
+    """Reduces a block whose last axis is the channel axis to partial moments."""
+    channels = block.shape[-1]
+    moments = empty_moments(channels)
+    if block.size == 0:
+        return moments
+
+    is_float = np.issubdtype(block.dtype, np.floating)
+    rows = max(1, SLAB_BYTES // max(1, block[0].size * 8))
+    for start in range(0, block.shape[0], rows):
+        # Channel-major copy, so every reduction below runs over contiguous memory.
+        values = np.ascontiguousarray(block[start:start + rows].reshape(-1, channels).T)
+        samples = values.astype(np.float64)
+        if is_float:
+            nan_count = np.isnan(values).sum(axis=1)
+            count = values.shape[1] - nan_count
+            with np.errstate(invalid="ignore"):
+                mean = np.nansum(samples, axis=1) / np.maximum(count, 1)
+                samples -= mean[:, None]
+                m2 = np.nansum(np.square(samples, out=samples), axis=1)
+            lowest = np.where(count > 0, np.fmin.reduce(values, axis=1), np.inf)
+            highest = np.where(count > 0, np.fmax.reduce(values, axis=1), -np.inf)
+        else:
+            nan_count = np.zeros(channels, dtype=np.int64)
+            count = np.full(channels, values.shape[1], dtype=np.int64)
+            mean = samples.sum(axis=1) / values.shape[1]
+            samples -= mean[:, None]
+            m2 = np.square(samples, out=samples).sum(axis=1)
+            lowest, highest = values.min(axis=1), values.max(axis=1)
+
+        moments = merge_moments(moments, {
+            "count": count,
+            "mean": mean,
+            "m2": m2,
+            "min": lowest.astype(np.float64),
+            "max": highest.astype(np.float64),
+            "nan_count": nan_count,
+        })
+    return moments
+
+
+def merge_moments(a, b):
+    """Merges two partial moment summaries (Chan et al., 1979)."""
+    count = a["count"] + b["count"]
+    safe = np.maximum(count, 1)
+    delta = b["mean"] - a["mean"]
+    return {
+        "count": count,
+        "mean": a["mean"] + delta * (b["count"] / safe),
+        "m2": a["m2"] + b["m2"] + delta**2 * (a["count"] * b["count"] / safe),
+        "min": np.minimum(a["min"], b["min"]),
+        "max": np.maximum(a["max"], b["max"]),
+        "nan_count": a["nan_count"] + b["nan_count"],
+    }
+
+
+def merge_all(parts, merge=merge_moments):
+    return functools.reduce(merge, parts)
+
+
+def reduce_blocks(array, chunk_func, merge=merge_moments, split_every=32):
+    """Builds a lazy tree reduction of ``chunk_func`` over every chunk.
+
+    Returns a Dask delayed object; computing it reads each chunk exactly once.
+    """
+    parts = [dask.delayed(chunk_func)(block) for block in array.to_delayed().ravel()]
+    while len(parts) > 1:
+        parts = [
+            dask.delayed(merge_all)(parts[i:i + split_every], merge)
+            for i in range(0, len(parts), split_every)
+        ]
+    return parts[0]
+
+
+def summarize(moments):
+    """Turns merged moments into one JSON-friendly dict per channel."""
+    summaries = []
+    for c in range(len(moments["count"])):
+        count = int(moments["count"][c])
+        summaries.append({
+            "mean": float(moments["mean"][c]) if count else None,
+            "std": float(np.sqrt(moments["m2"][c] / count)) if count else None,
+            "min": float(moments["min"][c]) if count else None,
+            "max": float(moments["max"][c]) if count else None,
+            "count": count,
+            "nan_count": int(moments["nan_count"][c]),
+        })
+    return summaries
+
+
+def channel_scatter(block):
+    """Reduces a (..., C) block to its pixel count, channel means and C x C scatter matrix."""
+    channels = block.shape[-1]
+    scatter = {
+        "count": 0,
+        "mean": np.zeros(channels),
+        "scatter": np.zeros((channels, channels)),
+    }
+    rows = max(1, SLAB_BYTES // max(1, block[0].size * 8))
+    for start in range(0, block.shape[0], rows):
+        pixels = block[start:start + rows].reshape(-1, channels).astype(np.float64)
+        if len(pixels) == 0:
+            continue
+        mean = pixels.mean(axis=0)
+        pixels -= mean
+        scatter = merge_scatter(scatter, {
+            "count": len(pixels),
+            "mean": mean,
+            "scatter": pixels.T @ pixels,
+        })
+    return scatter
+
+
+def merge_scatter(a, b):
+    """Merges two partial scatter summaries, the matrix form of ``merge_moments``."""
+    count = a["count"] + b["count"]
+    if count == 0:
+        return a
+    delta = b["mean"] - a["mean"]
+    return {
+        "count": count,
+        "mean": a["mean"] + delta * (b["count"] / count),
+        "scatter": a["scatter"] + b["scatter"] + np.outer(delta, delta) * (a["count"] * b["count"] / count),
+    }
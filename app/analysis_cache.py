@@ -0,0 +1,215 @@
+import atexit
+import hashlib
+import json
+import os
+import logging
+import threading
+import time
+from sqlalchemy.exc import IntegrityError, OperationalError
+from database import ImageAnalysis, ImageMetadata, session_scope
+import metrics
+
+# Seconds the writer waits for more records before writing a batch.
+ANALYSIS_WRITE_INTERVAL = float(os.environ.get("ANALYSIS_WRITE_INTERVAL", 0.05))
+ANALYSIS_WRITE_BATCH = 100
+
+
+def file_identity(file_path):
+    """Returns (mtime_ns, size) of the file, used to validate cached results."""
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def cache_key(file_path, operation, parameters=None):
+    """Hashes the question being asked: which file, which operation, which parameters."""
+    payload = json.dumps(
+        [os.path.abspath(file_path), operation, parameters or {}], sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def versioned_key(file_path, operation, parameters=None):
+    """Like cache_key, but also changes whenever the file on disk is modified."""
+    file_mtime, file_size = file_identity(file_path)
+    return cache_key(
+        file_path, operation,
+        {**(parameters or {}), "file_mtime": file_mtime, "file_size": file_size},
+    )
+
+
+def lookup_analysis(db, file_path, operation, parameters=None):
+    """Returns the stored ImageAnalysis row if it is still valid for the file on disk.
+
+    Records still queued in ``analysis_writer`` are returned as unsaved rows.
+    """
+    key = cache_key(file_path, operation, parameters)
+    values = analysis_writer.pending(key)
+    if values is not None:
+        entry = ImageAnalysis(cache_key=key, **values)
+    else:
+        entry = db.query(ImageAnalysis).filter_by(cache_key=key).first()
+    if entry is None or (entry.file_mtime, entry.file_size) != file_identity(file_path):
+        return None
+    return entry
+
+
+def _analysis_values(file_path, operation, parameters, fields):
+    file_mtime, file_size = file_identity(file_path)
+    return dict(
+        file_path=file_path,
+        operation=operation,
+        parameters=parameters or {},
+        file_mtime=file_mtime,
+        file_size=file_size,
+        **fields,
+    )
+
+
+def store_analysis(db, file_path, operation, parameters=None, **fields):
+    """Inserts or updates the single ImageAnalysis row for this file/operation/parameters."""
+    key = cache_key(file_path, operation, parameters)
+    values = _analysis_values(file_path, operation, parameters, fields)
+    return _upsert(db, ImageAnalysis, {"cache_key": key}, values)
+
+
+class AnalysisWriter:
+    """Stores analysis records from a background thread, in batches.
+
+    Requests hand results over with ``submit`` and return without waiting
+    for the database. Records for the same key are collapsed to the latest
+    one, and each batch is written in a single transaction. Until a record
+    is committed, ``pending`` serves it to ``lookup_analysis``.
+    """
+
+    def __init__(self, interval=ANALYSIS_WRITE_INTERVAL, batch_size=ANALYSIS_WRITE_BATCH):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._reset()
+
+    def _reset(self):
+        self._condition = threading.Condition()
+        self._queued = {}
+        self._writing = {}
+        self._thread = None
+
+    def submit(self, file_path, operation, parameters=None, **fields):
+        """Queues the same record as ``store_analysis`` would write."""
+        key = cache_key(file_path, operation, parameters)
+        values = _analysis_values(file_path, operation, parameters, fields)
+        with self._condition:
+            self._queued[key] = values
+            if self._thread is None:
+                # Started on first use, so forked processes start their own.
+                self._thread = threading.Thread(target=self._run, name="analysis-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def pending(self, key):
+        """The values queued or being written for ``key``, or None."""
+        with self._condition:
+            return self._queued.get(key) or self._writing.get(key)
+
+    def flush(self, timeout=None):
+        """Waits until every queued record is committed; returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queued and not self._writing, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queued)
+            # Let concurrent requests add to the batch.
+            time.sleep(self.interval)
+            with self._condition:
+                keys = list(self._queued)[:self.batch_size]
+                self._writing = {key: self._queued.pop(key) for key in keys}
+            try:
+                self._write(self._writing)
+            except Exception as e:
+                logging.error(f"Could not store {len(self._writing)} analysis records: {e}")
+            finally:
+                with self._condition:
+                    self._writing = {}
+                    self._condition.notify_all()
+
+    def _write(self, batch):
+        for attempt in range(3):
+            try:
+                with session_scope() as db, metrics.stage("db"):
+                    for key, values in batch.items():
+                        _merge_row(db, ImageAnalysis, {"cache_key": key}, values)
+                    db.commit()
+                return
+            except IntegrityError:
+                # Another process inserted one of the rows; store them one by one.
+                with session_scope() as db:
+                    for key, values in batch.items():
+                        _upsert(db, ImageAnalysis, {"cache_key": key}, values)
+                return
+            except OperationalError as e:
+                # Still locked after the busy timeout: back off and retry.
+                logging.warning(f"Analysis batch write failed ({e}), retrying")
+                time.sleep(0.5 * (attempt + 1))
+        raise RuntimeError("Database stayed locked")
+
+
+analysis_writer = AnalysisWriter()
+os.register_at_fork(after_in_child=analysis_writer._reset)
+atexit.register(analysis_writer.flush, 10)
+
+
+def lookup_metadata(db, file_path):
+    """Returns the cached metadata dict for the file, or None if missing or stale."""
+    entry = db.query(ImageMetadata).filter_by(file_path=file_path).first()
+    if entry is None or entry.details is None:
+        return None
+    if (entry.file_mtime, entry.file_size) != file_identity(file_path):
+        return None
+    return entry.details
+
+
+def store_metadata(db, file_path, details):
+    """Upserts the ImageMetadata row for the file with freshly computed details."""
+    file_mtime, file_size = file_identity(file_path)
+    shape = list(details["shape"])
+    # Rows describe the (X, Y, Z, Time, Channel) layout enforced by /upload.
+    height, width, depth, time_frames, channels = (shape + [1] * 5)[:5]
+    values = dict(
+        width=width,
+        height=height,
+        depth=depth,
+        time_frames=time_frames,
+        channels=channels,
+        dtype=details["dtype"],
+        file_mtime=file_mtime,
+        file_size=file_size,
+        details=details,
+    )
+    return _upsert(db, ImageMetadata, {"file_path": file_path}, values)
+
+
+def _merge_row(db, model, unique_fields, values):
+    """Updates the row matching ``unique_fields`` or adds it to the session, uncommitted."""
+    entry = db.query(model).filter_by(**unique_fields).first()
+    if entry is None:
+        entry = model(**unique_fields, **values)
+        db.add(entry)
+    else:
+        for name, value in values.items():
+            setattr(entry, name, value)
+    return entry
+
+
+def _upsert(db, model, unique_fields, values):
+    """Updates the row matching ``unique_fields`` or inserts it, tolerating insert races."""
+    with metrics.stage("db"):
+        for _ in range(2):
+            entry = _merge_row(db, model, unique_fields, values)
+            try:
+                db.commit()
+                return entry
+            except IntegrityError:
+                # Another request inserted the same row first; update it instead.
+                db.rollback()
+                logging.debug(f"Concurrent insert into {model.__tablename__}, retrying as update")
+    raise RuntimeError(f"Could not store {model.__tablename__} row for {unique_fields}")
@@ -0,0 +1,158 @@
+"""Content-addressed store for operation outputs.
+
+Every artifact is named after a hash of (input file identity, operation,
+parameters), so concurrent requests never overwrite each other's outputs and
+a repeated request is served from disk without recomputation. Files are
+written to a temporary name and renamed into place, and the least recently
+used artifacts are evicted once the store exceeds its size budget. Artifacts
+used within the last ``ARTIFACT_GRACE_SECONDS`` are never evicted, so a path
+handed to a client stays readable for at least that long.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from analysis_cache import versioned_key
+
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", "data/artifacts")
+ARTIFACT_MAX_BYTES = int(os.environ.get("ARTIFACT_MAX_BYTES", 10 * 1024**3))
+ARTIFACT_GRACE_SECONDS = float(os.environ.get("ARTIFACT_GRACE_SECONDS", 300))
+
+
+class ArtifactStore:
+    def __init__(self, root=ARTIFACT_DIR, max_bytes=ARTIFACT_MAX_BYTES, grace_seconds=ARTIFACT_GRACE_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._size = None
+
+    def key(self, file_path, operation, parameters=None):
+        """Hashes the input file's identity together with the operation and its parameters."""
+        return versioned_key(file_path, operation, parameters)
+
+    def path_for(self, key, suffix=".tif"):
+        return os.path.join(self.root, key[:2], key + suffix)
+
+    def get(self, key, suffix=".tif"):
+        """Returns the artifact's path if it exists, marking it as recently used.
+
+        The mark is set under the store lock, which eviction holds as well, so
+        a file found here is not deleted within the grace window.
+        """
+        path = self.path_for(key, suffix)
+        with self._lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+        return path
+
+    @contextmanager
+    def write(self, key, suffix=".tif"):
+        """Yields a temporary path to write to; it is renamed into place on success."""
+        path = self.path_for(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            yield temp_path
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._added(os.path.getsize(path))
+
+    def get_or_create(self, key, produce, suffix=".tif"):
+        """Returns the artifact for ``key``, calling ``produce(temp_path)`` on a miss.
+
+        Concurrent requests for the same key in this process wait for the
+        first one instead of computing the artifact twice.
+        """
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                path = self.get(key, suffix)
+                with self._lock:
+                    if path is not None:
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                if path is None:
+                    with self.write(key, suffix) as temp_path:
+                        produce(temp_path)
+                    path = self.path_for(key, suffix)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
+        return path
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "bytes": self._current_size(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else None,
+                "evictions": self.evictions,
+            }
+
+    def _artifacts(self):
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".tmp"):
+                    yield os.path.join(directory, name)
+
+    def _current_size(self):
+        if self._size is None:
+            self._size = sum(os.path.getsize(path) for path in self._artifacts())
+        return self._size
+
+    def _added(self, size):
+        with self._lock:
+            # A first scan already sees the new file; otherwise count it in.
+            self._size = self._current_size() if self._size is None else self._size + size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Deletes least recently used artifacts until the store fits its budget."""
+        entries = []
+        for path in self._artifacts():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        recent = time.time() - self.grace_seconds
+        # The newest artifact is never evicted, even if it alone exceeds the budget.
+        for used, size, path in entries[:-1]:
+            if self._size <= self.max_bytes:
+                break
+            if used >= recent:
+                logging.warning(f"Artifact store over budget; artifacts used in the last {self.grace_seconds:g} s are kept")
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+            self.evictions += 1
+            logging.debug(f"Evicted artifact {path}")
+
+
+artifact_store = ArtifactStore()
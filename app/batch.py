@@ -0,0 +1,139 @@
+"""Batched slice, region and statistics requests.
+
+A batch is planned as a whole: every operation becomes a lazy Dask
+computation on the (cached) image of its file, and all of them are computed
+in a single call. Dask merges their graphs, so a chunk needed by several
+operations, such as the planes of a montage or a time-lapse strip, is read
+and decoded once, while operations on different files or disjoint chunks
+run in parallel on the shared pool. Stored statistics are reused.
+
+Results are returned as a zip archive: one encoded array per slice or
+region, plus ``results.json`` describing every operation in order.
+"""
+import io
+import json
+import os
+import zipfile
+from contextlib import nullcontext
+
+import dask
+
+import metrics
+from analysis_cache import analysis_writer, lookup_analysis
+from database import session_scope
+from encoding import encode_array
+from execution import heavy
+from image_cache import get_processor
+from image_processor import RegionTooLarge, summarize_statistics
+
+BATCH_TYPES = ("slice", "region", "statistics")
+BATCH_MAX_OPERATIONS = int(os.environ.get("BATCH_MAX_OPERATIONS", 256))
+# Limit on the combined uncompressed size of all slices and regions of a batch.
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", 256 * 1024**2))
+AXES = ("x", "y", "z", "time", "channel")
+
+
+class BatchError(ValueError):
+    """An operation of the batch is invalid; ``index`` says which one."""
+
+    def __init__(self, index, message):
+        super().__init__(f"Operation {index}: {message}")
+        self.index = index
+
+
+def plan_batch(operations, max_bytes=BATCH_MAX_BYTES):
+    """Validates the operations and turns them into lazy computations.
+
+    Each operation is a dict with ``type`` (slice, region or statistics),
+    ``file_path``, and for slices and regions the axes ``x`` .. ``channel``
+    (index, slice or None) and an optional positive integer ``max_size``.
+    Returns one entry per operation; raises BatchError or RegionTooLarge.
+    """
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise ValueError(f"A batch holds at most {BATCH_MAX_OPERATIONS} operations")
+
+    planned, total_bytes = [], 0
+    with session_scope() as db:
+        for index, operation in enumerate(operations):
+            kind, file_path = operation.get("type"), operation.get("file_path")
+            if kind not in BATCH_TYPES:
+                raise BatchError(index, f"Unknown type '{kind}', expected one of {', '.join(BATCH_TYPES)}")
+            if not file_path or not os.path.exists(file_path):
+                raise BatchError(index, "File not found")
+
+            processor = get_processor(file_path)
+            entry = {"index": index, "type": kind, "file_path": file_path}
+            if kind == "statistics":
+                cached = lookup_analysis(db, file_path, "statistics")
+                if cached is not None:
+                    entry["statistics"] = cached.statistics
+                else:
+                    entry["lazy"] = processor.statistics_moments()
+            else:
+                selection = {axis: operation.get(axis) for axis in AXES}
+                max_size = operation.get("max_size")
+                # bool is an int subclass, but true/false is not a size.
+                if max_size is not None and (not isinstance(max_size, int) or isinstance(max_size, bool) or max_size < 1):
+                    raise BatchError(index, "max_size must be a positive integer")
+                try:
+                    level = processor.choose_level(max_size, selection["x"], selection["y"]) if max_size else 0
+                    region = processor.select_region(**selection, level=level)
+                except (IndexError, ValueError) as e:
+                    raise BatchError(index, str(e))
+                total_bytes += region.nbytes
+                if total_bytes > max_bytes:
+                    raise RegionTooLarge(f"Batch results exceed the limit of {max_bytes} bytes")
+                entry.update(lazy=region, level=level)
+            planned.append(entry)
+    return planned
+
+
+def compute_batch(planned):
+    """Computes every pending entry in one Dask call and stores new statistics."""
+    pending = [entry for entry in planned if "lazy" in entry]
+    if not pending:
+        return planned
+
+    # Statistics scan whole images; they take a heavy slot like /statistics.
+    scans = any(entry["type"] == "statistics" for entry in pending)
+    with heavy() if scans else nullcontext():
+        with metrics.stage("compute"):
+            results = dask.compute(*[entry.pop("lazy") for entry in pending])
+
+    for entry, result in zip(pending, results):
+        if entry["type"] == "statistics":
+            entry["statistics"] = summarize_statistics(result)
+            analysis_writer.submit(entry["file_path"], "statistics", statistics=entry["statistics"])
+        else:
+            entry["result"] = result
+    return planned
+
+
+def write_archive(planned, fmt="tiff", compression="none"):
+    """Encodes the results into a zip archive; returns it as a BytesIO buffer.
+
+    For npy and raw, zlib compression is applied by the archive itself.
+    """
+    deflate = fmt in ("npy", "raw") and compression == "zlib"
+    buffer = io.BytesIO()
+    manifest = []
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for entry in planned:
+            record = {"index": entry["index"], "type": entry["type"], "file_path": entry["file_path"]}
+            if entry["type"] == "statistics":
+                record["statistics"] = entry["statistics"]
+            else:
+                result = entry["result"]
+                with metrics.stage("encode"):
+                    data, _, extension, _ = encode_array(result, fmt, "none" if deflate else compression)
+                stem = os.path.splitext(os.path.basename(entry["file_path"]))[0]
+                name = f"{entry['index']:03d}_{entry['type']}_{stem}{extension}"
+                archive.writestr(
+                    name, data.getvalue(),
+                    compress_type=zipfile.ZIP_DEFLATED if deflate else zipfile.ZIP_STORED,
+                )
+                record.update(file=name, shape=list(result.shape), dtype=result.dtype.str, level=entry["level"])
+            manifest.append(record)
+        archive.writestr("results.json", json.dumps(manifest, indent=2))
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,175 @@
+"""Per-chunk min/max/sum/count summaries of an image, built at ingest.
+
+The image is split into a grid of chunks of about ``SUMMARY_CHUNK_BYTES``
+with all channels in one chunk, and each chunk is reduced to per-channel
+min, max, sum and (non-NaN) count. The result is saved next to the image
+(``<image>.summary.npz``) with the chunk boundaries and the source file's
+identity; a summary whose source has changed is ignored.
+
+The summary answers whole-image ranges without reading pixels, and region
+queries read only the chunks that the region cuts through: chunks lying
+fully inside it are taken from the summary.
+"""
+import logging
+import os
+import uuid
+
+import numpy as np
+from dask.array.core import normalize_chunks
+
+from zarr_store import source_identity
+
+SUMMARY_CHUNK_BYTES = 4 * 1024**2
+FIELDS = ("min", "max", "sum", "count")
+
+
+def summary_path(file_path):
+    return f"{file_path}.summary.npz"
+
+
+def block_summary(block):
+    """Reduces a (..., C) block to a (C, 4) array of min, max, sum and count."""
+    values = block.reshape(-1, block.shape[-1])
+    if np.issubdtype(values.dtype, np.floating):
+        count = values.shape[0] - np.isnan(values).sum(axis=0)
+        with np.errstate(invalid="ignore"):
+            lowest = np.where(count > 0, np.fmin.reduce(values, axis=0), np.inf)
+            highest = np.where(count > 0, np.fmax.reduce(values, axis=0), -np.inf)
+        total = np.nansum(values, axis=0, dtype=np.float64)
+    else:
+        count = np.full(values.shape[1], values.shape[0])
+        if values.shape[0]:
+            lowest, highest = values.min(axis=0), values.max(axis=0)
+        else:
+            lowest, highest = np.full(values.shape[1], np.inf), np.full(values.shape[1], -np.inf)
+        total = values.sum(axis=0, dtype=np.float64)
+    return np.stack([lowest, highest, total, count], axis=-1).astype(np.float64)
+
+
+def empty(channels):
+    """Summary of no pixels: min +inf, max -inf, sum and count 0."""
+    return merge(np.empty((0, channels, len(FIELDS))))
+
+
+def merge(summaries):
+    """Merges (..., C, 4) summaries over all leading axes into one (C, 4) summary."""
+    summaries = summaries.reshape(-1, *summaries.shape[-2:])
+    return np.stack([
+        summaries[..., 0].min(axis=0, initial=np.inf),
+        summaries[..., 1].max(axis=0, initial=-np.inf),
+        summaries[..., 2].sum(axis=0),
+        summaries[..., 3].sum(axis=0),
+    ], axis=-1)
+
+
+def merge_pair(a, b):
+    return merge(np.stack([a, b]))
+
+
+def to_dict(summary):
+    """Turns a (C, 4) summary into one JSON-friendly dict per channel."""
+    channels = []
+    for lowest, highest, total, count in summary:
+        count = int(count)
+        channels.append({
+            "min": float(lowest) if count else None,
+            "max": float(highest) if count else None,
+            "mean": float(total / count) if count else None,
+            "count": count,
+        })
+    return channels
+
+
+def summary_chunks(image):
+    """Chunk grid of the summary: about SUMMARY_CHUNK_BYTES, aligned to the image's chunks."""
+    return normalize_chunks(
+        ("auto",) * (image.ndim - 1) + (-1,), image.shape,
+        limit=SUMMARY_CHUNK_BYTES, dtype=image.dtype, previous_chunks=image.chunksize,
+    )
+
+
+def build_summary(file_path, image):
+    """Computes the chunk summary of ``image`` (the Dask array of ``file_path``) and saves it."""
+    path = summary_path(file_path)
+    file_mtime, file_size = source_identity(file_path)
+    chunks = summary_chunks(image)
+    channels = image.shape[-1]
+
+    blocks = image.rechunk(chunks).map_blocks(
+        lambda block: block_summary(block)[(np.newaxis,) * (block.ndim - 1)],
+        chunks=tuple((1,) * len(sizes) for sizes in chunks[:-1]) + ((channels,), (len(FIELDS),)),
+        new_axis=image.ndim,
+        dtype=np.float64,
+    )
+    summaries = blocks.compute()
+
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+    try:
+        np.savez(
+            temp_path,
+            summaries=summaries,
+            source=np.array([file_mtime, file_size]),
+            **{f"offsets_{axis}": np.cumsum((0,) + sizes) for axis, sizes in enumerate(chunks[:-1])},
+        )
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    logging.debug(f"Chunk summary of {file_path}: {summaries.shape[:-2]} chunks")
+    return path
+
+
+class ChunkSummary:
+    def __init__(self, summaries, offsets):
+        self.summaries = summaries
+        self.offsets = offsets
+
+    def total(self):
+        """(C, 4) summary of the whole image."""
+        return merge(self.summaries)
+
+    def region(self, key):
+        """Splits a region into its summary part and the pieces that must be read.
+
+        ``key`` holds one ``slice(start, stop)`` (unit step) per non-channel
+        axis. Returns (summary of the chunks fully inside the region, list of
+        keys of the partially covered chunk intersections).
+        """
+        covered, partial = [], []
+        per_axis = []
+        for offsets, index in zip(self.offsets, key):
+            start, stop = index.start, index.stop
+            axis_chunks = []
+            for i in range(len(offsets) - 1):
+                low, high = max(start, offsets[i]), min(stop, offsets[i + 1])
+                if low < high:
+                    full = low == offsets[i] and high == offsets[i + 1]
+                    axis_chunks.append((i, slice(low, high), full))
+            per_axis.append(axis_chunks)
+
+        for combination in np.ndindex(*(len(axis_chunks) for axis_chunks in per_axis)):
+            parts = [per_axis[axis][i] for axis, i in enumerate(combination)]
+            if all(full for _, _, full in parts):
+                covered.append(self.summaries[tuple(i for i, _, _ in parts)])
+            else:
+                partial.append(tuple(index for _, index, _ in parts))
+
+        total = merge(np.array(covered)) if covered else empty(self.summaries.shape[-2])
+        return total, partial
+
+
+def load_summary(file_path):
+    """Returns the ChunkSummary of ``file_path``, or None if absent or stale."""
+    path = summary_path(file_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if tuple(data["source"]) != source_identity(file_path):
+                return None
+            summaries = data["summaries"]
+            offsets = [data[f"offsets_{axis}"] for axis in range(summaries.ndim - 2)]
+    except (KeyError, ValueError, OSError) as e:
+        logging.warning(f"Ignoring unreadable chunk summary {path}: {e}")
+        return None
+    return ChunkSummary(summaries, offsets)
@@ -0,0 +1,211 @@
+"""Scalable K-Means for intensity and multi-channel feature segmentation.
+
+Single channels are clustered in 1D: centers are fitted on a global
+intensity histogram, which is accumulated chunk by chunk in one parallel
+pass. For 8 and 16 bit integer images the histogram holds every distinct
+value, so Lloyd's algorithm on the weighted histogram gives exactly the
+result of running it on every voxel. Float images are binned into
+``HISTOGRAM_BINS`` bins between their min and max. Labels are then assigned
+chunk by chunk against the sorted centers.
+
+Feature vectors (several channels, or their PCA projection) are clustered on
+a uniform random sample of at most ``KMEANS_SAMPLE_ROWS`` voxels, drawn chunk
+by chunk in one parallel pass, with k-means++ seeding and Lloyd's algorithm.
+Every chunk is then labelled with a vectorized nearest-center search, so
+memory is bounded by the sample and a few chunks whatever the volume size.
+"""
+import os
+
+import dask
+import numpy as np
+
+import aggregates
+
+HISTOGRAM_BINS = 4096
+# Labels are stored as uint8.
+KMEANS_MAX_CLUSTERS = 256
+KMEANS_SAMPLE_ROWS = int(os.environ.get("KMEANS_SAMPLE_ROWS", 2**18))
+KMEANS_SEED = 0
+
+
+def check_clusters(k):
+    """Raises ValueError unless k clusters fit the uint8 label images."""
+    if not 1 <= k <= KMEANS_MAX_CLUSTERS:
+        raise ValueError(f"k must be between 1 and {KMEANS_MAX_CLUSTERS}")
+
+
+def _is_exact(dtype):
+    return np.issubdtype(dtype, np.integer) and dtype.itemsize <= 2
+
+
+def _bincount_block(block, offset, minlength):
+    return np.bincount((block.ravel().astype(np.int64) - offset), minlength=minlength)
+
+
+def _histogram_block(block, edges):
+    values = block.ravel()
+    return np.histogram(values[~np.isnan(values)], bins=edges)[0]
+
+
+def intensity_histogram(image):
+    """Returns (values, counts) describing the distribution of a Dask array."""
+    dtype = image.dtype
+    if _is_exact(dtype):
+        info = np.iinfo(dtype)
+        size = int(info.max) - int(info.min) + 1
+        counts = aggregates.reduce_blocks(
+            image, lambda block: _bincount_block(block, int(info.min), size), np.add
+        ).compute()
+        values = np.arange(int(info.min), int(info.max) + 1, dtype=np.float64)
+    else:
+        lowest, highest = (float(v) for v in value_range(image))
+        if lowest == highest:
+            highest = lowest + 1.0
+        edges = np.linspace(lowest, highest, HISTOGRAM_BINS + 1)
+        counts = aggregates.reduce_blocks(
+            image, lambda block: _histogram_block(block, edges), np.add
+        ).compute()
+        values = (edges[:-1] + edges[1:]) / 2
+
+    present = counts > 0
+    return values[present], counts[present]
+
+
+def value_range(image):
+    moments = aggregates.reduce_blocks(
+        image.reshape(image.shape + (1,)), aggregates.channel_moments
+    ).compute()
+    return moments["min"][0], moments["max"][0]
+
+
+def kmeans_1d(values, weights, k, max_iter=100, tol=1e-6):
+    """Weighted Lloyd's algorithm on sorted 1D values; returns sorted centers.
+
+    Centers start at evenly spaced weighted quantiles, which is deterministic
+    and, for a scalar feature, already close to the optimum.
+    """
+    check_clusters(k)
+    if len(values) == 0:
+        raise ValueError("Cannot cluster an empty image")
+    cumulative = np.cumsum(weights) / np.sum(weights)
+    quantiles = (np.arange(k) + 0.5) / k
+    centers = values[np.minimum(np.searchsorted(cumulative, quantiles), len(values) - 1)]
+    centers = centers.astype(np.float64)
+
+    for _ in range(max_iter):
+        labels = assign_labels(values, centers)
+        totals = np.bincount(labels, weights=weights * values, minlength=k)
+        sizes = np.bincount(labels, weights=weights, minlength=k)
+        # Empty clusters keep their previous center.
+        updated = np.where(sizes > 0, totals / np.maximum(sizes, 1e-12), centers)
+        updated.sort()
+        shift = np.max(np.abs(updated - centers))
+        centers = updated
+        if shift <= tol:
+            break
+    return centers
+
+
+def assign_labels(block, centers):
+    """Labels each value with the index of its nearest (sorted) center."""
+    boundaries = (centers[:-1] + centers[1:]) / 2
+    label_dtype = np.min_scalar_type(len(centers) - 1)
+    return np.searchsorted(boundaries, block).astype(label_dtype)
+
+
+def fit_centers(image, k):
+    """Fits k intensity centers on a Dask array from its histogram."""
+    values, counts = intensity_histogram(image)
+    return kmeans_1d(values, counts.astype(np.float64), k)
+
+
+def _sample_block(block, fraction, seed):
+    """A Bernoulli sample of the feature vectors of one (..., F) block."""
+    rows = block.reshape(-1, block.shape[-1])
+    rng = np.random.default_rng(seed)
+    return rows[rng.random(len(rows)) < fraction].astype(np.float64)
+
+
+def sample_features(image, size=None, seed=KMEANS_SEED):
+    """Draws about ``size`` feature vectors uniformly from an (..., F) Dask array.
+
+    The last axis must be a single chunk. Each chunk keeps every voxel with
+    the same probability, from a generator seeded by the chunk's position, so
+    the sample does not depend on the scheduler.
+    """
+    size = KMEANS_SAMPLE_ROWS if size is None else size
+    voxels = int(np.prod(image.shape[:-1]))
+    fraction = min(1.0, size / max(voxels, 1))
+    blocks = image.to_delayed()
+    parts = dask.compute(*[
+        dask.delayed(_sample_block)(blocks[index], fraction, (seed,) + index)
+        for index in np.ndindex(*blocks.shape)
+    ])
+    return np.concatenate(parts) if parts else np.empty((0, image.shape[-1]))
+
+
+def nearest_centers(rows, centers):
+    """Index of the nearest center of each row of an (N, F) array.
+
+    ``|x - c|^2 = |x|^2 - 2 x.c + |c|^2`` and the first term is the same
+    for every center, so one matrix product ranks them all.
+    """
+    distances = np.asarray(rows, dtype=np.float64) @ (-2 * centers.T) + np.sum(centers**2, axis=1)
+    return np.argmin(distances, axis=1).astype(np.min_scalar_type(len(centers) - 1))
+
+
+def _kmeans_plus_plus(rows, k, rng):
+    centers = [rows[rng.integers(len(rows))]]
+    distances = np.sum((rows - centers[0]) ** 2, axis=1)
+    for _ in range(1, k):
+        total = distances.sum()
+        # Fewer distinct rows than clusters: the extra centers duplicate one.
+        index = rng.choice(len(rows), p=distances / total) if total > 0 else rng.integers(len(rows))
+        centers.append(rows[index])
+        distances = np.minimum(distances, np.sum((rows - rows[index]) ** 2, axis=1))
+    return np.array(centers, dtype=np.float64)
+
+
+def kmeans_features(rows, k, max_iter=100, tol=1e-6, seed=KMEANS_SEED):
+    """Lloyd's algorithm on (N, F) feature vectors with k-means++ seeding.
+
+    Returns (k, F) centers ordered by the mean of their features, so label 0
+    is the darkest cluster as in the 1D engine.
+    """
+    check_clusters(k)
+    if len(rows) == 0:
+        raise ValueError("Cannot cluster an empty image")
+    rows = np.asarray(rows, dtype=np.float64)
+    centers = _kmeans_plus_plus(rows, k, np.random.default_rng(seed))
+
+    for _ in range(max_iter):
+        labels = nearest_centers(rows, centers)
+        sizes = np.bincount(labels, minlength=k)
+        totals = np.stack([np.bincount(labels, weights=rows[:, f], minlength=k) for f in range(rows.shape[1])], axis=1)
+        # Empty clusters keep their previous center.
+        updated = np.where(sizes[:, None] > 0, totals / np.maximum(sizes, 1)[:, None], centers)
+        shift = np.max(np.abs(updated - centers))
+        centers = updated
+        if shift <= tol:
+            break
+    return centers[np.argsort(centers.mean(axis=1), kind="stable")]
+
+
+def fit_feature_centers(image, k, sample_rows=None):
+    """Fits k centers on a sample of an (..., F) Dask array's feature vectors."""
+    return kmeans_features(sample_features(image, sample_rows), k)
+
+
+def _label_features_block(block, centers):
+    labels = nearest_centers(block.reshape(-1, block.shape[-1]), centers)
+    return labels.reshape(block.shape[:-1])
+
+
+def assign_feature_labels(image, centers):
+    """Labels an (..., F) Dask array lazily, chunk by chunk; drops the feature axis."""
+    return image.map_blocks(
+        _label_features_block,
+        centers,
+        drop_axis=image.ndim - 1,
+        dtype=np.min_scalar_type(len(centers) - 1),
+    )
@@ -0,0 +1,83 @@
+"""In-memory encoding of arrays for HTTP responses.
+
+Arrays are encoded straight into a ``BytesIO`` buffer, so responses never
+touch the disk. Supported formats:
+
+- ``tiff``: the array as-is, optionally ``zlib`` or ``lzma`` compressed.
+- ``png``: 2D or (Y, X, 1/3/4) 8 or 16 bit images; ``none`` stores it
+  uncompressed, otherwise the default deflate level is used.
+- ``npy``: NumPy's ``.npy`` format, dtype and shape included.
+- ``raw``: the C-ordered bytes; shape and dtype are returned in the
+  ``X-Array-Shape`` and ``X-Array-Dtype`` headers.
+
+For ``npy`` and ``raw``, ``zlib`` compression is applied as an HTTP
+``Content-Encoding: deflate``, which clients decode transparently.
+"""
+import io
+import zlib
+
+import numpy as np
+import tifffile as tiff
+
+FORMATS = {
+    "tiff": ("image/tiff", ".tif", ("none", "zlib", "lzma")),
+    "png": ("image/png", ".png", ("none", "zlib")),
+    "npy": ("application/octet-stream", ".npy", ("none", "zlib")),
+    "raw": ("application/octet-stream", ".raw", ("none", "zlib")),
+}
+
+
+def _encode_png(array, compression):
+    # OpenCV is only needed for PNG; importing it on first use keeps startup fast.
+    import cv2
+
+    if array.dtype not in (np.uint8, np.uint16):
+        raise ValueError(f"PNG supports uint8 and uint16 images, not {array.dtype}")
+    if array.ndim == 3 and array.shape[-1] == 1:
+        array = array[..., 0]
+    if array.ndim == 3 and array.shape[-1] in (3, 4):
+        # OpenCV expects BGR(A) channel order.
+        array = cv2.cvtColor(array, cv2.COLOR_RGB2BGR if array.shape[-1] == 3 else cv2.COLOR_RGBA2BGRA)
+    elif array.ndim != 2:
+        raise ValueError(f"PNG cannot encode an array of shape {array.shape}")
+    level = 0 if compression == "none" else 6
+    ok, encoded = cv2.imencode(".png", array, [cv2.IMWRITE_PNG_COMPRESSION, level])
+    if not ok:
+        raise ValueError("PNG encoding failed")
+    return encoded.tobytes()
+
+
+def check_format(fmt, compression):
+    """Raises ValueError unless ``fmt`` supports ``compression``."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {sorted(FORMATS)}")
+    if compression not in FORMATS[fmt][2]:
+        raise ValueError(f"Format '{fmt}' supports compression {list(FORMATS[fmt][2])}")
+
+
+def encode_array(array, fmt="tiff", compression="none"):
+    """Encodes ``array``; returns (buffer, mimetype, extension, headers)."""
+    check_format(fmt, compression)
+    mimetype, extension, _ = FORMATS[fmt]
+
+    array = np.ascontiguousarray(array)
+    headers = {}
+    if fmt == "tiff":
+        buffer = io.BytesIO()
+        tiff.imwrite(buffer, array, compression=None if compression == "none" else compression)
+        data = buffer.getvalue()
+    elif fmt == "png":
+        data = _encode_png(array, compression)
+    elif fmt == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        data = buffer.getvalue()
+    else:
+        data = array.tobytes()
+        headers["X-Array-Shape"] = ",".join(str(n) for n in array.shape)
+        headers["X-Array-Dtype"] = array.dtype.str
+
+    if fmt in ("npy", "raw") and compression == "zlib":
+        data = zlib.compress(data)
+        headers["Content-Encoding"] = "deflate"
+    return io.BytesIO(data), mimetype, extension, headers
@@ -0,0 +1,147 @@
+"""Service-wide Dask execution settings.
+
+Every ``compute()`` in the service goes through one scheduler configured
+here instead of Dask's default per-call thread pool:
+
+- ``DASK_SCHEDULER``: ``threads`` (default), ``processes``, ``synchronous``
+  or ``distributed`` (a local cluster; needs the ``distributed`` package).
+- ``DASK_WORKERS``: threads or processes of the shared batch pool
+  (default: CPU count).
+- ``DASK_INTERACTIVE_WORKERS``: a separate, smaller pool for interactive
+  reads such as /slice and /region, so they never queue behind the tasks of
+  a large computation (default: a quarter of ``DASK_WORKERS``, at least 2).
+  On a distributed cluster the two levels become task priorities instead;
+  the cluster itself is started by the first computation.
+- ``DASK_MEMORY_LIMIT``: memory limit per distributed worker, e.g. ``4GB``.
+- ``DASK_CHUNK_SIZE``: target size of automatically chunked arrays; with
+  local schedulers peak memory is roughly workers x chunk size.
+- ``HEAVY_CONCURRENCY``: how many heavy computations (statistics, PCA,
+  K-Means, ...) may run at once per process; others wait for a slot.
+
+Threads pick their pool with ``priority()``; ``heavy()`` additionally takes
+one of the heavy slots. Thread pools run each task in a copy of the
+submitting thread's context, so context variables such as the priority and
+the request's metrics trace carry over into the tasks.
+"""
+import contextvars
+import importlib.util
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import dask
+from dask import multiprocessing as dask_multiprocessing
+from dask import threaded
+
+DASK_SCHEDULER = os.environ.get("DASK_SCHEDULER", "threads")
+DASK_WORKERS = int(os.environ.get("DASK_WORKERS", os.cpu_count() or 1))
+DASK_INTERACTIVE_WORKERS = int(os.environ.get("DASK_INTERACTIVE_WORKERS", max(2, DASK_WORKERS // 4)))
+DASK_MEMORY_LIMIT = os.environ.get("DASK_MEMORY_LIMIT", "auto")
+DASK_CHUNK_SIZE = os.environ.get("DASK_CHUNK_SIZE")
+HEAVY_CONCURRENCY = int(os.environ.get("HEAVY_CONCURRENCY", 1))
+
+SCHEDULERS = ("threads", "processes", "synchronous", "distributed")
+PRIORITIES = {"interactive": 10, "batch": 0}
+
+_priority = contextvars.ContextVar("priority", default="interactive")
+_heavy_slots = threading.BoundedSemaphore(HEAVY_CONCURRENCY)
+_configure_lock = threading.Lock()
+_pools = {}
+_client = None
+_cluster_options = {}
+_configured = False
+
+
+class _ContextThreadPool(ThreadPoolExecutor):
+    """Runs each task in a copy of the submitting thread's context."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _threads_get(dsk, keys, **kwargs):
+    return threaded.get(dsk, keys, pool=_pools[_priority.get()], **kwargs)
+
+
+def _processes_get(dsk, keys, **kwargs):
+    return dask_multiprocessing.get(dsk, keys, pool=_pools[_priority.get()], **kwargs)
+
+
+def _get_client():
+    """Starts the local cluster on first use, so configuring spawns no processes."""
+    global _client
+    if _client is None:
+        with _configure_lock:
+            if _client is None:
+                from distributed import Client, LocalCluster
+                _client = Client(LocalCluster(**_cluster_options), set_as_default=False)
+    return _client
+
+
+def _distributed_get(dsk, keys, **kwargs):
+    return _get_client().get(dsk, keys, priority=PRIORITIES[_priority.get()], **kwargs)
+
+
+def configure(scheduler=DASK_SCHEDULER, workers=DASK_WORKERS,
+              interactive_workers=DASK_INTERACTIVE_WORKERS, memory_limit=DASK_MEMORY_LIMIT):
+    """Installs the shared scheduler as Dask's default; later calls are no-ops."""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        if scheduler not in SCHEDULERS:
+            raise ValueError(f"Unknown DASK_SCHEDULER '{scheduler}', expected one of {', '.join(SCHEDULERS)}")
+
+        settings = {}
+        if DASK_CHUNK_SIZE:
+            settings["array.chunk-size"] = DASK_CHUNK_SIZE
+        if scheduler == "threads":
+            _pools["batch"] = _ContextThreadPool(workers, thread_name_prefix="dask-batch")
+            _pools["interactive"] = _ContextThreadPool(interactive_workers, thread_name_prefix="dask-interactive")
+            settings["scheduler"] = _threads_get
+        elif scheduler == "processes":
+            _pools["batch"] = ProcessPoolExecutor(workers)
+            _pools["interactive"] = ProcessPoolExecutor(interactive_workers)
+            settings["scheduler"] = _processes_get
+        elif scheduler == "distributed":
+            if importlib.util.find_spec("distributed") is None:
+                raise RuntimeError("DASK_SCHEDULER=distributed requires the 'distributed' package")
+            _cluster_options.update(n_workers=workers, threads_per_worker=1, memory_limit=memory_limit)
+            settings["scheduler"] = _distributed_get
+        else:
+            settings["scheduler"] = "synchronous"
+
+        dask.config.set(settings)
+        _configured = True
+        logging.info(f"Dask scheduler: {scheduler} ({workers} batch / {interactive_workers} interactive workers)")
+
+
+@contextmanager
+def priority(level):
+    """Runs the computations of this thread (or task) on the ``level`` pool."""
+    if level not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {level}")
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def heavy():
+    """Waits for a heavy-computation slot and runs at batch priority while holding it."""
+    with _heavy_slots:
+        with priority("batch"):
+            yield
+
+
+def stats():
+    return {
+        "scheduler": DASK_SCHEDULER,
+        "workers": DASK_WORKERS,
+        "interactive_workers": DASK_INTERACTIVE_WORKERS,
+        "heavy_concurrency": HEAVY_CONCURRENCY,
+    }
@@ -0,0 +1,119 @@
+"""Chunked filter pipelines that run ahead of segmentation and PCA.
+
+A pipeline is written as comma separated ``name:value`` steps, for example
+``gaussian:1.5,median:3,background:20``, and is applied in order to every
+(X, Y) plane:
+
+- ``gaussian:sigma``: Gaussian smoothing.
+- ``median:size``: median filter over a size x size window.
+- ``opening:size`` / ``closing:size``: grey morphological opening / closing
+  with a size x size square.
+- ``background:sigma``: subtracts a Gaussian estimate of the background
+  (negative values are clipped to zero).
+
+Each step is a dask-image filter, i.e. the scipy.ndimage filter wrapped in
+``map_overlap`` with a halo just deep enough for its footprint, so the steps
+fuse into one lazy graph. Filtered images stream chunk by chunk straight
+into segmentation, PCA or ``save_image`` without an intermediate file.
+"""
+import os
+
+import dask.array as da
+import numpy as np
+
+FILTER_MAX_STEPS = int(os.environ.get("FILTER_MAX_STEPS", 8))
+# Bounds the halo, and so the memory, of a single step.
+FILTER_MAX_SIZE = 65
+FILTER_MAX_SIGMA = 16.0
+
+
+def _plane(image, value, rest):
+    """A footprint acting on X and Y only."""
+    return (value, value) + (rest,) * (image.ndim - 2)
+
+
+# dask-image (and scipy.ndimage behind it) is imported by the steps, on
+# first use, rather than when the service starts.
+def _gaussian(image, sigma):
+    from dask_image import ndfilters
+
+    return ndfilters.gaussian_filter(image, sigma=_plane(image, sigma, 0))
+
+
+def _median(image, size):
+    from dask_image import ndfilters
+
+    return ndfilters.median_filter(image, size=_plane(image, size, 1))
+
+
+def _opening(image, size):
+    from dask_image import ndfilters
+
+    size = _plane(image, size, 1)
+    return ndfilters.maximum_filter(ndfilters.minimum_filter(image, size=size), size=size)
+
+
+def _closing(image, size):
+    from dask_image import ndfilters
+
+    size = _plane(image, size, 1)
+    return ndfilters.minimum_filter(ndfilters.maximum_filter(image, size=size), size=size)
+
+
+def _background(image, sigma):
+    return da.maximum(image - _gaussian(image, sigma), 0)
+
+
+# name -> (parameter type, filter)
+FILTERS = {
+    "gaussian": (float, _gaussian),
+    "median": (int, _median),
+    "opening": (int, _opening),
+    "closing": (int, _closing),
+    "background": (float, _background),
+}
+
+
+def parse_pipeline(text):
+    """Parses ``"name:value,..."`` into a list of (name, value) steps; raises ValueError."""
+    steps = []
+    for part in filter(None, (part.strip() for part in (text or "").split(","))):
+        name, _, value = part.partition(":")
+        name = name.strip().lower()
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter '{name}'. Choose from {', '.join(FILTERS)}")
+        kind = FILTERS[name][0]
+        try:
+            value = kind(value)
+        except ValueError:
+            raise ValueError(f"Filter '{name}' needs a {kind.__name__} parameter, e.g. '{name}:3'")
+        limit = FILTER_MAX_SIGMA if kind is float else FILTER_MAX_SIZE
+        if not 0 < value <= limit:
+            raise ValueError(f"Parameter of '{name}' must be in (0, {limit}]")
+        steps.append((name, value))
+    if len(steps) > FILTER_MAX_STEPS:
+        raise ValueError(f"A pipeline has at most {FILTER_MAX_STEPS} steps")
+    return steps
+
+
+def format_pipeline(steps):
+    """The canonical text of a pipeline, used in artifact keys and job parameters."""
+    return ",".join(f"{name}:{value:g}" for name, value in steps)
+
+
+def apply_pipeline(image, steps):
+    """Runs the steps lazily over a Dask array; returns it with the input dtype.
+
+    Filters are computed in floating point; integer results are rounded and
+    clipped to the range of the dtype.
+    """
+    if not steps:
+        return image
+    dtype = image.dtype
+    filtered = image.astype(np.promote_types(dtype, np.float32))
+    for name, value in steps:
+        filtered = FILTERS[name][1](filtered, value)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        filtered = da.clip(da.round(filtered), info.min, info.max)
+    return filtered.astype(dtype)
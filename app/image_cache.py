@@ -0,0 +1,119 @@
+import os
+import threading
+from collections import OrderedDict
+
+from image_processor import ImageProcessor
+from zarr_store import store_stamp
+
+# Logical budget: the decoded size of the images whose handles are kept open.
+DEFAULT_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 16 * 1024**3))
+
+
+class ImageCache:
+    """Thread-safe LRU cache of opened ImageProcessor instances.
+
+    Entries are keyed by (absolute path, mtime, size) plus the state of the
+    file's Zarr working copy, so a file that changes on disk, or is
+    converted, is reopened on its next request. Evicted and replaced
+    entries are closed, releasing their file handles.
+
+    Eviction is driven by a logical byte budget on the decoded size of the
+    cached images. An entry itself holds only a file handle, a memory map
+    and lazy Dask graphs, so the budget bounds how much image data stays
+    one lookup away rather than the memory the cache uses.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def file_key(file_path):
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, store_stamp(file_path))
+
+    def get(self, file_path):
+        """Returns a shared ImageProcessor for the file, opening it on a miss."""
+        key = self.file_key(file_path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Open outside the lock so a slow file does not block other requests.
+        processor = ImageProcessor(file_path)
+        cost = processor.image.nbytes
+
+        with self._lock:
+            if key in self._entries:
+                existing = self._entries[key][0]
+            else:
+                existing = None
+                dropped = self._discard_path(key[0])
+                self._entries[key] = (processor, cost)
+                self.current_bytes += cost
+                while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                    _, (evicted, evicted_cost) = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted_cost
+                    self.evictions += 1
+                    dropped.append(evicted)
+        if existing is not None:
+            # Another request opened the file first; keep theirs.
+            processor.close()
+            return existing
+        # Closed outside the lock: closing waits for a page read in progress.
+        _close_all(dropped)
+        return processor
+
+    def invalidate(self, file_path):
+        """Drops every cached handle for the file, e.g. after it was overwritten."""
+        with self._lock:
+            dropped = self._discard_path(os.path.abspath(file_path))
+        _close_all(dropped)
+
+    def clear(self):
+        with self._lock:
+            dropped = [processor for processor, _ in self._entries.values()]
+            self._entries.clear()
+            self.current_bytes = 0
+        _close_all(dropped)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _discard_path(self, path):
+        """Removes the file's entries; returns their processors for closing."""
+        dropped = []
+        for key in [key for key in self._entries if key[0] == path]:
+            processor, cost = self._entries.pop(key)
+            self.current_bytes -= cost
+            dropped.append(processor)
+        return dropped
+
+
+def _close_all(processors):
+    for processor in processors:
+        processor.close()
+
+
+image_cache = ImageCache()
+
+
+def get_processor(file_path):
+    """Returns the process-wide cached ImageProcessor for ``file_path``."""
+    return image_cache.get(file_path)
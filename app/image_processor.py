@@ -1,11 +1,207 @@
+import os
+import threading
 import numpy as np
 import tifffile as tiff
-import cv2
-from sklearn.decomposition import PCA
-from skimage.filters import threshold_otsu
-from scipy import stats
+import dask
 import dask.array as da
-from sklearn.decomposition import IncrementalPCA
+from dask.array.core import normalize_chunks
+from dask.base import tokenize
+import aggregates
+import chunk_summary
+import execution
+import metrics
+from pca import CovariancePCA
+import clustering
+import filtering
+import pyramid
+import thresholding
+import zarr_store
+
+
+# Rows handed to IncrementalPCA.partial_fit at once; bounds its float64 copies.
+PCA_BATCH_ROWS = 2**20
+PCA_METHODS = ("incremental", "covariance")
+KMEANS_METHODS = ("histogram", "sample", "cv2")
+OTSU_MODES = thresholding.OTSU_MODES
+
+
+def _project_block(block, pca):
+    """Projects one (..., C) block onto the fitted components."""
+    pixels = block.reshape(-1, block.shape[-1])
+    return pca.transform(pixels).reshape(block.shape[:-1] + (pca.n_components_,))
+
+
+def save_image(image, output_path, dtype=None):
+    """Writes a (possibly lazy) array to a TIFF file chunk by chunk.
+
+    The output file is created up front and memory-mapped, so Dask arrays
+    are streamed to disk without ever being held in memory as a whole.
+    """
+    image = da.asarray(image)
+    if dtype is not None:
+        image = image.astype(dtype)
+    with metrics.stage("write"):
+        output = tiff.memmap(output_path, shape=image.shape, dtype=image.dtype)
+        da.store(image, output, lock=False)
+        output.flush()
+    del output
+    return output_path
+
+
+def _physical_size(tif, page):
+    """Pixel size from OME-XML, or from the resolution tags; None if the file has neither."""
+    if tif.is_ome:
+        image = tiff.xml2dict(tif.ome_metadata)["OME"]["Image"]
+        pixels = (image[0] if isinstance(image, list) else image)["Pixels"]
+        if "PhysicalSizeX" in pixels:
+            return {
+                "x": pixels.get("PhysicalSizeX"),
+                "y": pixels.get("PhysicalSizeY"),
+                "z": pixels.get("PhysicalSizeZ"),
+                "unit": pixels.get("PhysicalSizeXUnit", "µm"),
+            }
+    if page.resolutionunit != tiff.RESUNIT.NONE and all(page.resolution):
+        x_resolution, y_resolution = page.resolution
+        return {"x": 1 / x_resolution, "y": 1 / y_resolution, "z": None, "unit": page.resolutionunit.name.lower()}
+    return None
+
+
+def read_tiff_metadata(file_path):
+    """Describes a TIFF from its header (tags and OME-XML) without reading pixel data."""
+    with tiff.TiffFile(file_path) as tif:
+        series = tif.series[0]
+        page = series.keyframe
+        return {
+            "shape": tuple(series.shape),
+            "dtype": str(series.dtype),
+            "axes": "XYZTC",
+            "tiff_axes": series.axes,
+            "compression": page.compression.name.lower(),
+            "tile": list(page.tile) if page.is_tiled else None,
+            "rows_per_strip": None if page.is_tiled else page.rowsperstrip,
+            "physical_size": _physical_size(tif, page),
+        }
+
+
+def _as_range(index, size):
+    """Turns an index, a unit-step slice or None into a slice(start, stop) on an axis of ``size``."""
+    positions = range(size)[index if index is not None else slice(None)]
+    if isinstance(positions, int):
+        return slice(positions, positions + 1)
+    if positions.step != 1:
+        raise ValueError("Region summaries need contiguous ranges")
+    return slice(positions.start, positions.start + len(positions))
+
+
+def summarize_statistics(moments):
+    """Formats merged channel moments as the /statistics response."""
+    return {
+        f"Channel {c}": channel_stats
+        for c, channel_stats in enumerate(aggregates.summarize(moments))
+    }
+
+
+class RegionTooLarge(ValueError):
+    pass
+
+
+class TiffPageArray:
+    """Read-only array view of a TIFF series that reads pages on demand.
+
+    Uncompressed, contiguous files are served from a memory map. Anything
+    else (compressed or fragmented) is decoded page by page: the key is split
+    into the leading (page) axes and the trailing in-page axes, and only the
+    pages selected by the leading part are read from disk.
+
+    Pickling keeps only the file path and series, so the array can travel to
+    the worker processes of the ``processes`` and ``distributed``
+    schedulers; the unpickled copy reopens the file and owns it. Likewise,
+    a read after ``close()`` reopens the file, so closing never breaks a
+    computation that is still running.
+    """
+
+    def __init__(self, tif, series=0):
+        self._tif = tif
+        self._path = tif.filehandle.path
+        self._series = series
+        self._owns_file = False
+        self._lock = threading.Lock()
+        page_series = tif.series[series]
+        self.shape = tuple(page_series.shape)
+        self.dtype = page_series.dtype
+        self.ndim = len(self.shape)
+        self.page_shape = tuple(page_series.keyframe.shape)
+        self._lead_shape = self.shape[: self.ndim - len(self.page_shape)]
+        self._memmap = self._map(tif)
+
+    def _map(self, tif):
+        page_series = tif.series[self._series]
+        if page_series.dataoffset is None:
+            return None
+        return np.memmap(
+            self._path,
+            dtype=np.dtype(tif.byteorder + self.dtype.char),
+            mode="r",
+            offset=page_series.dataoffset,
+            shape=self.shape,
+        )
+
+    def _open(self):
+        """The TiffFile and memory map, reopened after ``close()``; needs the lock."""
+        if self._tif.filehandle.closed:
+            self._tif = tiff.TiffFile(self._path)
+            self._owns_file = True
+            self._memmap = self._map(self._tif)
+        return self._tif, self._memmap
+
+    def close(self):
+        """Closes the file handle and drops the memory map (views already handed out stay valid)."""
+        with self._lock:
+            self._tif.close()
+            self._memmap = None
+
+    def __getstate__(self):
+        return {"path": self._path, "series": self._series}
+
+    def __setstate__(self, state):
+        self.__init__(tiff.TiffFile(state["path"]), state["series"])
+        self._owns_file = True
+
+    def __del__(self):
+        if getattr(self, "_owns_file", False):
+            self._tif.close()
+
+    def __getitem__(self, key):
+        with self._lock:
+            _, memmap = self._open()
+        if memmap is not None:
+            view = memmap[key]
+            metrics.record_bytes_read(view.nbytes, "tiff")
+            return view
+
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+        lead_key, page_key = key[: len(self._lead_shape)], key[len(self._lead_shape):]
+
+        grids = [np.arange(n)[k] for n, k in zip(self._lead_shape, lead_key)]
+        grid_shape = tuple(np.size(g) for g in grids)
+        if 0 in grid_shape:
+            pages = np.empty(grid_shape + self.page_shape, dtype=self.dtype)
+        else:
+            indices = np.ravel_multi_index(
+                np.meshgrid(*[np.atleast_1d(g) for g in grids], indexing="ij"),
+                self._lead_shape,
+            )
+            # TiffFile is not safe for concurrent reads from several threads.
+            with metrics.stage("read"), self._lock:
+                pages = self._open()[0].asarray(key=indices.ravel().tolist(), series=self._series)
+            pages = pages.reshape(grid_shape + self.page_shape)
+            metrics.record_bytes_read(pages.nbytes, "tiff")
+
+        # Integer indices on the leading axes drop those dimensions, as in numpy.
+        squeeze = tuple(i for i, k in enumerate(lead_key) if np.ndim(k) == 0 and not isinstance(k, slice))
+        return pages[(slice(None),) * len(grid_shape) + page_key].squeeze(axis=squeeze)
 
 
 class ImageProcessor:
@@ -15,93 +211,332 @@ class ImageProcessor:
         # if self.image.ndim != 5:
         #     raise ValueError("Input image should have 5 dimensions (t, z, c, x, y).")
         self.file_path = image_path
-        self.image = self.load_large_image(image_path)
+        self._pages = None
+        # Library use gets the shared scheduler too, whose pools carry the
+        # caller's metrics trace into Dask's worker threads.
+        execution.configure()
+        # Prefer the rechunked Zarr working copy when ingestion produced one:
+        # "planes" serves slicing and per-channel work, "channels" the
+        # reductions over all channels of a pixel.
+        with metrics.stage("open"):
+            layouts = zarr_store.open_store(image_path)
+            self.image = layouts["planes"] if "planes" in layouts else self.load_large_image(image_path)
+        self.channel_image = layouts.get("channels", self.image)
+        self._pyramid = None
+        self._pyramid_stamp = None
     
+    def close(self):
+        """Releases the TIFF file handle and memory map; reads still in flight reopen them."""
+        if self._pages is not None:
+            self._pages.close()
+
     def get_metadata(self):
-         return {
-            "shape": self.image.shape,
-            "dtype": str(self.image.dtype),
-            "min": float(self.image.min()),
-            "max": float(self.image.max()),
-        }
+        """Describes the image without reading pixels.
+
+        Shape, dtype, compression, tiling and physical size come from the
+        TIFF header; min and max from the chunk summary built at ingest, or
+        None until it exists.
+        """
+        with metrics.stage("open"):
+            if self.file_path is None:
+                metadata = {"shape": self.image.shape, "dtype": str(self.image.dtype)}
+                summary = None
+            else:
+                metadata = read_tiff_metadata(self.file_path)
+                summary = chunk_summary.load_summary(self.file_path)
+        channels = chunk_summary.to_dict(summary.total()) if summary is not None else []
+        lows = [channel["min"] for channel in channels if channel["count"]]
+        highs = [channel["max"] for channel in channels if channel["count"]]
+        metadata["min"] = min(lows) if lows else None
+        metadata["max"] = max(highs) if highs else None
+        return metadata
+
+    def region_summary(self, x=None, y=None, z=None, time=None):
+        """Per-channel min, max, mean and count of a region (indices or unit-step slices).
+
+        Chunks lying fully inside the region are taken from the chunk
+        summary; only the chunks the region cuts through are read. Without a
+        summary the whole region is read.
+        """
+        key = tuple(_as_range(index, n) for index, n in zip((x, y, z, time), self.image.shape[:-1]))
+        summary = chunk_summary.load_summary(self.file_path) if self.file_path else None
+        if summary is None:
+            covered = chunk_summary.empty(self.image.shape[-1])
+            pieces = [key]
+        else:
+            covered, pieces = summary.region(key)
+
+        image = self.channel_image.rechunk({self.image.ndim - 1: -1})
+        reads = [
+            aggregates.reduce_blocks(image[piece], chunk_summary.block_summary, merge=chunk_summary.merge_pair)
+            for piece in pieces
+        ]
+        with metrics.stage("compute"):
+            parts = dask.compute(*reads)
+        return chunk_summary.to_dict(chunk_summary.merge(np.stack([covered, *parts])))
     
     def load_large_image(self, file_path):
-        """Loads a large TIFF image in chunks using Dask."""
-        return da.from_array(tiff.imread(file_path), chunks="auto") 
+        """Lazily opens a TIFF image as a Dask array without reading pixel data.
+
+        The Dask chunks are whole multiples of the TIFF page shape, so a
+        computation only reads the pages it actually touches.
+        """
+        self._tiff = tiff.TiffFile(file_path)
+        pages = self._pages = TiffPageArray(self._tiff)
+        storage_chunks = (1,) * (pages.ndim - len(pages.page_shape)) + pages.page_shape
+        chunks = normalize_chunks(
+            "auto", pages.shape, dtype=pages.dtype, previous_chunks=storage_chunks
+        )
+
+        # Name the array after the file's identity: letting Dask tokenize the
+        # data itself would hash every pixel. asarray=False keeps memory-mapped
+        # chunks as views, so slicing copies only the selected pixels.
+        stat = os.stat(file_path)
+        name = "tiff-" + tokenize(os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        return da.from_array(pages, chunks=chunks, name=name, asarray=False)
     
     
-    def extract_slice(self, z=None, time=None, channel=None):
+    def extract_slice(self, z=None, time=None, channel=None, level=0):
         """Extracts a specific slice without loading the entire image into memory."""
-        indices = [slice(None)] * 5  
+        return self.extract_region(z=z, time=time, channel=channel, level=level)
 
-        if z is not None:
-            indices[2] = z  
-        if time is not None:
-            indices[3] = time  
-        if channel is not None:
-            indices[4] = channel  
+    def pyramid_levels(self):
+        """Returns [full resolution, level 1, level 2, ...]; only level 0 without a pyramid.
 
-        return self.image[tuple(indices)].compute()  
-    
-    def apply_pca(self, num_components=3):
-        """Applies PCA using Dask's incremental processing to handle large images."""
-        X, Y, Z, T, C = self.image.shape
-        reshaped = self.image.reshape(-1, C)  
+        The pyramid is reopened whenever it is rebuilt on disk.
+        """
+        try:
+            stat = os.stat(pyramid.pyramid_path(self.file_path))
+            stamp = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            stamp = None
+        if self._pyramid is None or stamp != self._pyramid_stamp:
+            self._pyramid = pyramid.open_pyramid(self.file_path) if stamp else []
+            self._pyramid_stamp = stamp
+        return [self.image] + self._pyramid
+
+    def choose_level(self, max_size, x=None, y=None):
+        """Returns the coarsest pyramid level whose X/Y region still spans ``max_size`` pixels."""
+        extents = [
+            n if index is None else len(range(n)[index]) if isinstance(index, slice) else 1
+            for n, index in zip(self.image.shape[:2], (x, y))
+        ]
+        return pyramid.choose_level(extents, max_size, len(self.pyramid_levels()))
+
+    def extract_region(self, x=None, y=None, z=None, time=None, channel=None, max_bytes=None, level=0):
+        """Reads a sub-volume; each axis takes an index, a slice (with step) or None.
+
+        Dask fuses the selection into the chunk reads, so only the TIFF pages
+        (or memory-mapped bytes) inside the region are read, and strided
+        reads skip the pages in between. X/Y are given in full-resolution
+        coordinates and mapped onto pyramid ``level``. Raises RegionTooLarge
+        if the result would exceed ``max_bytes``.
+        """
+        region = self.select_region(x, y, z, time, channel, max_bytes=max_bytes, level=level)
+        with metrics.stage("compute"):
+            return region.compute()
+
+    def select_region(self, x=None, y=None, z=None, time=None, channel=None, max_bytes=None, level=0):
+        """Like ``extract_region``, but returns the lazy Dask array."""
+        image = self.pyramid_levels()[level]
+        x, y = (pyramid.scale_index(index, 2 ** level) for index in (x, y))
+        key = tuple(slice(None) if index is None else index for index in (x, y, z, time, channel))
+        region = image[key]
+        if max_bytes is not None and region.nbytes > max_bytes:
+            raise RegionTooLarge(
+                f"Region of shape {region.shape} is {region.nbytes} bytes, the limit is {max_bytes}"
+            )
+        return region
+
+    def filter_image(self, filters):
+        """Runs a filter pipeline such as ``"gaussian:2,median:3"`` over the image, lazily.
+
+        See ``filtering`` for the available steps; the result keeps the
+        image's shape and dtype.
+        """
+        return filtering.apply_pipeline(self.image, filtering.parse_pipeline(filters))
+
+    def apply_pca(self, num_components=3, method="incremental", filters=None):
+        """Applies PCA in two streaming passes and returns the components lazily.
 
-      
-        reshaped = da.nan_to_num(reshaped)
+        The first pass fits the estimator (see ``fit_pca``); the second is a
+        chunk-wise projection, so neither pass holds more than a few chunks
+        in memory. Use ``save_image`` to write the result without
+        materializing it. ``filters`` is an optional pipeline applied first.
+        """
+        image = self._pixel_image(filters)
+        pca = self.fit_pca(num_components, image, method)
+        return image.map_blocks(
+            _project_block,
+            pca,
+            dtype=np.float64,
+            chunks=image.chunks[:-1] + ((num_components,),),
+        )
+
+    def fit_pca(self, num_components=3, image=None, method="incremental"):
+        """Fits a PCA estimator over all pixels.
+
+        ``method="incremental"`` feeds sklearn's IncrementalPCA one chunk at a
+        time; ``method="covariance"`` computes an exact PCA from the channel
+        covariance matrix in one parallel pass, which is much faster when the
+        number of channels is small.
+        """
+        if method not in PCA_METHODS:
+            raise ValueError(f"Unknown PCA method: {method}. Choose one of {', '.join(PCA_METHODS)}")
+        image = self._pixel_image() if image is None else image
+        if method == "covariance":
+            with metrics.stage("compute"):
+                return CovariancePCA(num_components).fit(image)
+
+        # Imported on first use: scikit-learn dominates the service's import time.
+        from sklearn.decomposition import IncrementalPCA
 
-       
         pca = IncrementalPCA(n_components=num_components)
 
-        def pca_fit(chunk):
-            """Function to apply Incremental PCA to each chunk."""
-            pca.partial_fit(chunk)
-            return chunk
+        # partial_fit needs at least n_components rows per call, so the tail of
+        # each chunk (the last full batch plus any remainder) is carried over
+        # and fitted together with the next chunk, or at the very end.
+        carry = None
+        for block in image.to_delayed().ravel():
+            with metrics.stage("compute"):
+                pixels = block.compute().reshape(-1, image.shape[-1])
+            if carry is not None:
+                pixels = np.concatenate([carry, pixels])
+            held_back = max(0, (len(pixels) // PCA_BATCH_ROWS - 1) * PCA_BATCH_ROWS)
+            for start in range(0, held_back, PCA_BATCH_ROWS):
+                pca.partial_fit(pixels[start:start + PCA_BATCH_ROWS])
+            carry = pixels[held_back:]
+        pca.partial_fit(carry)
+        return pca
 
-        
-        reshaped = reshaped.map_blocks(pca_fit, dtype=reshaped.dtype)
+    def _pixel_image(self, filters=None, channels=None):
+        """The image with NaNs zeroed, filtered, and all channels of a pixel in one chunk.
 
-        reduced = pca.transform(reshaped.compute())  
-        return reduced.reshape(X, Y, Z, T, num_components)
+        ``channels`` optionally selects a list of channels. Chunks are split
+        along the first axis so that their float64 versions stay about as
+        large as the stored chunks.
+        """
+        image = self.channel_image if channels is None else self.channel_image[..., channels]
+        image = filtering.apply_pipeline(da.nan_to_num(image), filtering.parse_pipeline(filters))
+        image = image.rechunk({self.image.ndim - 1: -1})
+        parts = max(1, np.dtype(np.float64).itemsize // image.dtype.itemsize)
+        rows = tuple(
+            size // parts + (i < size % parts)
+            for size in image.chunks[0]
+            for i in range(min(parts, size))
+        )
+        return image.rechunk({0: rows})
     
     def compute_statistics(self):
-        """Computes mean, standard deviation, min, and max per band using Dask's lazy computation."""
+        """Computes mean, standard deviation, min, and max per band in a single pass.
+
+        Each chunk is reduced to mergeable per-channel moments, so the image
+        is read once no matter how many channels it has.
+        """
+        with metrics.stage("compute"):
+            moments = self.statistics_moments().compute()
+        return summarize_statistics(moments)
+
+    def statistics_moments(self):
+        """The lazy per-channel moments behind ``compute_statistics``."""
         if self.image is None:
             raise ValueError("Loaded image is None!")
 
-        stats_per_channel = {}
-        for c in range(self.image.shape[-1]):
-            channel_data = self.image[:, :, :, :, c]  
+        image = self.channel_image.rechunk({self.image.ndim - 1: -1})
+        return aggregates.reduce_blocks(image, aggregates.channel_moments)
 
-            stats_per_channel[f"Channel {c}"] = {
-                "mean": float(channel_data.mean().compute()),  
-                "std": float(channel_data.std().compute()),
-                "min": float(channel_data.min().compute()),
-                "max": float(channel_data.max().compute()),
-            }
+    
+    def apply_otsu_segmentation(self, channel=0, classes=2, mode="global", filters=None):
+        """Segments a channel into ``classes`` classes with (multi-)Otsu thresholds.
 
-        return stats_per_channel
+        The thresholds come from histograms accumulated in one parallel pass,
+        for the whole channel (``mode="global"``) or per (z, time) plane
+        (``mode="plane"``); the (X, Y, Z, T) labels are returned lazily, so
+        ``save_image`` writes them chunk by chunk. ``filters`` is an optional
+        pipeline applied to the channel first.
+        """
+        channel_img = self._channel(channel, filters)
+        with metrics.stage("compute"):
+            thresholds = thresholding.fit_thresholds(channel_img, classes, mode)
+        return thresholding.apply_thresholds(channel_img, thresholds)
 
-    
-    def apply_kmeans_segmentation(self, channel=0, k=3):
-        """Applies K-Means clustering for segmentation on a single channel."""
-        channel_img = self.image[:, :, :, :, channel] 
-
-        flattened = channel_img.reshape(-1, 1)
-
-        _, labels, _ = cv2.kmeans(
-            np.float32(flattened),
-            k,
-            None,
-            (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2),
-            10,
-            cv2.KMEANS_RANDOM_CENTERS,
-        )
+    def _channel(self, channel, filters=None):
+        """One channel, (X, Y, Z, T), run through an optional filter pipeline."""
+        count = self.image.shape[-1]
+        if not 0 <= channel < count:
+            raise ValueError(f"channel must be between 0 and {count - 1}")
+        return filtering.apply_pipeline(self.image[:, :, :, :, channel], filtering.parse_pipeline(filters))
+
+    def apply_kmeans_segmentation(self, channel=0, k=3, method="histogram", filters=None, channels=None, components=None):
+        """Applies K-Means clustering for segmentation; returns (X, Y, Z, T) labels.
+
+        ``method="histogram"`` clusters the intensity of a single channel on
+        its histogram (exact for 8/16 bit data), with labels ordered by
+        intensity. ``method="sample"`` clusters feature vectors: the
+        ``channels`` given (a list of indices or ``"all"``, by default just
+        ``channel``), projected onto their first ``components`` principal
+        components if set. Centers are fitted on a bounded random sample and
+        labels ordered by the mean of their center's features. Both label the
+        volume lazily, chunk by chunk. ``method="cv2"`` is the original
+        in-memory ``cv2.kmeans`` reference implementation. ``filters`` is an
+        optional pipeline applied to the channels first.
+        """
+        if method not in KMEANS_METHODS:
+            raise ValueError(f"Unknown K-Means method: {method}. Choose one of {', '.join(KMEANS_METHODS)}")
+        clustering.check_clusters(k)
+
+        if method == "histogram":
+            if channels is not None or components is not None:
+                raise ValueError("The histogram method clusters a single channel; use method=sample for channels or components")
+            channel_img = self._channel(channel, filters)
+            with metrics.stage("compute"):
+                centers = clustering.fit_centers(channel_img, k)
+            return channel_img.map_blocks(
+                clustering.assign_labels,
+                centers,
+                dtype=np.min_scalar_type(k - 1),
+            )
+
+        features = self._feature_image([channel] if channels is None else channels, components, filters)
+
+        if method == "sample":
+            with metrics.stage("compute"):
+                centers = clustering.fit_feature_centers(features, k)
+            return clustering.assign_feature_labels(features, centers)
+
+        import cv2
 
-        segmented = labels.reshape(channel_img.shape)
+        flattened = features.reshape(-1, features.shape[-1])
 
-        return segmented[..., 0] 
+        with metrics.stage("compute"):
+            _, labels, _ = cv2.kmeans(
+                np.float32(flattened),
+                k,
+                None,
+                (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2),
+                10,
+                cv2.KMEANS_RANDOM_CENTERS,
+            )
 
+        return labels.reshape(features.shape[:-1])
 
+    def _feature_image(self, channels, components=None, filters=None):
+        """(X, Y, Z, T, F) feature vectors: the given channels, optionally PCA-reduced.
 
+        The projection uses the exact covariance PCA of the selected
+        channels, fitted in one extra pass.
+        """
+        count = self.channel_image.shape[-1]
+        channels = list(range(count)) if channels == "all" else [int(c) for c in channels]
+        if not channels or not all(0 <= c < count for c in channels):
+            raise ValueError(f"channels must be indices between 0 and {count - 1}, or 'all'")
+        image = self._pixel_image(filters, channels)
+        if components is None:
+            return image
+        pca = self.fit_pca(components, image, method="covariance")
+        return image.map_blocks(
+            _project_block,
+            pca,
+            dtype=np.float64,
+            chunks=image.chunks[:-1] + ((components,),),
+        ) 
@@ -0,0 +1,296 @@
+"""Background job queue for long-running operations.
+
+Jobs run on a bounded pool of worker processes. Their state lives in the
+``jobs`` table, so status survives restarts. Identical submissions (same
+operation, parameters and input file) share one in-flight job; a unique
+index on the active jobs' keys enforces this across server processes.
+
+Each queued or running job is leased by the process that runs it, which
+renews the lease from a heartbeat thread. ``JobManager.start()``, the
+startup hook of a serving process, requeues jobs whose lease expired, i.e.
+whose process stopped, and keeps doing so while the process runs. Jobs of
+live sibling processes (e.g. other workers of a pre-fork server) are left
+alone.
+"""
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from dask.callbacks import Callback
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from analysis_cache import versioned_key
+from database import session_scope, Job
+from execution import configure
+from operations import OPERATIONS
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# Seconds a job's claim holds without a heartbeat; heartbeats (and the
+# search for expired jobs) run three times per lease.
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+ACTIVE_STATUSES = ("queued", "running")
+# Minimum seconds between progress writes (and cancellation checks) per job.
+PROGRESS_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobProgress(Callback):
+    """Dask callback that records finished tasks on the job row and stops on cancel.
+
+    Every ``compute`` inside the job adds its tasks to the total, so the
+    ratio tracks how much of the work graph Dask has finished so far.
+    """
+
+    def __init__(self, job_id):
+        super().__init__()
+        self.job_id = job_id
+        self.done = 0
+        self.total = 0
+        self._last_update = 0.0
+
+    def _start(self, dsk):
+        self.total += len(dsk)
+        self._update(force=True)
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        self.done += 1
+        self._update()
+
+    def _update(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_update < PROGRESS_INTERVAL:
+            return
+        self._last_update = now
+        with session_scope() as db:
+            job = db.get(Job, self.job_id)
+            job.progress_done = self.done
+            job.progress_total = self.total
+            cancel = job.cancel_requested
+            db.commit()
+        if cancel:
+            raise JobCancelled()
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _set_status(job_id, **fields):
+    with session_scope() as db:
+        job = db.get(Job, job_id)
+        for name, value in fields.items():
+            setattr(job, name, value)
+        if job.status not in ACTIVE_STATUSES:
+            # Frees the key for new submissions.
+            job.active_key = None
+            job.lease_expires = None
+        db.commit()
+
+
+def _run_job(job_id, operation, parameters):
+    """Entry point executed in a worker process."""
+    configure()
+    with session_scope() as db:
+        job = db.get(Job, job_id)
+        skip = job is None or job.cancel_requested
+    if skip:
+        if job is not None:
+            _set_status(job_id, status="cancelled")
+        return
+
+    _set_status(job_id, status="running")
+    try:
+        with JobProgress(job_id) as progress:
+            result_path = OPERATIONS[operation](**parameters)
+        _set_status(
+            job_id,
+            status="completed",
+            result_path=result_path,
+            progress_done=progress.total,
+            progress_total=progress.total,
+        )
+    except JobCancelled:
+        _set_status(job_id, status="cancelled")
+    except Exception as e:
+        logging.exception(f"Job {job_id} ({operation}) failed")
+        _set_status(job_id, status="failed", error=str(e))
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "operation": job.operation,
+        "parameters": job.parameters,
+        "status": job.status,
+        "progress": {"done": job.progress_done, "total": job.progress_total},
+        "result_path": job.result_path,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+
+class JobManager:
+    """Submits jobs to a process pool and tracks them in the database."""
+
+    def __init__(self, max_workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS):
+        self.max_workers = max_workers
+        self.lease_seconds = lease_seconds
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._recover = False
+
+    def _pool(self):
+        if self._executor is None:
+            # Spawned workers start with a fresh SQLite engine and Dask state.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def submit(self, operation, parameters):
+        """Queues an operation, or returns the identical job already in flight."""
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+
+        key = versioned_key(parameters["file_path"], operation, parameters)
+
+        for _ in range(3):
+            with session_scope() as db:
+                job = db.query(Job).filter(Job.active_key == key).first()
+                if job is not None:
+                    logging.info(f"Deduplicated {operation} submission onto job {job.id}")
+                    return job_to_dict(job)
+                job = Job(
+                    id=uuid.uuid4().hex,
+                    operation=operation,
+                    parameters=parameters,
+                    dedupe_key=key,
+                    active_key=key,
+                    status="queued",
+                    owner=_owner(),
+                    lease_expires=time.time() + self.lease_seconds,
+                )
+                db.add(job)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Another process queued the same job in the meantime; use theirs.
+                    db.rollback()
+                    continue
+                self._enqueue(job.id, operation, parameters)
+                return job_to_dict(job)
+        raise RuntimeError(f"Could not queue {operation} for {parameters['file_path']}")
+
+    def get(self, job_id):
+        with session_scope() as db:
+            job = db.get(Job, job_id)
+            return job_to_dict(job) if job is not None else None
+
+    def cancel(self, job_id):
+        """Cancels a queued job outright, or asks a running job to stop."""
+        with session_scope() as db:
+            job = db.get(Job, job_id)
+            if job is None:
+                return None
+            if job.status in ACTIVE_STATUSES:
+                job.cancel_requested = True
+                future = self._futures.get(job_id)
+                if future is not None and future.cancel():
+                    job.status = "cancelled"
+                    job.active_key = None
+                    job.lease_expires = None
+                db.commit()
+            return job_to_dict(job)
+
+    def start(self):
+        """Startup hook of a serving process: requeues jobs of stopped processes, now and periodically."""
+        self._recover = True
+        self.resume_pending()
+        self._start_heartbeat()
+
+    def resume_pending(self):
+        """Claims and requeues the active jobs whose lease has expired; returns their ids."""
+        with session_scope() as db:
+            now = time.time()
+            expired = or_(Job.lease_expires.is_(None), Job.lease_expires < now)
+            candidates = db.query(Job).filter(Job.status.in_(ACTIVE_STATUSES), expired).all()
+            claimed = []
+            for job in candidates:
+                # The lease condition is checked again by the UPDATE itself, so
+                # only one process wins a job that several see expire.
+                try:
+                    won = (
+                        db.query(Job)
+                        .filter(Job.id == job.id, Job.status.in_(ACTIVE_STATUSES), expired)
+                        .update(
+                            {
+                                "status": "queued",
+                                "active_key": job.dedupe_key,
+                                "owner": _owner(),
+                                "lease_expires": now + self.lease_seconds,
+                            },
+                            synchronize_session=False,
+                        )
+                    )
+                    db.commit()
+                except IntegrityError:
+                    # An identical job was submitted since; it supersedes this one.
+                    db.rollback()
+                    _set_status(job.id, status="cancelled", error="Superseded by an identical job")
+                    continue
+                if won:
+                    logging.info(f"Resuming job {job.id} ({job.operation})")
+                    claimed.append((job.id, job.operation, job.parameters))
+        for job_id, operation, parameters in claimed:
+            self._enqueue(job_id, operation, parameters)
+        return [job_id for job_id, _, _ in claimed]
+
+    def renew_leases(self):
+        """Extends the leases of the jobs this process has queued or is running."""
+        job_ids = list(self._futures)
+        if not job_ids:
+            return
+        with session_scope() as db:
+            db.query(Job).filter(
+                Job.id.in_(job_ids), Job.owner == _owner(), Job.status.in_(ACTIVE_STATUSES)
+            ).update({"lease_expires": time.time() + self.lease_seconds}, synchronize_session=False)
+            db.commit()
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is not None and self._heartbeat.is_alive():
+                return
+            self._heartbeat = threading.Thread(target=self._maintain, name="job-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _maintain(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                self.renew_leases()
+                if self._recover:
+                    self.resume_pending()
+            except Exception:
+                logging.exception("Job heartbeat failed")
+
+    def _enqueue(self, job_id, operation, parameters):
+        self._start_heartbeat()
+        future = self._pool().submit(_run_job, job_id, operation, parameters)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._futures.pop(job_id, None))
+
+
+job_manager = JobManager()
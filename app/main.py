@@ -1,29 +1,91 @@
-from flask import Flask
+import os
+from flask import Flask, request
 from flask_restful import Api
-from routes.upload import UploadImage
+from routes.upload import UploadImage, ResumableUploads, ResumableUpload
 from routes.metadata import ImageMetadata
 from routes.slice import SliceImage
+from routes.region import ImageRegion
+from routes.batch import BatchRequest
 from routes.analyze import AnalyzeImage
-from routes.statistics import ImageStatistics
-from routes.segmentation import KMeansSegmentation
+from routes.statistics import ImageStatistics, RegionStatistics, TimeSeriesStatistics
+from routes.segmentation import KMeansSegmentation, OtsuSegmentation
+from routes.filter import FilterImage
+from routes.jobs import JobStatus
+from routes.artifacts import ArtifactMetrics
+from routes.metrics import PrometheusMetrics
+from jobs import job_manager
+from execution import configure
+import metrics
 from flasgger import Swagger
 
-app = Flask(__name__)
-api = Api(app)
+# Send X-Timing on every response, not only when the request asks for it.
+TIMING_HEADER = os.environ.get("TIMING_HEADER", "false").lower() == "true"
 
-app.config['SWAGGER'] = {
-    'title': 'Image Processing API',
-    'uiversion': 3
-}
-swagger = Swagger(app)
 
-# API routes
-api.add_resource(UploadImage, "/upload")
-api.add_resource(ImageMetadata, "/metadata")
-api.add_resource(SliceImage, "/slice")
-api.add_resource(AnalyzeImage, "/analyze")
-api.add_resource(ImageStatistics, "/statistics")
-api.add_resource(KMeansSegmentation, "/segment/kmeans")
+def start_trace():
+    metrics.start_trace()
+
+
+def record_request(response):
+    trace = metrics.current_trace()
+    if trace is None:
+        return response
+    trace.sample_memory(force=True)
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUEST_SECONDS.labels(endpoint, request.method, response.status_code).observe(trace.elapsed())
+    metrics.REQUEST_PEAK_MEMORY.labels(endpoint).observe(trace.peak_rss)
+    if TIMING_HEADER or "X-Timing" in request.headers:
+        response.headers["X-Timing"] = trace.header()
+    return response
+
+
+def create_app():
+    """Builds the Flask application.
+
+    Analysis libraries (scikit-learn, scikit-image, OpenCV, dask-image) are
+    imported by the operations that use them, so importing this module and
+    building the app loads only what metadata and slicing need. Nothing here
+    starts threads or processes: the workers of the Dask pools (or the
+    distributed cluster) and the job workers are started on first use, so
+    the app can be built once in a pre-fork server's master (e.g. ``gunicorn --preload "main:create_app()"``).
+    """
+    configure()
+    app = Flask(__name__)
+    api = Api(app)
+
+    app.config['SWAGGER'] = {
+        'title': 'Image Processing API',
+        'uiversion': 3
+    }
+    Swagger(app)
+
+    app.before_request(start_trace)
+    app.after_request(record_request)
+
+    # API routes
+    api.add_resource(UploadImage, "/upload")
+    api.add_resource(ResumableUploads, "/uploads")
+    api.add_resource(ResumableUpload, "/uploads/<string:upload_id>")
+    api.add_resource(ImageMetadata, "/metadata")
+    api.add_resource(SliceImage, "/slice")
+    api.add_resource(ImageRegion, "/region")
+    api.add_resource(BatchRequest, "/batch")
+    api.add_resource(AnalyzeImage, "/analyze")
+    api.add_resource(ImageStatistics, "/statistics")
+    api.add_resource(TimeSeriesStatistics, "/statistics/timeseries")
+    api.add_resource(RegionStatistics, "/statistics/region")
+    api.add_resource(KMeansSegmentation, "/segment/kmeans")
+    api.add_resource(OtsuSegmentation, "/segment/otsu")
+    api.add_resource(FilterImage, "/filter")
+    api.add_resource(JobStatus, "/jobs/<string:job_id>")
+    api.add_resource(ArtifactMetrics, "/artifacts/metrics")
+    api.add_resource(PrometheusMetrics, "/metrics")
+    return app
+
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    # With the reloader on, only the child process that serves requests
+    # should pick up jobs interrupted by the last shutdown.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        job_manager.start()
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""Performance instrumentation, exported in Prometheus format on /metrics.
+
+Code is timed in named stages with ``stage()``:
+
+- ``open``: opening an image (TIFF header, Zarr working copy)
+- ``read``: reading and decoding chunks (per chunk, so it overlaps ``compute``)
+- ``compute``: Dask computations, including the reads they trigger
+- ``write``: streaming results to output files
+- ``encode``: encoding arrays for a response
+- ``db``: database writes
+- ``response``: building the HTTP response
+
+Stages and the other counters (bytes read from image storage, Dask tasks)
+are always recorded in the process-wide Prometheus metrics. While a
+``trace()`` is active they are also added to that trace, so a request, or a
+caller using ``ImageProcessor`` directly, can see where its own time went.
+The trace is a context variable; it follows the work into Dask's worker
+threads because the shared pools copy the caller's context (see
+``execution``). Peak memory is the highest process RSS sampled while the
+trace was active.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import psutil
+from dask.callbacks import Callback
+from prometheus_client import Counter, Histogram
+
+STAGES = ("open", "read", "compute", "write", "encode", "db", "response")
+# Minimum seconds between two RSS samples of one trace.
+MEMORY_SAMPLE_INTERVAL = 0.01
+
+STAGE_SECONDS = Histogram(
+    "image_api_stage_seconds", "Time spent per processing stage", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+REQUEST_SECONDS = Histogram(
+    "image_api_request_seconds", "HTTP request latency", ["endpoint", "method", "status"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+REQUEST_PEAK_MEMORY = Histogram(
+    "image_api_request_peak_memory_bytes", "Peak process RSS while a request ran", ["endpoint"],
+    buckets=tuple(2**n * 1024**2 for n in range(6, 16)),
+)
+BYTES_READ = Counter("image_api_bytes_read", "Pixel bytes read from image storage", ["source"])
+DASK_TASKS = Counter("image_api_dask_tasks", "Dask tasks scheduled")
+
+_process = psutil.Process()
+_current = ContextVar("trace", default=None)
+
+
+class Trace:
+    """Per-request totals: seconds per stage, bytes read, Dask tasks and peak RSS."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.bytes_read = 0
+        self.tasks = 0
+        self.peak_rss = 0
+        self._last_sample = 0.0
+        self._lock = threading.Lock()
+        self.sample_memory(force=True)
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add(self, bytes_read=0, tasks=0):
+        with self._lock:
+            self.bytes_read += bytes_read
+            self.tasks += tasks
+
+    def sample_memory(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_sample < MEMORY_SAMPLE_INTERVAL:
+            return
+        self._last_sample = now
+        rss = _process.memory_info().rss
+        with self._lock:
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        """Formats the trace as an X-Timing header value (durations in ms)."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        parts += [f"bytes_read={self.bytes_read}", f"tasks={self.tasks}", f"peak_rss={self.peak_rss}"]
+        return ", ".join(parts)
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def trace():
+    """Collects the stages and counters of the enclosed code into a new Trace."""
+    current = Trace()
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        current.sample_memory(force=True)
+        _current.reset(token)
+
+
+def start_trace():
+    """Starts a trace for the rest of the current context (e.g. one request thread)."""
+    current = Trace()
+    _current.set(current)
+    return current
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed code as stage ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.labels(name).observe(seconds)
+        current = _current.get()
+        if current is not None:
+            current.add_stage(name, seconds)
+            current.sample_memory()
+
+
+def record_bytes_read(nbytes, source):
+    BYTES_READ.labels(source).inc(nbytes)
+    current = _current.get()
+    if current is not None:
+        current.add(bytes_read=nbytes)
+
+
+class _TaskCounter(Callback):
+    """Counts scheduled Dask tasks and samples memory as tasks finish.
+
+    Local schedulers run these hooks in the thread that called compute(),
+    so the caller's trace is the current one.
+    """
+
+    def _start(self, dsk):
+        DASK_TASKS.inc(len(dsk))
+        current = _current.get()
+        if current is not None:
+            current.add(tasks=len(dsk))
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        current = _current.get()
+        if current is not None:
+            current.sample_memory()
+
+
+_TaskCounter().register()
@@ -0,0 +1,118 @@
+"""Long-running operations shared by the synchronous routes and the job queue.
+
+Each operation takes JSON-serializable parameters, writes its result to disk
+and returns the output path, so it can run in a worker process as well as in
+the request thread.
+"""
+import numpy as np
+from execution import heavy
+from analysis_cache import analysis_writer
+from artifacts import artifact_store
+from chunk_summary import build_summary
+from timeseries import update_frames
+from image_cache import get_processor
+from image_processor import save_image
+from pyramid import build_pyramid
+from zarr_store import ZARR_COMPRESSION, convert_to_zarr
+
+
+def _with_filters(parameters, filters):
+    """Adds a filter pipeline to artifact parameters; unfiltered keys stay unchanged."""
+    return {**parameters, "filters": filters} if filters else parameters
+
+
+def run_pca(file_path, components=3, method="incremental", filters=None):
+    parameters = _with_filters({"components": components, "method": method}, filters)
+
+    def produce(output_path):
+        processor = get_processor(file_path)
+        with heavy():
+            reduced_image = processor.apply_pca(components, method=method, filters=filters)
+            # NaNs are zeroed before fitting, so the projection is always finite;
+            # the components are streamed to disk chunk by chunk.
+            save_image(reduced_image, output_path, dtype=np.uint8)
+
+    output_path = artifact_store.get_or_create(
+        artifact_store.key(file_path, "pca", parameters), produce
+    )
+
+    analysis_writer.submit(file_path, "pca", parameters, pca_components=components)
+    return output_path
+
+
+def run_kmeans(file_path, channel=0, k=3, method="histogram", filters=None, channels=None, components=None):
+    def produce(output_path):
+        processor = get_processor(file_path)
+        with heavy():
+            segmented_image = processor.apply_kmeans_segmentation(
+                channel=channel, k=k, method=method, filters=filters, channels=channels, components=components
+            )
+            save_image(segmented_image, output_path, dtype="uint8")
+
+    parameters = {"channel": channel, "k": k, "method": method}
+    # Only set for feature clustering, so single channel keys stay unchanged.
+    if channels is not None:
+        parameters["channels"] = channels
+    if components is not None:
+        parameters["components"] = components
+    key = artifact_store.key(file_path, "kmeans", _with_filters(parameters, filters))
+    return artifact_store.get_or_create(key, produce)
+
+
+def run_otsu(file_path, channel=0, classes=2, mode="global", filters=None):
+    def produce(output_path):
+        processor = get_processor(file_path)
+        with heavy():
+            segmented_image = processor.apply_otsu_segmentation(
+                channel=channel, classes=classes, mode=mode, filters=filters
+            )
+            save_image(segmented_image, output_path, dtype="uint8")
+
+    key = artifact_store.key(
+        file_path, "otsu", _with_filters({"channel": channel, "classes": classes, "mode": mode}, filters)
+    )
+    return artifact_store.get_or_create(key, produce)
+
+
+def run_filter(file_path, filters):
+    def produce(output_path):
+        processor = get_processor(file_path)
+        with heavy():
+            save_image(processor.filter_image(filters), output_path)
+
+    key = artifact_store.key(file_path, "filter", {"filters": filters})
+    return artifact_store.get_or_create(key, produce)
+
+
+def run_pyramid(file_path, method="mean"):
+    processor = get_processor(file_path)
+    with heavy():
+        return build_pyramid(file_path, processor.image, method=method)
+
+
+def run_convert(file_path, compression=ZARR_COMPRESSION):
+    processor = get_processor(file_path)
+    with heavy():
+        return convert_to_zarr(file_path, processor.image, compression=compression)
+
+
+def run_summary(file_path):
+    processor = get_processor(file_path)
+    with heavy():
+        return build_summary(file_path, processor.channel_image)
+
+
+def run_timeseries(file_path):
+    update_frames(file_path)
+
+
+OPERATIONS = {
+    "pca": run_pca,
+    "kmeans": run_kmeans,
+    "otsu": run_otsu,
+    "filter": run_filter,
+    "pyramid": run_pyramid,
+    "convert": run_convert,
+    "summary": run_summary,
+    "timeseries": run_timeseries,
+}
@@ -0,0 +1,52 @@
+import numpy as np
+import aggregates
+
+
+class CovariancePCA:
+    """Exact PCA from the channel covariance matrix, for images with few channels.
+
+    With C channels the C x C scatter matrix is tiny no matter how many
+    pixels there are, so it is accumulated in one parallel pass over the Dask
+    chunks and eigendecomposed in memory. Attributes mirror sklearn's PCA so
+    either estimator can be used for the chunk-wise projection.
+    """
+
+    def __init__(self, n_components=3):
+        self.n_components = n_components
+
+    def fit(self, image):
+        """Fits on a Dask array whose last axis holds all channels of a pixel."""
+        channels = image.shape[-1]
+        if not 1 <= self.n_components <= channels:
+            raise ValueError(
+                f"n_components={self.n_components} must be between 1 and the number of channels ({channels})"
+            )
+
+        summary = aggregates.reduce_blocks(
+            image, aggregates.channel_scatter, aggregates.merge_scatter
+        ).compute()
+        if summary["count"] < 2:
+            raise ValueError("PCA needs at least two pixels")
+
+        covariance = summary["scatter"] / (summary["count"] - 1)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1]
+        eigenvalues = np.clip(eigenvalues[order], 0, None)
+        components = eigenvectors[:, order].T
+
+        # Same sign convention as sklearn: the largest loading of each
+        # component is positive.
+        signs = np.sign(components[np.arange(channels), np.argmax(np.abs(components), axis=1)])
+        components *= np.where(signs == 0, 1, signs)[:, None]
+
+        self.mean_ = summary["mean"]
+        self.n_samples_seen_ = summary["count"]
+        self.n_components_ = self.n_components
+        self.components_ = components[: self.n_components]
+        self.explained_variance_ = eigenvalues[: self.n_components]
+        total = eigenvalues.sum()
+        self.explained_variance_ratio_ = self.explained_variance_ / total if total else np.zeros(self.n_components)
+        return self
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) @ self.components_.T
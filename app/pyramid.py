@@ -0,0 +1,141 @@
+"""Multiscale pyramids for fast zoomed-out reads.
+
+Level ``n`` halves X and Y ``n`` times (Z, time and channels are kept), so
+its scale factor is ``2 ** n``. Levels 1 and up are stored in a Zarr group
+next to the image (``<image>.pyramid.zarr``), tiled in X/Y with one tile per
+plane and channel block. Level 0 is the image itself. Each level is computed
+from the previous one by averaging ("mean") or taking the most frequent
+value ("mode", for label images) of every 2x2 block.
+
+The group records the source file's modification time and size; a pyramid
+whose source has changed since it was built is ignored.
+"""
+import logging
+import os
+
+import dask.array as da
+import numpy as np
+import zarr
+from dask.array.core import normalize_chunks
+
+from zarr_store import atomic_group, from_zarr, source_identity
+
+PYRAMID_METHODS = ("mean", "mode")
+# Levels are added until the longest X/Y side is at most this many pixels.
+PYRAMID_MIN_SIZE = 256
+TILE_SIZE = 256
+
+
+def pyramid_path(file_path):
+    return f"{file_path}.pyramid.zarr"
+
+
+def _block_mode(block, axis=None):
+    """Most frequent value of each block; ties go to the first value in the block."""
+    if axis is None:
+        # Dask calls the reduction without axes to infer the output type.
+        return block
+    values = np.moveaxis(block, axis, range(-len(axis), 0))
+    values = values.reshape(values.shape[: -len(axis)] + (-1,))
+    counts = np.stack(
+        [(values == values[..., [i]]).sum(axis=-1) for i in range(values.shape[-1])], axis=-1
+    )
+    winner = np.argmax(counts, axis=-1)[..., np.newaxis]
+    return np.take_along_axis(values, winner, axis=-1)[..., 0]
+
+
+def downsample(image, method="mean"):
+    """Halves X and Y of a Dask array, dropping an odd last row/column."""
+    if method not in PYRAMID_METHODS:
+        raise ValueError(f"Unknown pyramid method: {method}")
+    if method == "mode":
+        return da.coarsen(_block_mode, image, {0: 2, 1: 2}, trim_excess=True)
+    level = da.coarsen(np.mean, image, {0: 2, 1: 2}, trim_excess=True)
+    if np.issubdtype(image.dtype, np.integer):
+        level = da.round(level)
+    return level.astype(image.dtype)
+
+
+def _tile_chunks(shape):
+    return (TILE_SIZE, TILE_SIZE) + (1,) * (len(shape) - 3) + shape[-1:]
+
+
+def build_pyramid(file_path, image, method="mean", min_size=PYRAMID_MIN_SIZE):
+    """Writes the pyramid of ``image`` (the Dask array of ``file_path``); returns its path.
+
+    The group is built under a temporary name and renamed into place, so
+    readers never see a partial pyramid.
+    """
+    path = pyramid_path(file_path)
+    file_mtime, file_size = source_identity(file_path)
+
+    with atomic_group(path) as group:
+        level, scales = image, []
+        while max(level.shape[:2]) > min_size and min(level.shape[:2]) >= 2:
+            level = downsample(level, method)
+            name = str(len(scales) + 1)
+            tiles = _tile_chunks(level.shape)
+            target = group.create_array(name, shape=level.shape, dtype=level.dtype, chunks=tiles)
+            chunks = normalize_chunks("auto", level.shape, dtype=level.dtype, previous_chunks=tiles)
+            da.store(level.rechunk(chunks), target, lock=False)
+            # The next level reads this one back instead of recomputing it.
+            level = from_zarr(target, chunks=chunks)
+            scales.append(2 ** int(name))
+            logging.debug(f"Pyramid level {name} of {file_path}: {level.shape}")
+
+        group.attrs.update({
+            "source": {"file_mtime": file_mtime, "file_size": file_size},
+            "method": method,
+            "multiscales": [{
+                "version": "0.4",
+                "datasets": [
+                    {"path": str(n), "coordinateTransformations": [
+                        {"type": "scale", "scale": [scale, scale] + [1] * (image.ndim - 2)}
+                    ]}
+                    for n, scale in enumerate(scales, start=1)
+                ],
+            }],
+        })
+    return path
+
+
+def open_pyramid(file_path):
+    """Returns the stored levels [level 1, level 2, ...] as Dask arrays, or [] if absent or stale."""
+    path = pyramid_path(file_path)
+    if not os.path.exists(path):
+        return []
+    try:
+        group = zarr.open_group(path, mode="r")
+        source = group.attrs.get("source", {})
+        if (source.get("file_mtime"), source.get("file_size")) != source_identity(file_path):
+            return []
+        datasets = group.attrs["multiscales"][0]["datasets"]
+        return [from_zarr(group[dataset["path"]]) for dataset in datasets]
+    except (KeyError, ValueError, OSError) as e:
+        logging.warning(f"Ignoring unreadable pyramid {path}: {e}")
+        return []
+
+
+def choose_level(extents, max_size, levels):
+    """Picks the coarsest level at which the X/Y ``extents`` still cover ``max_size`` pixels.
+
+    ``levels`` is the number of levels including level 0. Returns 0 when
+    even the full resolution is smaller than ``max_size``.
+    """
+    for level in range(levels - 1, 0, -1):
+        if max(extent // 2 ** level for extent in extents) >= max_size:
+            return level
+    return 0
+
+
+def scale_index(index, scale):
+    """Maps a full-resolution index or slice on X/Y to a level with the given scale."""
+    if scale == 1 or index is None:
+        return index
+    if isinstance(index, slice):
+        return slice(
+            None if index.start is None else index.start // scale,
+            None if index.stop is None else -(-index.stop // scale),
+            None if index.step is None else (index.step // scale or (1 if index.step > 0 else -1)),
+        )
+    return index // scale
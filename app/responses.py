@@ -0,0 +1,64 @@
+"""HTTP helpers for routes that return encoded arrays.
+
+Array responses are validated against the source file: the ETag hashes the
+file's identity with the request parameters and Last-Modified is the file's
+modification time, so a conditional request can be answered with 304 before
+any pixels are read.
+"""
+from datetime import datetime, timezone
+
+from flask import Response, request, send_file
+from werkzeug.http import is_resource_modified
+
+from analysis_cache import file_identity, versioned_key
+from encoding import check_format, encode_array
+import metrics
+
+
+def format_args():
+    """Returns the requested (format, compression), raising ValueError if unsupported."""
+    fmt = request.args.get("format", "tiff").lower()
+    compression = request.args.get("compression", "none").lower()
+    check_format(fmt, compression)
+    return fmt, compression
+
+
+def cache_validators(file_path, operation, parameters):
+    """Returns the (etag, last_modified) pair for a response derived from ``file_path``."""
+    etag = versioned_key(file_path, operation, parameters)
+    last_modified = datetime.fromtimestamp(file_identity(file_path)[0] / 1e9, timezone.utc)
+    return etag, last_modified
+
+
+def not_modified(etag, last_modified):
+    """Returns a 304 response if the client's cached copy is still valid, else None."""
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+
+def send_array(array, fmt, compression, etag, last_modified, name, level=0):
+    """Encodes ``array`` in memory and sends it as ``name`` plus the format's extension.
+
+    ``level`` is the pyramid level the array was read from; it is reported
+    in the X-Pyramid-Level and X-Pyramid-Scale headers.
+    """
+    with metrics.stage("encode"):
+        buffer, mimetype, extension, headers = encode_array(array, fmt, compression)
+    with metrics.stage("response"):
+        response = send_file(
+            buffer,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=name + extension,
+            etag=etag,
+            last_modified=last_modified,
+            conditional=True,
+        )
+        response.headers.update(headers)
+        response.headers["X-Pyramid-Level"] = str(level)
+        response.headers["X-Pyramid-Scale"] = str(2 ** level)
+    return response
@@ -1,12 +1,12 @@
 import os
-import numpy as np
-import tifffile as tiff
 from flask import request
 from flask_restful import Resource
-from image_processor import ImageProcessor
+from image_processor import PCA_METHODS
+from operations import run_pca
+from image_cache import get_processor
+from filtering import format_pipeline, parse_pipeline
+from jobs import job_manager
 from flasgger import swag_from
-from sqlalchemy.orm import sessionmaker
-from database import get_db, ImageAnalysis
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
@@ -29,10 +29,33 @@ class AnalyzeImage(Resource):
                 'type': 'integer',
                 'required': False,
                 'description': 'Number of principal components to retain (default=3)'
+            },
+            {
+                'name': 'method',
+                'in': 'query',
+                'type': 'string',
+                'enum': ['incremental', 'covariance'],
+                'required': False,
+                'description': 'PCA engine: sklearn IncrementalPCA, or an exact PCA from the channel covariance matrix (default=incremental)'
+            },
+            {
+                'name': 'filters',
+                'in': 'query',
+                'type': 'string',
+                'required': False,
+                'description': 'Filter pipeline applied before PCA, e.g. gaussian:2,median:3 (see /filter)'
+            },
+            {
+                'name': 'async',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Queue the analysis as a background job and return its id immediately (default=false)'
             }
         ],
         'responses': {
             200: {'description': 'PCA analysis completed'},
+            202: {'description': 'PCA analysis queued as a job'},
             400: {'description': 'Invalid request or file path'}   
         }
     })
@@ -41,33 +64,44 @@ class AnalyzeImage(Resource):
         data = request.get_json()
         file_path = data.get("file_path")
         components = data.get("components", 3)
+        method = data.get("method", "incremental")
+        run_async = bool(data.get("async", False))
 
         if not file_path or not os.path.exists(file_path):
             logging.error(f"File not found: {file_path}")
             return {"error": "File not found"}, 400
 
-        try:
-            processor = ImageProcessor(file_path)
-            reduced_image = processor.apply_pca(components)
+        if method not in PCA_METHODS:
+            logging.error(f"Unknown PCA method: {method}")
+            return {"error": f"Invalid method. Choose one of {', '.join(PCA_METHODS)}"}, 400
+
+        channels = get_processor(file_path).channel_image.shape[-1]
+        # bool is an int subclass, but true/false is not a component count.
+        if not isinstance(components, int) or isinstance(components, bool) or not 1 <= components <= channels:
+            logging.error(f"Invalid number of components: {components}")
+            return {"error": f"components must be an integer between 1 and {channels}"}, 400
 
-            if reduced_image is None or np.isnan(reduced_image).any():
-                logging.error(f"PCA failed: Output contains NaN values.")
-                return {"error": "PCA computation failed"}, 500
+        try:
+            filters = format_pipeline(parse_pipeline(data.get("filters")))
+        except ValueError as e:
+            logging.error(f"Invalid filter pipeline: {e}")
+            return {"error": str(e)}, 400
 
-            output_path = f"data/pca_output_{components}.tif"
-            tiff.imwrite(output_path, reduced_image.astype(np.uint8))
+        parameters = {"file_path": file_path, "components": components, "method": method}
+        if filters:
+            parameters["filters"] = filters
+        if run_async:
+            job = job_manager.submit("pca", parameters)
+            return {"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"}, 202
 
-     
-            db = next(get_db())
-            analysis_entry = ImageAnalysis(
-                file_path=file_path,
-                pca_components=components
-            )
-            db.add(analysis_entry)
-            db.commit()
+        try:
+            output_path = run_pca(**parameters)
 
             return {"message": "PCA analysis completed", "file_path": output_path}, 200
 
+        except ValueError as e:
+            logging.error(f"Invalid PCA request: {e}")
+            return {"error": str(e)}, 400
         except Exception as e:
             logging.error(f"Error during PCA processing: {e}")
             return {"error": "Internal server error"}, 500
\ No newline at end of file
@@ -0,0 +1,14 @@
+from flask_restful import Resource
+from flasgger import swag_from
+from artifacts import artifact_store
+
+class ArtifactMetrics(Resource):
+    @swag_from({
+        'summary': 'Artifact store metrics',
+        'description': 'Return the size, size budget, hit rate and eviction count of the output artifact store.',
+        'responses': {
+            200: {'description': 'Current metrics'}
+        }
+    })
+    def get(self):
+        return artifact_store.stats(), 200
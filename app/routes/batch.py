@@ -0,0 +1,88 @@
+from flask import request, send_file
+from flask_restful import Resource
+from flasgger import swag_from
+from batch import AXES, BATCH_TYPES, BatchError, compute_batch, plan_batch, write_archive
+from encoding import FORMATS, check_format
+from image_processor import RegionTooLarge
+from routes.region import parse_axis
+
+
+def parse_operation(operation):
+    """Parses the axes of one JSON operation; they may be integers or "start:stop:step" strings."""
+    parsed = dict(operation)
+    for axis in AXES:
+        value = operation.get(axis)
+        parsed[axis] = None if value is None else parse_axis(str(value))
+    if isinstance(operation.get("max_size"), str):
+        try:
+            parsed["max_size"] = int(operation["max_size"])
+        except ValueError:
+            raise ValueError("max_size must be a positive integer")
+    return parsed
+
+
+class BatchRequest(Resource):
+    @swag_from({
+        'summary': 'Run several slice, region and statistics operations at once',
+        'description': 'Plans all operations together, so chunks shared by several of them are read once and independent ones run in parallel. Returns a zip archive with one file per slice or region and results.json describing every operation.',
+        'parameters': [
+            {
+                'name': 'body',
+                'in': 'body',
+                'required': True,
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'operations': {
+                            'type': 'array',
+                            'items': {
+                                'type': 'object',
+                                'properties': {
+                                    'type': {'type': 'string', 'enum': list(BATCH_TYPES)},
+                                    'file_path': {'type': 'string'},
+                                    **{axis: {'type': 'string', 'description': 'Index or start:stop:step range'} for axis in AXES},
+                                    'max_size': {'type': 'integer'}
+                                }
+                            }
+                        },
+                        'format': {'type': 'string', 'enum': list(FORMATS), 'default': 'tiff'},
+                        'compression': {'type': 'string', 'enum': ['none', 'zlib', 'lzma'], 'default': 'none'}
+                    }
+                }
+            }
+        ],
+        'responses': {
+            200: {'description': 'Zip archive with the results'},
+            400: {'description': 'Invalid operation (see index) or format'},
+            413: {'description': 'Results exceed the batch size limit'}
+        }
+    })
+    def post(self):
+        data = request.get_json(silent=True) or {}
+        operations = data.get("operations")
+        if not isinstance(operations, list) or not operations:
+            return {"error": "operations must be a non-empty list"}, 400
+
+        fmt = str(data.get("format", "tiff")).lower()
+        compression = str(data.get("compression", "none")).lower()
+        try:
+            check_format(fmt, compression)
+            parsed = []
+            for index, operation in enumerate(operations):
+                try:
+                    parsed.append(parse_operation(operation))
+                except (AttributeError, ValueError) as e:
+                    raise BatchError(index, str(e))
+            planned = plan_batch(parsed)
+        except RegionTooLarge as e:
+            return {"error": str(e)}, 413
+        except BatchError as e:
+            return {"error": str(e), "index": e.index}, 400
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        try:
+            archive = write_archive(compute_batch(planned), fmt, compression)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return send_file(archive, mimetype="application/zip", as_attachment=True, download_name="batch.zip")
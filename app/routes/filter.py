@@ -0,0 +1,62 @@
+import os
+from flask import request
+from flask_restful import Resource
+from flasgger import swag_from
+from filtering import FILTERS, format_pipeline, parse_pipeline
+from operations import run_filter
+from jobs import job_manager
+
+
+class FilterImage(Resource):
+    @swag_from({
+        'summary': 'Filter an image',
+        'description': 'Runs a pipeline of chunked filters over every (X, Y) plane and writes the result, with the shape and dtype of the input, to the artifact store. The same pipeline can be passed as filters to /segment/kmeans, /segment/otsu and /analyze, which then consume the filtered image directly.',
+        'parameters': [
+            {
+                'name': 'file_path',
+                'in': 'query',
+                'type': 'string',
+                'required': True,
+                'description': 'Path to the image file'
+            },
+            {
+                'name': 'filters',
+                'in': 'query',
+                'type': 'string',
+                'required': True,
+                'description': f'Comma separated name:value steps, applied in order, e.g. gaussian:2,median:3. Filters: {", ".join(FILTERS)}'
+            },
+            {
+                'name': 'async',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Queue the filter as a background job and return its id immediately (default=false)'
+            }
+        ],
+        'responses': {
+            200: {'description': 'Path of the filtered image'},
+            202: {'description': 'Filter queued as a job'},
+            400: {'description': 'Invalid pipeline or file path'}
+        }
+    })
+    def get(self):
+        file_path = request.args.get("file_path")
+        run_async = request.args.get("async", "false").lower() == "true"
+
+        if not file_path or not os.path.exists(file_path):
+            return {"error": "File not found"}, 400
+
+        try:
+            filters = format_pipeline(parse_pipeline(request.args.get("filters")))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if not filters:
+            return {"error": "filters must name at least one step"}, 400
+
+        parameters = {"file_path": file_path, "filters": filters}
+        if run_async:
+            job = job_manager.submit("filter", parameters)
+            return {"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"}, 202
+
+        return {"file_path": run_filter(**parameters)}, 200
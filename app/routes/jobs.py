@@ -0,0 +1,42 @@
+from flask_restful import Resource
+from flasgger import swag_from
+from jobs import job_manager
+
+job_id_parameter = {
+    'name': 'job_id',
+    'in': 'path',
+    'type': 'string',
+    'required': True,
+    'description': 'Id returned when the job was submitted'
+}
+
+class JobStatus(Resource):
+    @swag_from({
+        'summary': 'Get job status',
+        'description': 'Return the status, progress (finished tasks out of total) and result location of a background job.',
+        'parameters': [job_id_parameter],
+        'responses': {
+            200: {'description': 'Job found'},
+            404: {'description': 'Unknown job id'}
+        }
+    })
+    def get(self, job_id):
+        job = job_manager.get(job_id)
+        if job is None:
+            return {"error": "Job not found"}, 404
+        return job, 200
+
+    @swag_from({
+        'summary': 'Cancel a job',
+        'description': 'Cancel a queued job, or ask a running job to stop at its next progress update.',
+        'parameters': [job_id_parameter],
+        'responses': {
+            200: {'description': 'Cancellation recorded'},
+            404: {'description': 'Unknown job id'}
+        }
+    })
+    def delete(self, job_id):
+        job = job_manager.cancel(job_id)
+        if job is None:
+            return {"error": "Job not found"}, 404
+        return job, 200
@@ -2,13 +2,16 @@ import os
 import tifffile as tiff
 from flask import request
 from flask_restful import Resource
-from image_processor import ImageProcessor
+from image_cache import get_processor
 from flasgger import swag_from
+from database import session_scope
+from analysis_cache import lookup_metadata, store_metadata
+from chunk_summary import summary_path
 
 class ImageMetadata(Resource):
     @swag_from({
         'summary': 'Get image metadata',
-        'description': 'Retrieve metadata information for the input image.',
+        'description': 'Retrieve metadata of the input image from its TIFF header; min/max come from the chunk summary built at upload. Never reads pixel data.',
         'parameters': [
             {
                 'name': 'file_path',
@@ -16,6 +19,13 @@ class ImageMetadata(Resource):
                 'type': 'string',
                 'required': True,
                 'description': 'Path to the image file'
+            },
+            {
+                'name': 'refresh',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Recompute even if a cached result is still valid (default=false)'
             }
         ],
         'responses': {
@@ -25,10 +35,19 @@ class ImageMetadata(Resource):
     })
     def get(self):
         file_path = request.args.get("file_path")
+        refresh = request.args.get("refresh", "false").lower() == "true"
         if not file_path or not os.path.exists(file_path):
             return {"error": "File not found"}, 400
 
-        processor = ImageProcessor(file_path)
-        metadata = processor.get_metadata()
+        with session_scope() as db:
+            if not refresh:
+                metadata = lookup_metadata(db, file_path)
+                # Cached before the chunk summary was built: pick up its min/max.
+                if metadata is not None and (metadata.get("min") is not None or not os.path.exists(summary_path(file_path))):
+                    return {"metadata": metadata, "cached": True}, 200
+
+            processor = get_processor(file_path)
+            metadata = processor.get_metadata()
+            store_metadata(db, file_path, metadata)
 
-        return {"metadata": metadata}, 200
\ No newline at end of file
+        return {"metadata": metadata, "cached": False}, 200
\ No newline at end of file
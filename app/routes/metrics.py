@@ -0,0 +1,15 @@
+from flask import Response
+from flask_restful import Resource
+from flasgger import swag_from
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+class PrometheusMetrics(Resource):
+    @swag_from({
+        'summary': 'Performance metrics',
+        'description': 'Return request latencies, per-stage timings, bytes read, peak memory and Dask task counts in Prometheus text format.',
+        'responses': {
+            200: {'description': 'Metrics in Prometheus text format'}
+        }
+    })
+    def get(self):
+        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,115 @@
+import os
+from flask import request
+from flask_restful import Resource
+from encoding import FORMATS
+from image_cache import get_processor
+from image_processor import RegionTooLarge
+from responses import cache_validators, format_args, not_modified, send_array
+from flasgger import swag_from
+
+REGION_MAX_BYTES = int(os.environ.get("REGION_MAX_BYTES", 256 * 1024**2))
+AXES = ("x", "y", "z", "time", "channel")
+
+
+def parse_axis(value):
+    """Parses an index ("5") or a numpy-style range ("start:stop:step") for one axis."""
+    if value is None:
+        return None
+    parts = value.split(":")
+    if len(parts) == 1:
+        return int(value)
+    if len(parts) > 3:
+        raise ValueError(f"Invalid range '{value}', expected start:stop:step")
+    start, stop, step = [int(part) if part else None for part in parts + [""] * (3 - len(parts))]
+    if step == 0:
+        raise ValueError("Step cannot be zero")
+    return slice(start, stop, step)
+
+
+def axis_parameter(name):
+    return {
+        'name': name,
+        'in': 'query',
+        'type': 'string',
+        'required': False,
+        'description': f'Index or start:stop:step range along {name} (default: the whole axis)'
+    }
+
+
+class ImageRegion(Resource):
+    @swag_from({
+        'summary': 'Extract a sub-volume',
+        'description': 'Extract a bounding box, ranges along z/time/channel or a strided (downsampled) selection. x/y are full-resolution coordinates, also when a pyramid level is read. Only the TIFF pages inside the region are read; regions larger than REGION_MAX_BYTES are rejected.',
+        'parameters': [
+            {
+                'name': 'file_path',
+                'in': 'query',
+                'type': 'string',
+                'required': True,
+                'description': 'Path to the image file'
+            },
+            *[axis_parameter(name) for name in AXES],
+            {
+                'name': 'max_size',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Desired output size in pixels; the coarsest pyramid level whose X/Y extent is still at least this large is read (see X-Pyramid-Level)'
+            },
+            {
+                'name': 'format',
+                'in': 'query',
+                'type': 'string',
+                'enum': list(FORMATS),
+                'default': 'tiff',
+                'description': 'Output format; raw returns the bytes with X-Array-Shape and X-Array-Dtype headers'
+            },
+            {
+                'name': 'compression',
+                'in': 'query',
+                'type': 'string',
+                'enum': ['none', 'zlib', 'lzma'],
+                'default': 'none',
+                'description': 'Compression (lzma is TIFF only)'
+            }
+        ],
+        'responses': {
+            200: {'description': 'Region extracted successfully'},
+            304: {'description': 'Region unchanged since the cached copy'},
+            400: {'description': 'Invalid request or file path'},
+            413: {'description': 'Region exceeds the size limit'}
+        }
+    })
+    def get(self):
+        file_path = request.args.get("file_path")
+        if not file_path or not os.path.exists(file_path):
+            return {"error": "File not found"}, 400
+
+        try:
+            fmt, compression = format_args()
+            selection = {name: parse_axis(request.args.get(name)) for name in AXES}
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        processor = get_processor(file_path)
+        max_size = request.args.get("max_size", type=int)
+        level = processor.choose_level(max_size, selection["x"], selection["y"]) if max_size else 0
+
+        parameters = {name: request.args.get(name) for name in AXES}
+        parameters.update(level=level, format=fmt, compression=compression)
+        etag, last_modified = cache_validators(file_path, "region", parameters)
+        cached = not_modified(etag, last_modified)
+        if cached is not None:
+            return cached
+
+        try:
+            region = processor.extract_region(**selection, max_bytes=REGION_MAX_BYTES, level=level)
+        except RegionTooLarge as e:
+            return {"error": str(e)}, 413
+        except (IndexError, ValueError) as e:
+            return {"error": str(e)}, 400
+
+        try:
+            return send_array(region, fmt, compression, etag, last_modified, "region", level=level)
+        except ValueError as e:
+            return {"error": str(e)}, 400
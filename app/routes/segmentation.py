@@ -1,25 +1,130 @@
-from flask import request, send_file
+from flask import request
 from flask_restful import Resource
 import os
-import tifffile as tiff
-from image_processor import ImageProcessor
+from image_processor import KMEANS_METHODS, OTSU_MODES
+from operations import run_kmeans, run_otsu
+from thresholding import OTSU_MAX_CLASSES
+from clustering import KMEANS_MAX_CLUSTERS
+from filtering import format_pipeline, parse_pipeline
+from image_cache import get_processor
+from jobs import job_manager
+
+
+def int_arg(name, default):
+    """An integer query parameter; raises ValueError with a message for the client."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+def channel_error(file_path, channel):
+    """Returns an error message unless ``channel`` is a channel of the image."""
+    count = get_processor(file_path).image.shape[-1]
+    if not 0 <= channel < count:
+        return f"channel must be between 0 and {count - 1}"
+    return None
+
 
 class KMeansSegmentation(Resource):
     def get(self):
         file_path = request.args.get("file_path")
-        channel = int(request.args.get("channel", 0))
-        k = int(request.args.get("k", 3))
+        channels = request.args.get("channels")
+        components = request.args.get("components")
+        # Feature clustering needs the sampling engine unless told otherwise.
+        method = request.args.get("method", "histogram" if channels is None and components is None else "sample")
+        run_async = request.args.get("async", "false").lower() == "true"
+
+        if not file_path or not os.path.exists(file_path):
+            return {"error": "File not found"}, 400
+
+        if method not in KMEANS_METHODS:
+            return {"error": f"Invalid method. Choose one of {', '.join(KMEANS_METHODS)}"}, 400
+
+        try:
+            channel = int_arg("channel", 0)
+            k = int_arg("k", 3)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        if not 1 <= k <= KMEANS_MAX_CLUSTERS:
+            return {"error": f"k must be between 1 and {KMEANS_MAX_CLUSTERS}"}, 400
+
+        try:
+            filters = format_pipeline(parse_pipeline(request.args.get("filters")))
+            if channels is not None and channels != "all":
+                channels = [int(c) for c in channels.split(",")]
+            if components is not None:
+                components = int(components)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        for selected in channels if isinstance(channels, list) else [channel]:
+            error = channel_error(file_path, selected)
+            if error:
+                return {"error": error}, 400
+
+        parameters = {"file_path": file_path, "channel": channel, "k": k, "method": method}
+        if filters:
+            parameters["filters"] = filters
+        if channels is not None:
+            parameters["channels"] = channels
+        if components is not None:
+            parameters["components"] = components
+        if run_async:
+            job = job_manager.submit("kmeans", parameters)
+            return {"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"}, 202
+
+        try:
+            output_path = run_kmeans(**parameters)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        return {"file_path": output_path}, 200
+
+class OtsuSegmentation(Resource):
+    def get(self):
+        file_path = request.args.get("file_path")
+        mode = request.args.get("mode", "global")
+        run_async = request.args.get("async", "false").lower() == "true"
 
-        if not os.path.exists(file_path):
+        if not file_path or not os.path.exists(file_path):
             return {"error": "File not found"}, 400
 
-        processor = ImageProcessor(file_path)
-        segmented_image = processor.apply_kmeans_segmentation(channel=channel, k=k)
+        try:
+            channel = int_arg("channel", 0)
+            classes = int_arg("classes", 2)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        if not 2 <= classes <= OTSU_MAX_CLASSES:
+            return {"error": f"classes must be between 2 and {OTSU_MAX_CLASSES}"}, 400
+
+        if mode not in OTSU_MODES:
+            return {"error": f"Invalid mode. Choose one of {', '.join(OTSU_MODES)}"}, 400
+
+        error = channel_error(file_path, channel)
+        if error:
+            return {"error": error}, 400
+
+        try:
+            filters = format_pipeline(parse_pipeline(request.args.get("filters")))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        parameters = {"file_path": file_path, "channel": channel, "classes": classes, "mode": mode}
+        if filters:
+            parameters["filters"] = filters
+        if run_async:
+            job = job_manager.submit("otsu", parameters)
+            return {"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"}, 202
 
-        # output_path = f"data/kmeans_segmented_{channel}_k{k}.tif"
-        output_filename = f"kmeans_segmented_{channel}_k{k}.tif"
-        output_path = os.path.join(os.getcwd(), "data", output_filename)
-        
-        tiff.imwrite(output_path, segmented_image.astype("uint8"))
+        try:
+            output_path = run_otsu(**parameters)
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
         return {"file_path": output_path}, 200
@@ -1,18 +1,15 @@
 import os
-import numpy as np
-import tifffile as tiff
-from flask import request, send_file
+from flask import request
 from flask_restful import Resource
-from image_processor import ImageProcessor
+from encoding import FORMATS
+from image_cache import get_processor
+from responses import cache_validators, format_args, not_modified, send_array
 from flasgger import swag_from
 
-OUTPUT_FOLDER = os.path.abspath("data/") 
-OUTPUT_FILE = os.path.join(OUTPUT_FOLDER, "slice_output.tif")
-
 class SliceImage(Resource):
     @swag_from({
         'summary': 'Extract image slice',
-        'description': 'Extract a 2D slice from a multi-dimensional TIFF image.',
+        'description': 'Extract a 2D slice from a multi-dimensional TIFF image. The slice is encoded in memory in the requested format; responses carry an ETag and Last-Modified derived from the source file, so conditional requests are answered with 304.',
         'parameters': [
             {
                 'name': 'file_path',
@@ -41,10 +38,34 @@ class SliceImage(Resource):
                 'type': 'integer',
                 'required': True,
                 'description': 'Channel index of the slice'
+            },
+            {
+                'name': 'max_size',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Desired output size in pixels; the coarsest pyramid level whose X/Y extent is still at least this large is read (see X-Pyramid-Level)'
+            },
+            {
+                'name': 'format',
+                'in': 'query',
+                'type': 'string',
+                'enum': list(FORMATS),
+                'default': 'tiff',
+                'description': 'Output format; raw returns the bytes with X-Array-Shape and X-Array-Dtype headers'
+            },
+            {
+                'name': 'compression',
+                'in': 'query',
+                'type': 'string',
+                'enum': ['none', 'zlib', 'lzma'],
+                'default': 'none',
+                'description': 'Compression (lzma is TIFF only)'
             }
         ],
         'responses': {
             200: {'description': 'Slice extracted successfully'},
+            304: {'description': 'Slice unchanged since the cached copy'},
             400: {'description': 'Invalid request or file path'}
         }
     })
@@ -57,13 +78,26 @@ class SliceImage(Resource):
         if not file_path or not os.path.exists(file_path):
             return {"error": "File not found"}, 400
 
-        
-        if not os.path.exists(OUTPUT_FOLDER):
-            os.makedirs(OUTPUT_FOLDER)
+        try:
+            fmt, compression = format_args()
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
-        processor = ImageProcessor(file_path)
-        sliced_image = processor.extract_slice(z, time, channel)
+        processor = get_processor(file_path)
+        max_size = request.args.get("max_size", type=int)
+        level = processor.choose_level(max_size) if max_size else 0
 
-        tiff.imwrite(OUTPUT_FILE, sliced_image.astype(np.uint8))
+        parameters = {"z": z, "time": time, "channel": channel, "level": level, "format": fmt, "compression": compression}
+        etag, last_modified = cache_validators(file_path, "slice", parameters)
+        cached = not_modified(etag, last_modified)
+        if cached is not None:
+            return cached
 
-        return send_file(OUTPUT_FILE, as_attachment=True)
\ No newline at end of file
+        try:
+            sliced_image = processor.extract_slice(z, time, channel, level=level)
+            return send_array(
+                sliced_image, fmt, compression, etag, last_modified,
+                f"slice_z{z}_t{time}_c{channel}", level=level,
+            )
+        except (IndexError, ValueError) as e:
+            return {"error": str(e)}, 400
@@ -1,11 +1,15 @@
 import os
 from flask import request
 from flask_restful import Resource
-from image_processor import ImageProcessor
+from image_cache import get_processor
 from flasgger import swag_from
 import logging
 from sqlalchemy.orm import sessionmaker
-from database import get_db, ImageAnalysis
+from database import session_scope
+from analysis_cache import analysis_writer, lookup_analysis
+from execution import heavy
+from timeseries import summarize_timeseries, update_frames
+from routes.region import axis_parameter, parse_axis
 
 class ImageStatistics(Resource):
     @swag_from({
@@ -18,6 +22,13 @@ class ImageStatistics(Resource):
                 'type': 'string',
                 'required': True,
                 'description': 'Path to the image file'
+            },
+            {
+                'name': 'refresh',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Recompute even if a cached result is still valid (default=false)'
             }
         ],
         'responses': {
@@ -27,24 +38,117 @@ class ImageStatistics(Resource):
     })
     def get(self):
         file_path = request.args.get("file_path")
+        refresh = request.args.get("refresh", "false").lower() == "true"
 
         if not file_path or not os.path.exists(file_path):
             return {"error": "File not found"}, 400
 
         try:
-            processor = ImageProcessor(file_path)
-            stats = processor.compute_statistics()
-
-            # save statistics to database
-            db = next(get_db())
-            analysis_entry = ImageAnalysis(
-                file_path=file_path,
-                statistics=stats
-            )
-            db.add(analysis_entry)
-            db.commit()
-
-            return {"statistics": stats}, 200
+            if not refresh:
+                with session_scope() as db:
+                    cached = lookup_analysis(db, file_path, "statistics")
+                    if cached is not None:
+                        return {"statistics": cached.statistics, "cached": True}, 200
+
+            processor = get_processor(file_path)
+            with heavy():
+                stats = processor.compute_statistics()
+
+            # save statistics to database, replacing any stale result for this file;
+            # the write happens in the background, off the request path
+            analysis_writer.submit(file_path, "statistics", statistics=stats)
+
+            return {"statistics": stats, "cached": False}, 200
         except Exception as e:
             logging.error(f"Error processing image statistics: {e}")
             return {"error": "Internal server error"}, 500
+
+
+class TimeSeriesStatistics(Resource):
+    @swag_from({
+        'summary': 'Get per-frame statistics',
+        'description': 'Returns per-channel mean, std, min, max and counts for every time point, and global statistics with a histogram merged from the stored per-frame partials. Only frames without stored partials are read: when a file grows along the time axis, only the appended frames are processed.',
+        'parameters': [
+            {
+                'name': 'file_path',
+                'in': 'query',
+                'type': 'string',
+                'required': True,
+                'description': 'Path to the image file'
+            },
+            {
+                'name': 'histograms',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Include the histogram of every frame (default=false)'
+            },
+            {
+                'name': 'refresh',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Recompute every frame (default=false)'
+            }
+        ],
+        'responses': {
+            200: {'description': 'Per-frame and global statistics'},
+            400: {'description': 'Invalid request or file path'}
+        }
+    })
+    def get(self):
+        file_path = request.args.get("file_path")
+        histograms = request.args.get("histograms", "false").lower() == "true"
+        refresh = request.args.get("refresh", "false").lower() == "true"
+
+        if not file_path or not os.path.exists(file_path):
+            return {"error": "File not found"}, 400
+
+        try:
+            frames, new_frames = update_frames(file_path, refresh=refresh)
+            dtype = get_processor(file_path).image.dtype
+            return {**summarize_timeseries(frames, dtype, histograms), "new_frames": new_frames}, 200
+        except Exception as e:
+            logging.error(f"Error processing time series statistics: {e}")
+            return {"error": "Internal server error"}, 500
+
+
+class RegionStatistics(Resource):
+    @swag_from({
+        'summary': 'Get statistics of a region',
+        'description': 'Returns per-channel min, max, mean and voxel count of a sub-region. Chunks lying fully inside the region are answered from the chunk summary built at upload; only the chunks the region cuts through are read. Ranges must be contiguous (step 1).',
+        'parameters': [
+            {
+                'name': 'file_path',
+                'in': 'query',
+                'type': 'string',
+                'required': True,
+                'description': 'Path to the image file'
+            },
+            axis_parameter("x"),
+            axis_parameter("y"),
+            axis_parameter("z"),
+            axis_parameter("time")
+        ],
+        'responses': {
+            200: {'description': 'Region statistics'},
+            400: {'description': 'Invalid request, file path or region'}
+        }
+    })
+    def get(self):
+        file_path = request.args.get("file_path")
+
+        if not file_path or not os.path.exists(file_path):
+            return {"error": "File not found"}, 400
+
+        try:
+            region = {name: parse_axis(request.args.get(name)) for name in ("x", "y", "z", "time")}
+            processor = get_processor(file_path)
+            with heavy():
+                channels = processor.region_summary(**region)
+            return {"region": {name: request.args.get(name) for name in region}, "channels": channels}, 200
+        except (ValueError, IndexError) as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            logging.error(f"Error processing region statistics: {e}")
+            return {"error": "Internal server error"}, 500
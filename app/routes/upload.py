@@ -1,23 +1,66 @@
 import os
+import uuid
+import hashlib
 from flask import request
 from flask_restful import Resource
+from werkzeug.http import parse_content_range_header
 from werkzeug.utils import secure_filename
 from flasgger import swag_from
-import tifffile as tiff
-from sqlalchemy.orm import sessionmaker
-from database import get_db, ImageMetadata
+from jobs import job_manager
+from pyramid import PYRAMID_METHODS
+from uploads import (
+    CONVERT_ON_INGEST, UPLOAD_FOLDER, UploadConflict, allowed_file, copy_stream, create_upload,
+    get_upload, ingest, write_range,
+)
 import logging
 from sqlalchemy.exc import IntegrityError
 
-UPLOAD_FOLDER = "data/"
-ALLOWED_EXTENSIONS = {"tif", "tiff"}
-
 logging.basicConfig(level=logging.DEBUG)
 
+
+def pyramid_parameter(location):
+    return {
+        'name': 'pyramid',
+        'in': location,
+        'type': 'string',
+        'enum': list(PYRAMID_METHODS),
+        'required': False,
+        'description': 'Build a multiscale pyramid in the background: mean for intensity images, mode for label images'
+    }
+
+
+convert_description = 'Convert the file to a chunked, compressed Zarr working copy in the background (default: CONVERT_ON_INGEST)'
+
+
+def submit_ingest_jobs(file_path, pyramid_method, convert):
+    """Queues the post-upload jobs; returns their ids keyed for the response.
+
+    The chunk summary (min/max for /metadata) and the per-frame statistics
+    (only new frames of a grown file are read) are always built; conversion
+    and the pyramid are optional.
+    """
+    jobs = {
+        "summary_job": job_manager.submit("summary", {"file_path": file_path}),
+        "timeseries_job": job_manager.submit("timeseries", {"file_path": file_path}),
+    }
+    if convert:
+        jobs["convert_job"] = job_manager.submit("convert", {"file_path": file_path})
+    if pyramid_method is not None:
+        jobs["pyramid_job"] = job_manager.submit("pyramid", {"file_path": file_path, "method": pyramid_method})
+    return {
+        name: {"job_id": job["id"], "status_url": f"/jobs/{job['id']}"}
+        for name, job in jobs.items()
+    }
+
+
+def invalid_pyramid(pyramid_method):
+    return pyramid_method is not None and pyramid_method not in PYRAMID_METHODS
+
+
 class UploadImage(Resource):
     @swag_from({
         'summary': 'Upload an image',
-        'description': 'Uploads a multi-dimensional TIFF image for processing.',
+        'description': 'Uploads a multi-dimensional TIFF image for processing. The file is streamed to disk in bounded chunks and validated from its TIFF header without decoding pixels.',
         'consumes': ['multipart/form-data'],
         'parameters': [
             {
@@ -26,11 +69,26 @@ class UploadImage(Resource):
                 'type': 'file',
                 'required': True,
                 'description': 'TIFF image file to upload'
+            },
+            {
+                'name': 'sha256',
+                'in': 'formData',
+                'type': 'string',
+                'required': False,
+                'description': 'Hex SHA-256 of the file, verified while it is received'
+            },
+            pyramid_parameter('formData'),
+            {
+                'name': 'convert',
+                'in': 'formData',
+                'type': 'boolean',
+                'required': False,
+                'description': convert_description
             }
         ],
         'responses': {
             201: {'description': 'File uploaded successfully'},
-            400: {'description': 'Invalid request or file type'}
+            400: {'description': 'Invalid request, file type or checksum'}
         }
     })
     def post(self):
@@ -45,63 +103,158 @@ class UploadImage(Resource):
             logging.error("No selected file in request")
             return {"error": "No selected file"}, 400
 
-        if not self.allowed_file(file.filename):
+        if not allowed_file(file.filename):
             logging.error(f"Invalid file type: {file.filename}")
             return {"error": "Invalid file format. Only .tif and .tiff allowed"}, 400
 
+        pyramid_method = request.values.get("pyramid")
+        if invalid_pyramid(pyramid_method):
+            return {"error": f"Invalid pyramid method. Choose one of {', '.join(PYRAMID_METHODS)}"}, 400
+        checksum = request.values.get("sha256")
+        convert = request.values.get("convert", str(CONVERT_ON_INGEST)).lower() == "true"
+
         try:
-            
             os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
             filename = secure_filename(file.filename)
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(file_path)
-
-            logging.debug(f"File saved at {file_path}")
-
-            image = tiff.imread(file_path)
-
-            if image.ndim != 5:
-                logging.error(f"Invalid image dimensions: {image.shape}")
-                return {"error": "Image must be 5D (X, Y, Z, Time, Channel)"}, 400
-
-            height, width, depth, time_frames, channels = image.shape
-
-            db = next(get_db())
-
-            existing_entry = db.query(ImageMetadata).filter_by(file_path=file_path).first()
-            if existing_entry:
-                logging.info(f"Updating existing metadata for {file_path}")
-                existing_entry.width = width
-                existing_entry.height = height
-                existing_entry.depth = depth
-                existing_entry.time_frames = time_frames
-                existing_entry.channels = channels
-                existing_entry.dtype = str(image.dtype)
-            else:
-                logging.info(f"Inserting new metadata for {file_path}")
-                metadata_entry = ImageMetadata(
-                    file_path=file_path,
-                    width=width,
-                    height=height,
-                    depth=depth,
-                    time_frames=time_frames,
-                    channels=channels,
-                    dtype=str(image.dtype),
-                )
-                db.add(metadata_entry)
-
-            db.commit()
-            return {"message": "File uploaded successfully", "file_path": file_path}, 201
+            temp_path = os.path.join(UPLOAD_FOLDER, f"{filename}.{uuid.uuid4().hex}.part")
+
+            hasher = hashlib.sha256() if checksum else None
+            with open(temp_path, "wb") as out:
+                copy_stream(file.stream, out, hasher)
+            if hasher is not None and hasher.hexdigest() != checksum.lower():
+                os.remove(temp_path)
+                logging.error(f"Checksum mismatch for {filename}")
+                return {"error": "Checksum mismatch"}, 400
+
+            try:
+                file_path = ingest(temp_path, filename)
+            except ValueError as e:
+                logging.error(f"Invalid image {filename}: {e}")
+                return {"error": str(e)}, 400
+
+            response = {"message": "File uploaded successfully", "file_path": file_path}
+            response.update(submit_ingest_jobs(file_path, pyramid_method, convert))
+            return response, 201
 
         except IntegrityError:
-            db.rollback()
-            logging.error(f"Duplicate entry detected for file: {file_path}")
+            logging.error(f"Duplicate entry detected for file: {file.filename}")
             return {"error": "File already uploaded"}, 400
         except Exception as e:
             logging.error(f"Error processing file upload: {e}")
             return {"error": "Internal server error"}, 500
-    
-    @staticmethod
-    def allowed_file(filename):
-        return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
\ No newline at end of file
+
+
+class ResumableUploads(Resource):
+    @swag_from({
+        'summary': 'Start a resumable upload',
+        'description': 'Creates an upload id. Send the file with sequential PUT requests carrying a Content-Range header; the last range validates and ingests the file.',
+        'parameters': [
+            {
+                'name': 'body',
+                'in': 'body',
+                'required': True,
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'file_name': {'type': 'string', 'example': 'volume.tif'},
+                        'size': {'type': 'integer', 'description': 'Total size in bytes'},
+                        'sha256': {'type': 'string', 'description': 'Optional hex SHA-256 of the whole file'},
+                        'pyramid': {'type': 'string', 'enum': list(PYRAMID_METHODS)},
+                        'convert': {'type': 'boolean', 'description': convert_description}
+                    }
+                }
+            }
+        ],
+        'responses': {
+            201: {'description': 'Upload created'},
+            400: {'description': 'Invalid request or file type'}
+        }
+    })
+    def post(self):
+        data = request.get_json(silent=True) or {}
+        file_name = data.get("file_name", "")
+        size = data.get("size")
+        if not allowed_file(file_name):
+            return {"error": "Invalid file format. Only .tif and .tiff allowed"}, 400
+        if not isinstance(size, int) or size <= 0:
+            return {"error": "size must be a positive number of bytes"}, 400
+        if invalid_pyramid(data.get("pyramid")):
+            return {"error": f"Invalid pyramid method. Choose one of {', '.join(PYRAMID_METHODS)}"}, 400
+        convert = data.get("convert", CONVERT_ON_INGEST)
+        if not isinstance(convert, bool):
+            return {"error": "convert must be true or false"}, 400
+
+        upload = create_upload(
+            file_name, size, sha256=data.get("sha256"), pyramid=data.get("pyramid"), convert=convert,
+        )
+        upload["upload_url"] = f"/uploads/{upload['upload_id']}"
+        return upload, 201
+
+
+upload_id_parameter = {
+    'name': 'upload_id',
+    'in': 'path',
+    'type': 'string',
+    'required': True,
+    'description': 'Id returned when the upload was created'
+}
+
+
+class ResumableUpload(Resource):
+    @swag_from({
+        'summary': 'Get upload progress',
+        'description': 'Returns the number of bytes received so far (the offset to resume from) and the upload status.',
+        'parameters': [upload_id_parameter],
+        'responses': {
+            200: {'description': 'Upload found'},
+            404: {'description': 'Unknown upload id'}
+        }
+    })
+    def get(self, upload_id):
+        upload = get_upload(upload_id)
+        if upload is None:
+            return {"error": "Upload not found"}, 404
+        return upload, 200
+
+    @swag_from({
+        'summary': 'Send a byte range',
+        'description': 'Appends the request body at the range given by "Content-Range: bytes start-end/total". The range must start at the current offset.',
+        'consumes': ['application/octet-stream'],
+        'parameters': [
+            upload_id_parameter,
+            {
+                'name': 'Content-Range',
+                'in': 'header',
+                'type': 'string',
+                'required': True,
+                'description': 'bytes start-end/total'
+            }
+        ],
+        'responses': {
+            200: {'description': 'Range stored; status is completed or failed after the last range'},
+            400: {'description': 'Invalid range'},
+            404: {'description': 'Unknown upload id'},
+            409: {'description': 'Range does not start at the current offset'}
+        }
+    })
+    def put(self, upload_id):
+        content_range = parse_content_range_header(request.headers.get("Content-Range"))
+        if content_range is None or content_range.units != "bytes" or content_range.start is None:
+            return {"error": "A 'Content-Range: bytes start-end/total' header is required"}, 400
+
+        length = content_range.stop - content_range.start
+        try:
+            upload = write_range(
+                upload_id, content_range.start, length, request.stream, total=content_range.length
+            )
+        except UploadConflict as e:
+            current = get_upload(upload_id)
+            return {"error": str(e), "offset": current["offset"]}, 409
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if upload is None:
+            return {"error": "Upload not found"}, 404
+
+        if upload["status"] == "completed":
+            upload.update(submit_ingest_jobs(upload["file_path"], upload["pyramid"], upload["convert"]))
+        return upload, 200
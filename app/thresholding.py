@@ -0,0 +1,106 @@
+"""Otsu and multi-Otsu threshold segmentation from streaming histograms.
+
+Thresholds are computed from histograms accumulated chunk by chunk in one
+parallel pass, so no channel is ever held in memory:
+
+- ``global``: one set of thresholds for the whole channel, from the same
+  histogram the K-Means path uses (exact for 8 and 16 bit data).
+- ``plane``: one set per (z, time) plane, from per-plane histograms of
+  ``PLANE_BINS`` bins between the channel's min and max.
+
+Labels are then assigned chunk by chunk: a voxel's class is the number of
+thresholds its value exceeds, so two classes give ``image > threshold``.
+"""
+import numpy as np
+
+import clustering
+
+OTSU_MODES = ("global", "plane")
+OTSU_MAX_CLASSES = 5
+# Multi-Otsu scales with bins ** (classes - 1), so finer histograms are
+# merged down to this many bins for more than two classes.
+MULTI_OTSU_BINS = 256
+PLANE_BINS = 256
+
+
+def thresholds_from_histogram(values, counts, classes=2):
+    """Otsu thresholds (classes - 1 of them, ascending) of a weighted histogram."""
+    from skimage.filters import threshold_multiotsu, threshold_otsu
+
+    if not 2 <= classes <= OTSU_MAX_CLASSES:
+        raise ValueError(f"classes must be between 2 and {OTSU_MAX_CLASSES}")
+    present = counts > 0
+    values, counts = values[present], counts[present]
+    if len(values) == 0:
+        raise ValueError("Cannot threshold an empty image")
+    if len(values) < classes:
+        # Too few distinct values: each one gets its own class, the top classes stay empty.
+        return np.concatenate([values[:-1], np.repeat(values[-1], classes - len(values))]).astype(np.float64)
+    if classes == 2:
+        return np.array([threshold_otsu(hist=(counts, values))], dtype=np.float64)
+    if len(values) > MULTI_OTSU_BINS:
+        edges = np.linspace(values[0], values[-1], MULTI_OTSU_BINS + 1)
+        counts = np.histogram(values, bins=edges, weights=counts)[0]
+        values = (edges[:-1] + edges[1:]) / 2
+    return np.asarray(threshold_multiotsu(classes=classes, hist=(counts, values)), dtype=np.float64)
+
+
+def _plane_histogram_block(block, edges):
+    """Histograms of every (z, time) plane of an (x, y, z, time) block."""
+    bins = len(edges) - 1
+    planes = block.shape[2] * block.shape[3]
+    values = block.reshape(-1, planes)
+    bin_index = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, bins - 1)
+    plane_index = np.broadcast_to(np.arange(planes) * bins, values.shape)
+    valid = ~np.isnan(values) if np.issubdtype(values.dtype, np.floating) else slice(None)
+    counts = np.bincount((bin_index + plane_index)[valid].ravel(), minlength=planes * bins)
+    return counts.reshape(1, 1, block.shape[2], block.shape[3], bins)
+
+
+def plane_histograms(image):
+    """Returns (bin centers, counts of shape (Z, T, bins)) for an (X, Y, Z, T) Dask array."""
+    lowest, highest = (float(v) for v in clustering.value_range(image))
+    if lowest == highest:
+        highest = lowest + 1.0
+    edges = np.linspace(lowest, highest, PLANE_BINS + 1)
+    counts = image.map_blocks(
+        _plane_histogram_block, edges,
+        chunks=((1,) * image.numblocks[0], (1,) * image.numblocks[1]) + image.chunks[2:] + ((PLANE_BINS,),),
+        new_axis=4,
+        dtype=np.int64,
+    ).sum(axis=(0, 1))
+    return (edges[:-1] + edges[1:]) / 2, counts.compute()
+
+
+def fit_thresholds(image, classes=2, mode="global"):
+    """Thresholds for an (X, Y, Z, T) Dask array.
+
+    Returns shape (classes - 1,) in global mode and (Z, T, classes - 1) in
+    plane mode.
+    """
+    if mode not in OTSU_MODES:
+        raise ValueError(f"Unknown Otsu mode: {mode}. Choose one of {', '.join(OTSU_MODES)}")
+    if mode == "global":
+        values, counts = clustering.intensity_histogram(image)
+        return thresholds_from_histogram(values, counts.astype(np.float64), classes)
+
+    values, counts = plane_histograms(image)
+    return np.stack([
+        np.stack([thresholds_from_histogram(values, plane.astype(np.float64), classes) for plane in row])
+        for row in counts
+    ])
+
+
+def _label_block(block, thresholds, block_info=None):
+    if thresholds.ndim > 1:
+        (z0, z1), (t0, t1) = block_info[0]["array-location"][2:4]
+        thresholds = thresholds[np.newaxis, np.newaxis, z0:z1, t0:t1]
+    labels = np.zeros(block.shape, dtype=np.uint8)
+    for level in range(thresholds.shape[-1]):
+        labels += block > thresholds[..., level]
+    return labels
+
+
+def apply_thresholds(image, thresholds):
+    """Labels an (X, Y, Z, T) Dask array lazily, chunk by chunk."""
+    return image.map_blocks(_label_block, thresholds, dtype=np.uint8)
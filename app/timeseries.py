@@ -0,0 +1,245 @@
+"""Per-frame statistics of time series, updated incrementally as frames are appended.
+
+Every time point is reduced to per-channel partial aggregates: the mergeable
+moments of ``aggregates`` (count, mean, M2, min, max, NaN count) and a
+histogram of ``HISTOGRAM_BINS`` bins between the frame's min and max. The
+partials are stored one row per frame in ``frame_statistics``, so the
+curves and the global statistics of a file are merged from the rows without
+reading pixels.
+
+When a file changes, its rows are kept if it only grew along the time axis
+(same X, Y, Z, C and dtype, more frames): an appended acquisition is then
+brought up to date by reading the new frames only. Any other change, or
+``refresh=True``, recomputes every frame.
+"""
+import functools
+import logging
+
+import dask
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+import aggregates
+import metrics
+from analysis_cache import file_identity
+from database import FrameStatistics, session_scope
+from execution import heavy
+from image_cache import get_processor
+from image_processor import summarize_statistics
+
+HISTOGRAM_BINS = 256
+
+
+def geometry(shape, dtype):
+    """Identifies frames that can be merged: (X, Y, Z, C) and dtype."""
+    x, y, z, _, c = shape
+    return f"{x},{y},{z},{c}:{np.dtype(dtype).str}"
+
+
+def _is_exact(dtype):
+    return np.issubdtype(dtype, np.integer) and dtype.itemsize <= 2
+
+
+def histogram_spec(lowest, highest, integer):
+    """(start, width) of ``HISTOGRAM_BINS`` bins covering [lowest, highest]."""
+    if not np.isfinite(lowest):
+        return 0.0, 1.0
+    if integer:
+        return float(lowest), float(max(1, -(-(int(highest) - int(lowest) + 1) // HISTOGRAM_BINS)))
+    return float(lowest), float((highest - lowest) / HISTOGRAM_BINS or 1.0 / HISTOGRAM_BINS)
+
+
+def bin_counts(values, start, width, weights=None):
+    index = np.clip(np.floor((values - start) / width), 0, HISTOGRAM_BINS - 1).astype(np.int64)
+    return np.bincount(index, weights=weights, minlength=HISTOGRAM_BINS)
+
+
+def _frame_block(block, offset=None, size=None):
+    """Moments of a (..., C) block and, for 8/16 bit data, the count of every value."""
+    parts = {"moments": aggregates.channel_moments(block)}
+    if size is not None:
+        values = block.reshape(-1, block.shape[-1]).astype(np.int64) - offset
+        parts["counts"] = np.stack([np.bincount(values[:, c], minlength=size) for c in range(values.shape[1])])
+    return parts
+
+
+def _merge_frame_parts(a, b):
+    merged = {"moments": aggregates.merge_moments(a["moments"], b["moments"])}
+    if "counts" in a:
+        merged["counts"] = a["counts"] + b["counts"]
+    return merged
+
+
+def _histogram_block(block, specs):
+    values = block.reshape(-1, block.shape[-1])
+    counts = []
+    for c, (start, width) in enumerate(specs):
+        channel = values[:, c]
+        if np.issubdtype(channel.dtype, np.floating):
+            channel = channel[~np.isnan(channel)]
+        counts.append(bin_counts(channel.astype(np.float64), start, width))
+    return np.stack(counts)
+
+
+def compute_frames(image, frames):
+    """Partial aggregates of the given time points of an (X, Y, Z, T, C) Dask array.
+
+    All frames are computed together. Histograms of 8/16 bit data come from
+    exact value counts in the same pass; other dtypes need a second pass
+    over the frames, once their min and max are known.
+    """
+    image = image.rechunk({image.ndim - 1: -1})
+    dtype = image.dtype
+    integer = np.issubdtype(dtype, np.integer)
+    exact = {}
+    if _is_exact(dtype):
+        info = np.iinfo(dtype)
+        exact = {"offset": int(info.min), "size": int(info.max) - int(info.min) + 1}
+
+    block_func = functools.partial(_frame_block, **exact)
+    with metrics.stage("compute"):
+        parts = dask.compute(*[
+            aggregates.reduce_blocks(image[:, :, :, t], block_func, _merge_frame_parts) for t in frames
+        ])
+
+    specs = [
+        [histogram_spec(lowest, highest, integer) for lowest, highest in zip(part["moments"]["min"], part["moments"]["max"])]
+        for part in parts
+    ]
+    if exact:
+        values = np.arange(exact["offset"], exact["offset"] + exact["size"], dtype=np.float64)
+        histograms = [
+            np.stack([bin_counts(values, start, width, counts) for (start, width), counts in zip(spec, part["counts"])])
+            for spec, part in zip(specs, parts)
+        ]
+    else:
+        with metrics.stage("compute"):
+            histograms = dask.compute(*[
+                aggregates.reduce_blocks(image[:, :, :, t], functools.partial(_histogram_block, specs=spec), np.add)
+                for t, spec in zip(frames, specs)
+            ])
+
+    return [
+        {
+            "moments": {name: value.tolist() for name, value in part["moments"].items()},
+            "histogram": {
+                "start": [start for start, _ in spec],
+                "width": [width for _, width in spec],
+                "counts": np.asarray(histogram, dtype=np.int64).tolist(),
+            },
+        }
+        for part, spec, histogram in zip(parts, specs, histograms)
+    ]
+
+
+def _reusable(rows, frame_geometry, frames, identity):
+    if not rows or any(row.geometry != frame_geometry for row in rows):
+        return False
+    if [row.frame for row in rows] != list(range(len(rows))):
+        return False
+    if (rows[0].file_mtime, rows[0].file_size) == identity:
+        return len(rows) == frames
+    # The file changed: only an append (more frames) keeps the stored ones.
+    return len(rows) < frames
+
+
+def update_frames(file_path, refresh=False):
+    """Brings the stored frame partials of a file up to date.
+
+    Returns (frames, new_frames): the partials (dicts of moments and
+    histogram) in frame order and how many frames had to be read.
+    """
+    processor = get_processor(file_path)
+    shape, dtype = processor.image.shape, processor.image.dtype
+    frame_geometry = geometry(shape, dtype)
+    frames = shape[3]
+
+    with session_scope() as db:
+        for _ in range(2):
+            identity = file_identity(file_path)
+            with metrics.stage("db"):
+                rows = db.query(FrameStatistics).filter_by(file_path=file_path).order_by(FrameStatistics.frame).all()
+            stale = []
+            if refresh or not _reusable(rows, frame_geometry, frames, identity):
+                stale, rows = rows, []
+            new_frames = list(range(len(rows), frames))
+            if new_frames:
+                with heavy():
+                    partials = compute_frames(processor.channel_image, new_frames)
+                logging.debug(f"Frame statistics of {file_path}: {len(new_frames)} new of {frames} frames")
+            else:
+                partials = []
+
+            # Written only after computing, so no write lock is held meanwhile.
+            for row in stale:
+                db.delete(row)
+            # Deletes must reach the database before new rows reuse their frames.
+            db.flush()
+            for row in rows:
+                row.file_mtime, row.file_size = identity
+            rows += [
+                FrameStatistics(
+                    file_path=file_path, frame=t, geometry=frame_geometry,
+                    file_mtime=identity[0], file_size=identity[1], **partial,
+                )
+                for t, partial in zip(new_frames, partials)
+            ]
+            db.add_all(rows[len(rows) - len(partials):])
+            try:
+                with metrics.stage("db"):
+                    db.commit()
+                return [{"moments": row.moments, "histogram": row.histogram} for row in rows], len(new_frames)
+            except IntegrityError:
+                # Another request stored the same frames first; use theirs.
+                db.rollback()
+                refresh = False
+                logging.debug(f"Concurrent frame statistics update for {file_path}, retrying")
+        raise RuntimeError(f"Could not store frame statistics for {file_path}")
+
+
+def _merge_histograms(histograms, integer):
+    """Re-bins per-frame histograms of one channel onto bins covering all frames."""
+    used = [(start, width, counts) for start, width, counts in histograms if any(counts)]
+    if not used:
+        return {"start": 0.0, "width": 1.0, "counts": [0] * HISTOGRAM_BINS}
+    lowest = min(start for start, _, _ in used)
+    highest = max(start + width * HISTOGRAM_BINS for start, width, _ in used) - (1 if integer else 0)
+    start, width = histogram_spec(lowest, highest, integer)
+    counts = sum(
+        bin_counts(frame_start + (np.arange(HISTOGRAM_BINS) + 0.5) * frame_width, start, width, frame_counts)
+        for frame_start, frame_width, frame_counts in used
+    )
+    return {"start": start, "width": width, "counts": counts.astype(np.int64).tolist()}
+
+
+def summarize_timeseries(frames, dtype, histograms=False):
+    """The /statistics/timeseries response: per-frame curves and merged global statistics.
+
+    Histograms are given as ``start``, bin ``width`` and ``counts``; the
+    global one re-bins the frames' histograms, so it is exact only where
+    their bins line up (e.g. 8 bit data).
+    """
+    integer = np.issubdtype(np.dtype(dtype), np.integer)
+    moments = [{name: np.asarray(value) for name, value in frame["moments"].items()} for frame in frames]
+    frame_stats = [summarize_statistics(m) for m in moments]
+    channels = len(moments[0]["count"]) if moments else 0
+
+    timeseries, statistics = {}, summarize_statistics(aggregates.merge_all(moments)) if moments else {}
+    for c in range(channels):
+        name = f"Channel {c}"
+        curves = {
+            field: [stats[name][field] for stats in frame_stats]
+            for field in ("mean", "std", "min", "max", "count", "nan_count")
+        }
+        channel_histograms = [
+            (frame["histogram"]["start"][c], frame["histogram"]["width"][c], frame["histogram"]["counts"][c])
+            for frame in frames
+        ]
+        if histograms:
+            curves["histogram"] = [
+                {"start": start, "width": width, "counts": counts} for start, width, counts in channel_histograms
+            ]
+        timeseries[name] = curves
+        statistics[name]["histogram"] = _merge_histograms(channel_histograms, integer)
+
+    return {"frames": len(frames), "timeseries": timeseries, "statistics": statistics}
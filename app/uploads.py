@@ -0,0 +1,247 @@
+"""Streaming ingestion of uploaded TIFF files.
+
+Uploads are copied to disk in ``UPLOAD_CHUNK_BYTES`` pieces, hashing them on
+the way when a checksum was supplied, so memory use does not grow with the
+file. Validation only parses the TIFF header and series layout; no pixel
+data is decoded.
+
+Resumable uploads are created with a declared size (and optional SHA-256)
+and filled with sequential byte-range PUTs into ``data/uploads/<id>.part``.
+The received offset is the size of that file, so an interrupted upload
+resumes from what actually reached the disk, also after a restart.
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+import tifffile as tiff
+from werkzeug.utils import secure_filename
+
+from database import session_scope, ImageMetadata, Upload
+from image_cache import image_cache
+import metrics
+
+UPLOAD_FOLDER = "data/"
+PARTS_FOLDER = os.path.join(UPLOAD_FOLDER, "uploads")
+UPLOAD_CHUNK_BYTES = 8 * 1024**2
+# Whether uploads are converted to a Zarr working copy unless the request says otherwise.
+CONVERT_ON_INGEST = os.environ.get("CONVERT_ON_INGEST", "true").lower() == "true"
+ALLOWED_EXTENSIONS = {"tif", "tiff"}
+
+# upload id -> [lock, number of requests using it]
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+class UploadConflict(ValueError):
+    """A byte range does not start at the upload's current offset."""
+
+
+def allowed_file(filename):
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def copy_stream(stream, out, hasher=None, limit=None):
+    """Copies ``stream`` to ``out`` in bounded chunks; returns the number of bytes copied."""
+    copied = 0
+    while limit is None or copied < limit:
+        size = UPLOAD_CHUNK_BYTES if limit is None else min(UPLOAD_CHUNK_BYTES, limit - copied)
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        out.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+        copied += len(chunk)
+    return copied
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def read_header(path):
+    """Returns (shape, dtype) of the first TIFF series, reading tags only."""
+    try:
+        with tiff.TiffFile(path) as tif:
+            series = tif.series[0]
+            shape, dtype = tuple(series.shape), series.dtype
+    except (tiff.TiffFileError, IndexError) as e:
+        raise ValueError(f"Not a readable TIFF file: {e}")
+    if len(shape) != 5:
+        raise ValueError(f"Image must be 5D (X, Y, Z, Time, Channel), got shape {shape}")
+    return shape, dtype
+
+
+def ingest(temp_path, filename):
+    """Validates a fully received file and moves it into place; returns its path.
+
+    The temporary file is removed if validation fails.
+    """
+    file_path = os.path.join(UPLOAD_FOLDER, secure_filename(filename))
+    try:
+        shape, dtype = read_header(temp_path)
+    except ValueError:
+        os.remove(temp_path)
+        raise
+
+    # Swap the file in atomically, so requests still reading a cached
+    # handle of the old file are not disturbed.
+    os.replace(temp_path, file_path)
+    image_cache.invalidate(file_path)
+    logging.debug(f"File saved at {file_path}")
+    record_metadata(file_path, shape, dtype)
+    return file_path
+
+
+def record_metadata(file_path, shape, dtype):
+    height, width, depth, time_frames, channels = shape
+
+    with metrics.stage("db"), session_scope() as db:
+        existing_entry = db.query(ImageMetadata).filter_by(file_path=file_path).first()
+        if existing_entry:
+            logging.info(f"Updating existing metadata for {file_path}")
+            existing_entry.width = width
+            existing_entry.height = height
+            existing_entry.depth = depth
+            existing_entry.time_frames = time_frames
+            existing_entry.channels = channels
+            existing_entry.dtype = str(dtype)
+        else:
+            logging.info(f"Inserting new metadata for {file_path}")
+            db.add(ImageMetadata(
+                file_path=file_path,
+                width=width,
+                height=height,
+                depth=depth,
+                time_frames=time_frames,
+                channels=channels,
+                dtype=str(dtype),
+            ))
+        db.commit()
+
+
+def part_path(upload_id):
+    return os.path.join(PARTS_FOLDER, f"{upload_id}.part")
+
+
+def received_bytes(upload_id):
+    try:
+        return os.path.getsize(part_path(upload_id))
+    except FileNotFoundError:
+        return 0
+
+
+def upload_to_dict(upload):
+    return {
+        "upload_id": upload.id,
+        "file_name": upload.file_name,
+        "size": upload.total_size,
+        "offset": upload.total_size if upload.status == "completed" else received_bytes(upload.id),
+        "status": upload.status,
+        "pyramid": upload.pyramid,
+        "convert": upload.convert,
+        "file_path": upload.file_path,
+        "error": upload.error,
+    }
+
+
+def create_upload(file_name, total_size, sha256=None, pyramid=None, convert=CONVERT_ON_INGEST):
+    os.makedirs(PARTS_FOLDER, exist_ok=True)
+    upload = Upload(
+        id=uuid.uuid4().hex,
+        file_name=file_name,
+        total_size=total_size,
+        sha256=sha256.lower() if sha256 else None,
+        pyramid=pyramid,
+        convert=convert,
+        status="uploading",
+    )
+    open(part_path(upload.id), "wb").close()
+    with session_scope() as db:
+        db.add(upload)
+        db.commit()
+        return upload_to_dict(upload)
+
+
+def get_upload(upload_id):
+    with session_scope() as db:
+        upload = db.get(Upload, upload_id)
+        return upload_to_dict(upload) if upload is not None else None
+
+
+@contextmanager
+def _upload_lock(upload_id):
+    """Serializes the writes of one upload; the entry is dropped once unused."""
+    with _locks_guard:
+        entry = _locks.setdefault(upload_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _locks[upload_id]
+
+
+def write_range(upload_id, start, length, stream, total=None):
+    """Appends ``length`` bytes from ``stream`` at ``start``; returns the upload's state.
+
+    Ranges must be sent in order: ``start`` has to equal the bytes received
+    so far, otherwise UploadConflict is raised and the client should resume
+    from the current offset. The last range triggers checksum verification
+    and ingestion. No database session is held while the body streams in,
+    so slow clients do not tie up connections.
+    """
+    with _upload_lock(upload_id):
+        with session_scope() as db:
+            upload = db.get(Upload, upload_id)
+        if upload is None:
+            return None
+        if upload.status != "uploading":
+            raise UploadConflict(f"Upload is already {upload.status}")
+        offset = received_bytes(upload_id)
+        if start != offset:
+            raise UploadConflict(f"Range starts at {start}, expected {offset}")
+        if total is not None and total != upload.total_size:
+            raise ValueError(f"Range total {total} does not match the declared size {upload.total_size}")
+        if start + length > upload.total_size:
+            raise ValueError(f"Range ends past the declared size of {upload.total_size} bytes")
+
+        with open(part_path(upload_id), "ab") as out:
+            copied = copy_stream(stream, out, limit=length)
+        if copied != length:
+            # The bytes that arrived are kept; the client resumes after them.
+            raise ValueError(f"Received {copied} of {length} bytes, resume at offset {offset + copied}")
+
+        if offset + length < upload.total_size:
+            return upload_to_dict(upload)
+
+        outcome = _complete(upload)
+        with session_scope() as db:
+            upload = db.get(Upload, upload_id)
+            for name, value in outcome.items():
+                setattr(upload, name, value)
+            db.commit()
+            return upload_to_dict(upload)
+
+
+def _complete(upload):
+    """Verifies and ingests a fully received upload; returns the fields to store."""
+    temp_path = part_path(upload.id)
+    if upload.sha256 and file_sha256(temp_path) != upload.sha256:
+        os.remove(temp_path)
+        return {"status": "failed", "error": "Checksum mismatch"}
+    try:
+        return {"status": "completed", "file_path": ingest(temp_path, upload.file_name)}
+    except ValueError as e:
+        return {"status": "failed", "error": str(e)}
@@ -0,0 +1,171 @@
+"""Chunked, compressed Zarr working copies of uploaded TIFFs.
+
+TIFF pages rarely match how the service reads an image, so ingestion can
+rechunk it into a Zarr group next to the file (``<image>.zarr``) holding one
+array per access pattern:
+
+- ``planes``: (tile, tile, 1, 1, 1) chunks. A slice or region at fixed
+  z/time/channel reads only the tiles of that plane, and K-Means on one
+  channel reads only that channel.
+- ``channels``: X slabs with all other axes, including channels, whole.
+  This is the layout the statistics and PCA reductions consume, and their
+  chunk-wise outputs map onto contiguous runs of the output file.
+
+Compression is configurable (``ZARR_COMPRESSION``). Like pyramids, the
+group records the source file's identity and is ignored once it is stale.
+"""
+import logging
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+
+import dask.array as da
+import numpy as np
+import zarr
+from dask.array.core import normalize_chunks
+from dask.base import tokenize
+from zarr.codecs import BloscCodec, ZstdCodec
+
+import metrics
+
+LAYOUTS = ("planes", "channels")
+COMPRESSIONS = {
+    "none": None,
+    "blosc-lz4": lambda: BloscCodec(cname="lz4", clevel=5, shuffle="shuffle"),
+    "blosc-zstd": lambda: BloscCodec(cname="zstd", clevel=3, shuffle="shuffle"),
+    "zstd": lambda: ZstdCodec(level=3),
+}
+ZARR_COMPRESSION = os.environ.get("ZARR_COMPRESSION", "blosc-lz4")
+PLANE_TILE = 512
+# Target size of one "channels" chunk.
+CHANNEL_CHUNK_BYTES = 16 * 1024**2
+
+
+def store_path(file_path):
+    return f"{file_path}.zarr"
+
+
+def source_identity(file_path):
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def store_stamp(file_path):
+    """Changes whenever the Zarr working copy of ``file_path`` is (re)built."""
+    try:
+        stat = os.stat(store_path(file_path))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+@contextmanager
+def atomic_group(path):
+    """Yields a group under a temporary name; it replaces ``path`` on success.
+
+    The old group is renamed aside before the new one takes its place and is
+    deleted only afterwards: deleting it in place would let concurrent
+    readers see missing chunks, which Zarr silently reads as fill values.
+    """
+    suffix = uuid.uuid4().hex
+    temp_path, old_path = f"{path}.{suffix}.tmp", f"{path}.{suffix}.old"
+    try:
+        yield zarr.open_group(temp_path, mode="w")
+        try:
+            os.replace(path, old_path)
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, path)
+    finally:
+        for leftover in (temp_path, old_path):
+            if os.path.exists(leftover):
+                shutil.rmtree(leftover)
+
+
+class ZarrReader:
+    """Array view of a Zarr array that records its reads in the metrics."""
+
+    def __init__(self, array):
+        self._array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.ndim = array.ndim
+
+    def __getitem__(self, key):
+        with metrics.stage("read"):
+            block = self._array[key]
+        metrics.record_bytes_read(block.nbytes, "zarr")
+        return block
+
+
+def from_zarr(array, chunks=None):
+    """Like ``da.from_zarr``, with reads recorded in the metrics."""
+    chunks = array.chunks if chunks is None else chunks
+    name = "from-zarr-" + tokenize(array, chunks)
+    return da.from_array(ZarrReader(array), chunks=chunks, name=name)
+
+
+def layout_chunks(layout, shape, dtype):
+    if layout == "planes":
+        return tuple(min(n, PLANE_TILE) for n in shape[:2]) + (1,) * (len(shape) - 2)
+    if layout == "channels":
+        # Slabs along X with every other axis whole: chunks are contiguous
+        # in C order, so outputs written chunk by chunk stay sequential too.
+        chunks = normalize_chunks(
+            ("auto",) + (-1,) * (len(shape) - 1), shape,
+            limit=CHANNEL_CHUNK_BYTES, dtype=np.dtype(dtype),
+        )
+        return tuple(sizes[0] for sizes in chunks)
+    raise ValueError(f"Unknown layout: {layout}")
+
+
+def convert_to_zarr(file_path, image, layouts=LAYOUTS, compression=ZARR_COMPRESSION):
+    """Writes ``image`` (the Dask array of ``file_path``) in the given layouts; returns the store path."""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}', expected one of {sorted(COMPRESSIONS)}")
+    path = store_path(file_path)
+    file_mtime, file_size = source_identity(file_path)
+    codec = COMPRESSIONS[compression]
+
+    with atomic_group(path) as group:
+        for layout in layouts:
+            chunks = layout_chunks(layout, image.shape, image.dtype)
+            target = group.create_array(
+                layout, shape=image.shape, dtype=image.dtype, chunks=chunks,
+                compressors=[codec()] if codec else None,
+            )
+            # Write a few storage chunks per task to keep the graph small.
+            write_chunks = normalize_chunks("auto", image.shape, dtype=image.dtype, previous_chunks=chunks)
+            da.store(image.rechunk(write_chunks), target, lock=False)
+            logging.debug(f"Wrote {layout} layout of {file_path} with chunks {chunks}")
+        group.attrs.update({
+            "source": {"file_mtime": file_mtime, "file_size": file_size},
+            "layouts": list(layouts),
+            "compression": compression,
+        })
+    return path
+
+
+def open_store(file_path):
+    """Returns {layout: Dask array} of an up-to-date working copy, or {}."""
+    path = store_path(file_path)
+    if not os.path.exists(path):
+        return {}
+    try:
+        group = zarr.open_group(path, mode="r")
+        source = group.attrs.get("source", {})
+        if (source.get("file_mtime"), source.get("file_size")) != source_identity(file_path):
+            return {}
+        layouts = {}
+        for layout in group.attrs["layouts"]:
+            array = group[layout]
+            chunks = array.chunks
+            if layout == "planes":
+                # Tasks span several tiles; slicing still reads only the tiles it needs.
+                chunks = normalize_chunks("auto", array.shape, dtype=array.dtype, previous_chunks=chunks)
+            layouts[layout] = from_zarr(array, chunks=chunks)
+        return layouts
+    except (KeyError, ValueError, OSError) as e:
+        logging.warning(f"Ignoring unreadable Zarr store {path}: {e}")
+        return {}
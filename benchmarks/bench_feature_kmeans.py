@@ -0,0 +1,80 @@
+"""Multi-channel K-Means against channel count and voxel count.
+
+Usage:
+    python benchmarks/bench_feature_kmeans.py --sizes 512,1024,2048 --channels 2,4,8
+    python benchmarks/bench_feature_kmeans.py --sizes 256 --channels 3 --cv2
+
+Each size N generates a lazy (N, N, 16, 1, C) Gaussian mixture whose
+clusters differ across channels, so the numbers measure sampling, fitting
+and labelling rather than TIFF decoding. "sample" clusters all channels,
+"sample+pca" their first ``--components`` principal components; "cv2" is
+the in-memory ``cv2.kmeans`` reference (small volumes only). Labels are
+written to a throwaway memory-mapped TIFF, as the /segment/kmeans route
+does. Peak memory should stay flat as N grows.
+"""
+import argparse
+import os
+import tempfile
+
+from common import format_bytes, measure, processor_for
+
+import dask.array as da
+import numpy as np
+from image_processor import save_image
+
+
+def _mixture_block(block, k, block_info=None):
+    rng = np.random.default_rng(block_info[0]["chunk-location"] if block_info else 0)
+    channels = block.shape[-1]
+    means = np.random.default_rng(channels).integers(30, 225, size=(k, channels))
+    component = rng.integers(0, k, size=block.shape[:-1])
+    values = rng.normal(means[component], 15)
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def synthetic_image(shape, k):
+    return da.zeros(shape, dtype=np.uint8, chunks=(256, 256, -1, -1, -1)).map_blocks(
+        _mixture_block, k, dtype=np.uint8
+    )
+
+
+def segment(shape, k, method, components, output_path):
+    labels = processor_for(synthetic_image(shape, k)).apply_kmeans_segmentation(
+        k=k, method=method, channels="all", components=components
+    )
+    save_image(labels, output_path, dtype="uint8")
+    return int(np.prod(shape[:4]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="512,1024")
+    parser.add_argument("--channels", default="2,4,8")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--components", type=int, default=2)
+    parser.add_argument("--cv2", action="store_true", help="also run the in-memory cv2 reference")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    output_path = os.path.join(args.workdir, "bench_feature_kmeans_labels.tif")
+    print(f"{'voxels':>14}{'channels':>10}{'path':>12}{'seconds':>10}{'Mvox/s':>10}{'peak anon RSS':>16}")
+    for size in (int(part) for part in args.sizes.split(",")):
+        for channels in (int(part) for part in args.channels.split(",")):
+            shape = (size, size, 16, 1, channels)
+            variants = [("sample", "sample", None)]
+            if args.components < channels:
+                variants.append(("sample+pca", "sample", args.components))
+            if args.cv2:
+                variants.append(("cv2", "cv2", None))
+            for label, method, components in variants:
+                report = measure(segment, shape, args.k, method, components, output_path)
+                voxels = report["result"]
+                print(
+                    f"{voxels:>14,}{channels:>10}{label:>12}{report['seconds']:>10.2f}"
+                    f"{voxels / report['seconds'] / 1e6:>10.2f}"
+                    f"{format_bytes(report['peak_anon_rss']):>16}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Throughput and memory of the /filter pipeline against chunk size.
+
+Usage:
+    python benchmarks/bench_filters.py --shape 4096,4096,8,1,1 --chunks 256,512,1024,2048
+    python benchmarks/bench_filters.py --filters gaussian:2,median:3,background:16 --segment
+
+The input is a synthetic uint8 volume generated lazily by Dask with (N, N)
+chunks in X and Y, so the numbers measure filtering, halo exchange and
+writing rather than TIFF decoding. The filtered image is written to a
+throwaway memory-mapped TIFF, as the /filter route does; with --segment it
+is instead fed straight into Otsu segmentation, as /segment/otsu?filters=
+does.
+"""
+import argparse
+import os
+import tempfile
+
+from common import format_bytes, measure, parse_shape, processor_for
+
+import dask.array as da
+import numpy as np
+from image_processor import save_image
+
+
+def _noise_block(block, block_info=None):
+    rng = np.random.default_rng(block_info[0]["chunk-location"] if block_info else 0)
+    return rng.integers(0, 256, size=block.shape, dtype=np.uint8)
+
+
+def synthetic_image(shape, chunk):
+    return da.zeros(shape, dtype=np.uint8, chunks=(chunk, chunk, 1, 1, 1)).map_blocks(
+        _noise_block, dtype=np.uint8
+    )
+
+
+def run_pipeline(shape, chunk, filters, segment, output_path):
+    processor = processor_for(synthetic_image(shape, chunk))
+    if segment:
+        result = processor.apply_otsu_segmentation(0, filters=filters)
+    else:
+        result = processor.filter_image(filters)
+    save_image(result, output_path)
+    return int(np.prod(shape))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=parse_shape, default=(4096, 4096, 8, 1, 1))
+    parser.add_argument("--chunks", type=parse_shape, default=(256, 512, 1024, 2048))
+    parser.add_argument("--filters", default="gaussian:2,median:3")
+    parser.add_argument("--segment", action="store_true")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    output_path = os.path.join(args.workdir, "bench_filters_output.tif")
+    print(f"pipeline: {args.filters}{' -> otsu' if args.segment else ''}")
+    print(f"{'chunk':>8}{'voxels':>16}{'seconds':>10}{'Mvox/s':>10}{'peak anon RSS':>16}")
+    for chunk in args.chunks:
+        report = measure(run_pipeline, args.shape, chunk, args.filters, args.segment, output_path)
+        voxels = report["result"]
+        print(
+            f"{chunk:>8}{voxels:>16,}{report['seconds']:>10.2f}"
+            f"{voxels / report['seconds'] / 1e6:>10.2f}"
+            f"{format_bytes(report['peak_anon_rss']):>16}"
+        )
+    os.remove(output_path)
+
+
+if __name__ == "__main__":
+    main()
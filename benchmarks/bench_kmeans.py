@@ -0,0 +1,64 @@
+"""K-Means segmentation at 10^8+ voxels: histogram engine vs cv2 reference.
+
+Usage:
+    python benchmarks/bench_kmeans.py --shape 2000,2000,25,1,1
+    python benchmarks/bench_kmeans.py --shape 4000,4000,25,1,1 --skip-cv2
+
+The input is a synthetic Gaussian mixture generated lazily by Dask, so the
+numbers measure clustering and labelling rather than TIFF decoding. Labels
+are written to a throwaway memory-mapped TIFF, as the /segment/kmeans route
+does.
+"""
+import argparse
+import os
+import tempfile
+
+from common import format_bytes, measure, parse_shape, processor_for
+
+import dask.array as da
+import numpy as np
+from image_processor import save_image
+
+
+def _mixture_block(block, block_info=None):
+    rng = np.random.default_rng(block_info[0]["chunk-location"] if block_info else 0)
+    component = rng.integers(0, 3, size=block.shape)
+    values = rng.normal(np.array([50, 120, 200])[component], 15)
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def synthetic_image(shape):
+    return da.zeros(shape, dtype=np.uint8, chunks=(256, 256, -1, -1, -1)).map_blocks(
+        _mixture_block, dtype=np.uint8
+    )
+
+
+def segment(shape, k, method, output_path):
+    labels = processor_for(synthetic_image(shape)).apply_kmeans_segmentation(0, k, method=method)
+    save_image(labels, output_path, dtype="uint8")
+    return int(np.prod(shape[:3]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=parse_shape, default=(2000, 2000, 25, 1, 1))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--skip-cv2", action="store_true")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    methods = ["histogram"] if args.skip_cv2 else ["histogram", "cv2"]
+    output_path = os.path.join(args.workdir, "bench_kmeans_labels.tif")
+    print(f"{'method':<12}{'voxels':>14}{'seconds':>10}{'Mvox/s':>10}{'peak anon RSS':>16}")
+    for method in methods:
+        report = measure(segment, args.shape, args.k, method, output_path)
+        voxels = report["result"]
+        print(
+            f"{method:<12}{voxels:>14,}{report['seconds']:>10.2f}"
+            f"{voxels / report['seconds'] / 1e6:>10.2f}"
+            f"{format_bytes(report['peak_anon_rss']):>16}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Peak memory and latency of a one-plane slice: eager imread vs lazy loading.
+
+Usage:
+    python benchmarks/bench_lazy_loading.py --shape 1024,1024,20,10,3
+    python benchmarks/bench_lazy_loading.py --compression zlib
+
+"eager" is the previous ``ImageProcessor.load_large_image`` implementation
+(``tiff.imread`` wrapped in ``da.from_array``); "lazy" is the current one.
+Peak anonymous RSS excludes file-backed pages of the memory map, which the
+kernel can drop at any time, and is the number that matters for OOM kills.
+"""
+import argparse
+import os
+import tempfile
+
+from common import format_bytes, make_volume, measure, parse_shape
+
+import dask.array as da
+import tifffile as tiff
+from image_processor import ImageProcessor
+
+
+def eager_slice(path, z, time, channel):
+    image = da.from_array(tiff.imread(path), chunks="auto")
+    return image[:, :, z, time, channel].compute().shape
+
+
+def lazy_slice(path, z, time, channel):
+    return ImageProcessor(path).extract_slice(z, time, channel).shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=parse_shape, default=(1024, 1024, 20, 10, 3))
+    parser.add_argument("--dtype", default="uint8")
+    parser.add_argument("--compression", default=None, help="e.g. zlib (default: none)")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    name = "bench_lazy_{}_{}_{}.tif".format(
+        "x".join(map(str, args.shape)), args.dtype, args.compression or "raw"
+    )
+    path = make_volume(
+        os.path.join(args.workdir, name), args.shape, args.dtype, args.compression
+    )
+    print(f"{path}: {format_bytes(os.path.getsize(path))} on disk")
+
+    z, time, channel = args.shape[2] // 2, args.shape[3] // 2, args.shape[4] - 1
+    print(f"{'path':<8}{'latency':>12}{'peak RSS':>16}{'peak anon RSS':>16}")
+    for label, func in (("eager", eager_slice), ("lazy", lazy_slice)):
+        report = measure(func, path, z, time, channel)
+        print(
+            f"{label:<8}{report['seconds']:>11.3f}s"
+            f"{format_bytes(report['peak_rss']):>16}"
+            f"{format_bytes(report['peak_anon_rss']):>16}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Memory and throughput of apply_pca against voxel count.
+
+Usage:
+    python benchmarks/bench_pca.py --sizes 128,256,512 --channels 5
+    python benchmarks/bench_pca.py --sizes 1024,2048 --skip-old
+
+Each size N generates an (N, N, 8, 4, C) volume. "old" is the previous
+implementation (full ``pca.transform(reshaped.compute())``, result written
+with ``tiff.imwrite``); "streaming" is ``apply_pca`` + ``save_image`` with
+the IncrementalPCA engine and "covariance" the same with the exact
+covariance engine.
+"""
+import argparse
+import os
+import tempfile
+
+from common import format_bytes, make_volume, measure
+
+import dask.array as da
+import numpy as np
+import tifffile as tiff
+from sklearn.decomposition import IncrementalPCA
+from image_processor import ImageProcessor, save_image
+
+
+def old_pca(path, output_path, components):
+    image = ImageProcessor(path).image
+    X, Y, Z, T, C = image.shape
+    reshaped = da.nan_to_num(image.reshape(-1, C))
+    pca = IncrementalPCA(n_components=components)
+
+    def pca_fit(chunk):
+        pca.partial_fit(chunk)
+        return chunk
+
+    reshaped = reshaped.map_blocks(pca_fit, dtype=reshaped.dtype)
+    reduced = pca.transform(reshaped.compute()).reshape(X, Y, Z, T, components)
+    tiff.imwrite(output_path, reduced.astype(np.uint8))
+
+
+def streaming_pca(path, output_path, components):
+    reduced = ImageProcessor(path).apply_pca(components)
+    save_image(reduced, output_path, dtype=np.uint8)
+
+
+def covariance_pca(path, output_path, components):
+    reduced = ImageProcessor(path).apply_pca(components, method="covariance")
+    save_image(reduced, output_path, dtype=np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="128,256,512")
+    parser.add_argument("--channels", type=int, default=5)
+    parser.add_argument("--components", type=int, default=3)
+    parser.add_argument("--dtype", default="uint16")
+    parser.add_argument("--skip-old", action="store_true")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    variants = [("streaming", streaming_pca), ("covariance", covariance_pca)]
+    if not args.skip_old:
+        variants.insert(0, ("old", old_pca))
+
+    print(f"{'voxels':>14}{'path':>12}{'seconds':>10}{'Mvox/s':>10}{'peak anon RSS':>16}")
+    for size in (int(part) for part in args.sizes.split(",")):
+        shape = (size, size, 8, 4, args.channels)
+        name = "bench_pca_{}_{}.tif".format("x".join(map(str, shape)), args.dtype)
+        path = make_volume(os.path.join(args.workdir, name), shape, args.dtype)
+        voxels = int(np.prod(shape[:-1]))
+        for label, func in variants:
+            output_path = os.path.join(args.workdir, f"bench_pca_output_{label}.tif")
+            report = measure(func, path, output_path, args.components)
+            print(
+                f"{voxels:>14,}{label:>12}{report['seconds']:>10.2f}"
+                f"{voxels / report['seconds'] / 1e6:>10.2f}"
+                f"{format_bytes(report['peak_anon_rss']):>16}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Cold start of the service: import time, app creation and first requests.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --budget 2.5
+
+Every run is a fresh interpreter that imports ``main``, builds the app with
+``create_app()`` and serves a first /metadata and /slice request through the
+Flask test client. The report lists the median of each phase and the
+analysis libraries that were loaded along the way, which should be none:
+they are imported by the operations that need them.
+
+With --budget, exits with status 1 if importing and building the app takes
+longer than the budget (median, in seconds) or loads an analysis library.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import APP_DIR, make_volume
+
+# Imported on first use by PCA, segmentation, filters and PNG encoding.
+LAZY_MODULES = ("cv2", "sklearn", "skimage", "dask_image", "scipy.stats", "scipy.ndimage")
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+client = app.test_client()
+assert client.get("/metadata", query_string={"file_path": sys.argv[1]}).status_code == 200
+metadata = time.perf_counter()
+assert client.get("/slice", query_string={"file_path": sys.argv[1], "z": 0, "time": 0, "channel": 0}).status_code == 200
+sliced = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "create_app": created - imported,
+    "first_metadata": metadata - created,
+    "first_slice": sliced - metadata,
+    "loaded": [name for name in sys.argv[2].split(",") if name in sys.modules],
+}))
+"""
+
+
+def startup_run(path, workdir):
+    """One cold start in a fresh interpreter; returns its phase timings."""
+    env = {**os.environ, "PYTHONPATH": APP_DIR, "ARTIFACT_DIR": os.path.join(workdir, "bench_startup_artifacts")}
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, path, ",".join(LAZY_MODULES)],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=None, help="seconds allowed for import + create_app")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    path = make_volume(os.path.join(args.workdir, "bench_startup.tif"), (256, 256, 4, 2, 2))
+    runs = [startup_run(path, args.workdir) for _ in range(args.runs)]
+
+    phases = ("import", "create_app", "first_metadata", "first_slice")
+    print(f"{'phase':<16}{'median s':>10}{'max s':>10}")
+    for phase in phases:
+        values = [run[phase] for run in runs]
+        print(f"{phase:<16}{statistics.median(values):>10.3f}{max(values):>10.3f}")
+    startup = statistics.median(run["import"] + run["create_app"] for run in runs)
+    loaded = sorted({name for run in runs for name in run["loaded"]})
+    print(f"import + create_app: {startup:.3f} s; analysis libraries loaded: {', '.join(loaded) or 'none'}")
+
+    if args.budget is not None and (startup > args.budget or loaded):
+        print(f"FAILED: budget {args.budget:.3f} s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Benchmark suite for every ImageProcessor operation and its HTTP endpoint.
+
+Usage:
+    python benchmarks/bench_suite.py --output baseline.json
+    python benchmarks/bench_suite.py --compare baseline.json --output current.json
+    python benchmarks/bench_suite.py --compare baseline.json --input current.json
+
+Synthetic volumes are generated for every combination of ``--shapes``,
+``--dtypes`` and ``--compressions`` (TIFF compressions, plus ``zarr`` for
+an uncompressed TIFF with its Zarr working copy). Fixed seeds make the
+inputs identical between runs.
+
+Each operation (metadata, slice, statistics, pca, kmeans) is timed in two
+modes, each in a fresh process:
+
+- ``inprocess``: ``ImageProcessor(path)`` and the operation, as a library
+  caller would run it; outputs are streamed to files like the routes do.
+- ``http``: the matching endpoint through the Flask test client, including
+  routing, caching of open images, encoding and database writes. Cached
+  results are bypassed (``refresh=true``, artifacts deleted after each
+  request) so every request does the work.
+
+Results hold latency percentiles, throughput (pixel bytes read per second,
+from the metrics trace) and peak RSS. With ``--compare`` the median latency
+and peak RSS of every case are checked against a baseline, and the script
+exits with status 1 if any got worse by more than ``--threshold``.
+
+Run it from the repository root: the HTTP mode uses the service's database.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from common import format_bytes, make_volume, measure, parse_shape
+
+import dask
+import numpy as np
+
+OPERATIONS = ("metadata", "slice", "statistics", "pca", "kmeans")
+MODES = ("inprocess", "http")
+PCA_METHOD = "covariance"
+
+
+def _inprocess(operation, path, shape, workdir):
+    from image_processor import ImageProcessor, save_image
+
+    processor = ImageProcessor(path)
+    if operation == "metadata":
+        processor.get_metadata()
+    elif operation == "slice":
+        processor.extract_slice(shape[2] // 2, shape[3] // 2, 0)
+    elif operation == "statistics":
+        processor.compute_statistics()
+    elif operation == "pca":
+        reduced = processor.apply_pca(2, method=PCA_METHOD)
+        save_image(reduced, os.path.join(workdir, "bench_suite_pca.tif"), dtype=np.uint8)
+    elif operation == "kmeans":
+        labels = processor.apply_kmeans_segmentation(0, 3)
+        save_image(labels, os.path.join(workdir, "bench_suite_kmeans.tif"), dtype="uint8")
+
+
+def _http(client, operation, path, shape):
+    headers = {"X-Timing": "1"}
+    if operation == "metadata":
+        return client.get("/metadata", query_string={"file_path": path, "refresh": "true"}, headers=headers)
+    if operation == "slice":
+        params = {"file_path": path, "z": shape[2] // 2, "time": shape[3] // 2, "channel": 0}
+        return client.get("/slice", query_string=params, headers=headers)
+    if operation == "statistics":
+        return client.get("/statistics", query_string={"file_path": path, "refresh": "true"}, headers=headers)
+    if operation == "pca":
+        payload = {"file_path": path, "components": 2, "method": PCA_METHOD}
+        return client.post("/analyze", json=payload, headers=headers)
+    if operation == "kmeans":
+        params = {"file_path": path, "channel": 0, "k": 3}
+        return client.get("/segment/kmeans", query_string=params, headers=headers)
+    raise ValueError(f"Unknown operation: {operation}")
+
+
+def _timing_bytes(header):
+    fields = dict(part.split("=", 1) for part in header.split(", ") if ";" not in part)
+    return int(fields["bytes_read"])
+
+
+def run_inprocess(operation, path, shape, workdir, repeat, warmup):
+    """Child process: returns (latencies, bytes read) of ``repeat`` library calls."""
+    import metrics
+
+    seconds, bytes_read = [], []
+    for run in range(warmup + repeat):
+        with metrics.trace() as trace:
+            start = time.perf_counter()
+            _inprocess(operation, path, shape, workdir)
+            elapsed = time.perf_counter() - start
+        if run >= warmup:
+            seconds.append(elapsed)
+            bytes_read.append(trace.bytes_read)
+    return seconds, bytes_read
+
+
+def run_http(operation, path, shape, workdir, repeat, warmup):
+    """Child process: returns (latencies, bytes read) of ``repeat`` requests."""
+    # Keep benchmark outputs out of the service's artifact store.
+    os.environ["ARTIFACT_DIR"] = os.path.join(workdir, "bench_suite_artifacts")
+    from main import create_app
+
+    # The routes log every request; keep the report readable.
+    logging.getLogger().setLevel(logging.WARNING)
+    client = create_app().test_client()
+    seconds, bytes_read = [], []
+    for run in range(warmup + repeat):
+        start = time.perf_counter()
+        response = _http(client, operation, path, shape)
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"{operation} returned {response.status_code}: {response.get_data(as_text=True)}")
+        if response.is_json and "file_path" in response.json:
+            os.remove(response.json["file_path"])
+        if run >= warmup:
+            seconds.append(elapsed)
+            bytes_read.append(_timing_bytes(response.headers["X-Timing"]))
+    return seconds, bytes_read
+
+
+RUNNERS = {"inprocess": run_inprocess, "http": run_http}
+
+
+def case_key(operation, mode, shape, dtype, compression):
+    return f"{operation}/{mode}/{'x'.join(map(str, shape))}/{dtype}/{compression}"
+
+
+def summarize(report):
+    seconds, bytes_read = report["result"]
+    p50 = float(np.percentile(seconds, 50))
+    return {
+        "samples": seconds,
+        "p50": p50,
+        "p90": float(np.percentile(seconds, 90)),
+        "p99": float(np.percentile(seconds, 99)),
+        "mean": float(np.mean(seconds)),
+        "mb_per_s": float(np.median(bytes_read)) / p50 / 1e6 if p50 else None,
+        "peak_rss": report["peak_rss"],
+        "peak_anon_rss": report["peak_anon_rss"],
+    }
+
+
+def prepare(workdir, shape, dtype, compression):
+    name = "bench_suite_{}_{}_{}.tif".format("x".join(map(str, shape)), dtype, compression)
+    path = os.path.join(workdir, name)
+    if compression == "zarr":
+        from image_processor import ImageProcessor
+        from zarr_store import convert_to_zarr, open_store
+
+        make_volume(path, shape, dtype)
+        if not open_store(path):
+            convert_to_zarr(path, ImageProcessor(path).image)
+    else:
+        make_volume(path, shape, dtype, None if compression == "none" else compression)
+    return path
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "dask": dask.__version__,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run_suite(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    results = {}
+    for shape in args.shapes:
+        for dtype in args.dtypes:
+            for compression in args.compressions:
+                path = prepare(args.workdir, shape, dtype, compression)
+                for operation in args.operations:
+                    for mode in args.modes:
+                        key = case_key(operation, mode, shape, dtype, compression)
+                        report = measure(
+                            RUNNERS[mode], operation, path, shape, args.workdir, args.repeat, args.warmup
+                        )
+                        results[key] = summarize(report)
+                        row = results[key]
+                        print(
+                            f"{key:<52}{row['p50']:>9.3f}{row['p90']:>9.3f}"
+                            f"{row['mb_per_s'] or 0:>10.1f}{format_bytes(row['peak_rss']):>12}"
+                        )
+    return results
+
+
+def compare(baseline, current, threshold):
+    """Prints the change of every shared case; returns the keys that regressed."""
+    regressions = []
+    print(f"{'case':<52}{'p50 before':>12}{'p50 after':>12}{'change':>9}{'RSS change':>12}")
+    for key, new in current.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        latency = new["p50"] / old["p50"] - 1 if old["p50"] else 0.0
+        memory = new["peak_rss"] / old["peak_rss"] - 1 if old["peak_rss"] else 0.0
+        flag = latency > threshold or memory > threshold
+        if flag:
+            regressions.append(key)
+        print(
+            f"{key:<52}{old['p50']:>12.3f}{new['p50']:>12.3f}{latency:>+9.0%}{memory:>+12.0%}"
+            + ("  REGRESSION" if flag else "")
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", type=lambda text: [parse_shape(s) for s in text.split(";")],
+                        default=[(256, 256, 8, 4, 3), (1024, 1024, 8, 4, 3)],
+                        help='semicolon separated, e.g. "256,256,8,4,3;1024,1024,8,4,3"')
+    parser.add_argument("--dtypes", type=lambda text: text.split(","), default=["uint8", "uint16"])
+    parser.add_argument("--compressions", type=lambda text: text.split(","), default=["none", "zlib", "zarr"])
+    parser.add_argument("--operations", type=lambda text: text.split(","), default=list(OPERATIONS))
+    parser.add_argument("--modes", type=lambda text: text.split(","), default=list(MODES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--input", help="compare these saved results instead of running the suite")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown or memory growth reported as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            current = json.load(f)
+    else:
+        current = {"environment": environment(), "config": {
+            "shapes": args.shapes, "dtypes": args.dtypes, "compressions": args.compressions,
+            "repeat": args.repeat, "warmup": args.warmup,
+        }}
+        print(f"{'case':<52}{'p50 s':>9}{'p90 s':>9}{'MB/s':>10}{'peak RSS':>12}")
+        current["results"] = run_suite(args)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline["results"], current["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Per-endpoint latency on the uploaded TIFF vs its Zarr working copy.
+
+Usage:
+    python benchmarks/bench_zarr_store.py --shape 2048,2048,16,4,3
+    python benchmarks/bench_zarr_store.py --compression zstd --tiff-compression zlib
+
+Every operation runs in a fresh process that opens the image the way the
+routes do (``ImageProcessor(path)``), first against the plain TIFF and then
+after ``convert_to_zarr`` has written the "planes" and "channels" layouts.
+Operations mirror the endpoints: /slice, a strided /region thumbnail,
+/statistics, /analyze (covariance PCA) and /segment/kmeans.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from common import format_bytes, make_volume, measure, parse_shape
+
+import numpy as np
+from image_processor import ImageProcessor, save_image
+from zarr_store import COMPRESSIONS, convert_to_zarr, store_path
+
+
+def run_slice(path, shape, workdir):
+    ImageProcessor(path).extract_slice(shape[2] // 2, shape[3] // 2, 0)
+
+
+def run_region(path, shape, workdir):
+    ImageProcessor(path).extract_region(x=slice(None, None, 8), y=slice(None, None, 8), z=0, time=0)
+
+
+def run_statistics(path, shape, workdir):
+    ImageProcessor(path).compute_statistics()
+
+
+def run_pca(path, shape, workdir):
+    reduced = ImageProcessor(path).apply_pca(2, method="covariance")
+    save_image(reduced, os.path.join(workdir, "bench_zarr_pca.tif"), dtype=np.uint8)
+
+
+def run_kmeans(path, shape, workdir):
+    labels = ImageProcessor(path).apply_kmeans_segmentation(0, 3)
+    save_image(labels, os.path.join(workdir, "bench_zarr_kmeans.tif"), dtype="uint8")
+
+
+OPERATIONS = {
+    "slice": run_slice,
+    "region": run_region,
+    "statistics": run_statistics,
+    "pca": run_pca,
+    "kmeans": run_kmeans,
+}
+
+
+def convert(path, compression):
+    start = time.perf_counter()
+    convert_to_zarr(path, ImageProcessor(path).image, compression=compression)
+    return time.perf_counter() - start
+
+
+def store_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(path) for name in names
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=parse_shape, default=(1024, 1024, 16, 4, 3))
+    parser.add_argument("--dtype", default="uint16")
+    parser.add_argument("--compression", default="blosc-lz4", choices=sorted(COMPRESSIONS))
+    parser.add_argument("--tiff-compression", default=None, help="e.g. zlib for a compressed source TIFF")
+    parser.add_argument("--operations", default=",".join(OPERATIONS))
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    name = "bench_zarr_{}_{}_{}.tif".format(
+        "x".join(map(str, args.shape)), args.dtype, args.tiff_compression or "raw"
+    )
+    path = make_volume(os.path.join(args.workdir, name), args.shape, args.dtype, args.tiff_compression)
+    if os.path.exists(store_path(path)):
+        shutil.rmtree(store_path(path))
+    operations = args.operations.split(",")
+
+    before = {op: measure(OPERATIONS[op], path, args.shape, args.workdir) for op in operations}
+    report = measure(convert, path, args.compression)
+    print(
+        f"conversion: {report['result']:.2f} s, TIFF {format_bytes(os.path.getsize(path))}, "
+        f"Zarr ({args.compression}) {format_bytes(store_bytes(store_path(path)))}"
+    )
+    after = {op: measure(OPERATIONS[op], path, args.shape, args.workdir) for op in operations}
+
+    print(f"{'operation':<12}{'TIFF s':>10}{'Zarr s':>10}{'speedup':>10}{'TIFF RSS':>14}{'Zarr RSS':>14}")
+    for op in operations:
+        old, new = before[op], after[op]
+        print(
+            f"{op:<12}{old['seconds']:>10.3f}{new['seconds']:>10.3f}"
+            f"{old['seconds'] / new['seconds']:>9.1f}x"
+            f"{format_bytes(old['peak_anon_rss']):>14}{format_bytes(new['peak_anon_rss']):>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Shared helpers for the benchmark scripts in this directory.
+
+Benchmarks are plain scripts (``python benchmarks/bench_<name>.py --help``).
+Each measurement runs in a fresh spawned process so that peak memory numbers
+are not polluted by earlier runs or by generating the synthetic input.
+"""
+import multiprocessing as mp
+import os
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+import tifffile as tiff
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+def parse_shape(text):
+    """Parses a comma separated shape such as ``"1024,1024,10,5,3"``."""
+    return tuple(int(part) for part in text.split(","))
+
+
+def make_volume(path, shape, dtype="uint8", compression=None, seed=0):
+    """Writes a synthetic 5D TIFF without holding the whole volume in memory.
+
+    The file is filled one X-slab at a time through a memory map; compressed
+    variants are re-encoded from that uncompressed file page by page.
+    """
+    if os.path.exists(path):
+        return path
+
+    dtype = np.dtype(dtype)
+    rng = np.random.default_rng(seed)
+    target = path if compression is None else path + ".raw.tif"
+
+    volume = tiff.memmap(target, shape=shape, dtype=dtype)
+    high = 256 if dtype.itemsize == 1 else 4096
+    for x in range(shape[0]):
+        volume[x] = rng.integers(0, high, size=shape[1:], dtype=dtype)
+    volume.flush()
+    del volume
+
+    if compression is not None:
+        tiff.imwrite(path, tiff.memmap(target, mode="r"), compression=compression)
+        os.remove(target)
+    return path
+
+
+def processor_for(image):
+    """Builds an ImageProcessor around an existing (Dask) array, skipping file I/O."""
+    from image_processor import ImageProcessor
+
+    processor = ImageProcessor.__new__(ImageProcessor)
+    processor.file_path = None
+    processor.image = image
+    processor.channel_image = image
+    return processor
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _anon_rss_bytes():
+    """Current anonymous (non file-backed) RSS, or None where unavailable."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _child(func, args, queue):
+    peak_anon = [_anon_rss_bytes() or 0]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak_anon[0] = max(peak_anon[0], _anon_rss_bytes() or 0)
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+
+    queue.put({
+        "seconds": elapsed,
+        "peak_rss": _peak_rss_bytes(),
+        "peak_anon_rss": peak_anon[0],
+        "result": result,
+    })
+
+
+def measure(func, *args):
+    """Runs ``func(*args)`` in a fresh process and reports latency and memory.
+
+    ``func`` must be importable at module level (the child is spawned, not
+    forked). Its return value must be picklable and is passed back as
+    ``result``.
+    """
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_child, args=(func, args, queue))
+    process.start()
+    report = queue.get()
+    process.join()
+    return report
+
+
+def format_bytes(num):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(num) < 1024:
+            return f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TiB"
@@ -0,0 +1,65 @@
+import threading
+import numpy as np
+import pytest
+import tifffile as tiff
+from sqlalchemy import text
+from analysis_cache import AnalysisWriter, cache_key, lookup_analysis, store_analysis
+import analysis_cache
+from database import ImageAnalysis, engine, session_scope
+
+path = "data/test_analysis_cache.tif"
+tiff.imwrite(path, np.zeros((8, 8, 2, 2, 1), dtype=np.uint8))
+
+
+def test_sqlite_runs_in_wal_mode():
+    """Test that SQLite connections use WAL and a busy timeout."""
+    if engine.dialect.name != "sqlite":
+        pytest.skip("SQLite only")
+    with session_scope() as db:
+        assert db.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert db.execute(text("PRAGMA busy_timeout")).scalar() > 0
+
+
+def test_writer_batches_and_serves_pending(monkeypatch):
+    """Test that queued records are visible to lookups, collapsed per key and written once."""
+    writer = AnalysisWriter(interval=0.2)
+    monkeypatch.setattr(analysis_cache, "analysis_writer", writer)
+    for channels in range(1, 4):
+        writer.submit(path, "statistics", {"test": "writer"}, statistics={"channels": channels})
+    with session_scope() as db:
+        assert lookup_analysis(db, path, "statistics", {"test": "writer"}).statistics == {"channels": 3}
+
+    assert writer.flush(timeout=10)
+    with session_scope() as db:
+        rows = db.query(ImageAnalysis).filter_by(cache_key=cache_key(path, "statistics", {"test": "writer"})).all()
+        assert [row.statistics for row in rows] == [{"channels": 3}]
+
+
+def test_concurrent_writes_do_not_lock():
+    """Test that many threads storing results at once all succeed."""
+    errors = []
+
+    def store(index):
+        try:
+            with session_scope() as db:
+                store_analysis(db, path, "statistics", {"thread": index % 4}, statistics={"index": index})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=store, args=(index,)) for index in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_session_scope_rolls_back_on_error():
+    """Test that a failing unit of work leaves nothing behind."""
+    with pytest.raises(RuntimeError):
+        with session_scope() as db:
+            db.add(ImageAnalysis(file_path=path, operation="rollback-test", cache_key="rollback-test"))
+            db.flush()
+            raise RuntimeError("fail")
+    with session_scope() as db:
+        assert db.query(ImageAnalysis).filter_by(cache_key="rollback-test").first() is None
@@ -1,5 +1,12 @@
+import hashlib
+import io
+import json
 import os
+import time
+import numpy as np
 import requests
+import tifffile as tiff
+import zipfile
 
 BASE_URL = "http://127.0.0.1:5000"
 
@@ -15,17 +22,150 @@ def test_upload():
     assert response.status_code == 201
     assert "File uploaded successfully" in response.json()["message"]
 
+def wait_for_job(status_url):
+    for _ in range(120):
+        job = requests.get(f"{BASE_URL}{status_url}").json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.5)
+    return job
+
+def test_upload_converts_to_zarr():
+    """Test that uploads are converted to a Zarr working copy in the background."""
+    with open("data/test_image.tif", "rb") as file:
+        response = requests.post(f"{BASE_URL}/upload", files={"file": ("test_convert.tif", file)})
+    assert response.status_code == 201
+    job = wait_for_job(response.json()["convert_job"]["status_url"])
+    assert job["status"] == "completed"
+    assert os.path.isdir("data/test_convert.tif.zarr")
+
+    response = requests.get(f"{BASE_URL}/slice", params={"file_path": "data/test_convert.tif", "z": 5, "time": 2, "channel": 1})
+    assert response.status_code == 200
+
+def test_upload_checksum():
+    """Test that a multipart upload with a wrong checksum is rejected."""
+    with open("data/test_image.tif", "rb") as file:
+        response = requests.post(f"{BASE_URL}/upload", files={"file": ("test_checksum.tif", file)}, data={"sha256": "0" * 64})
+    assert response.status_code == 400
+    assert response.json()["error"] == "Checksum mismatch"
+
+def test_resumable_upload():
+    """Test uploading a file in two byte ranges."""
+    with open("data/test_image.tif", "rb") as file:
+        data = file.read()
+    response = requests.post(f"{BASE_URL}/uploads", json={
+        "file_name": "test_resumable_api.tif", "size": len(data), "sha256": hashlib.sha256(data).hexdigest()
+    })
+    assert response.status_code == 201
+    upload_url = response.json()["upload_url"]
+
+    half = len(data) // 2
+    response = requests.put(f"{BASE_URL}{upload_url}", data=data[:half], headers={"Content-Range": f"bytes 0-{half - 1}/{len(data)}"})
+    assert response.json()["offset"] == half
+    response = requests.put(f"{BASE_URL}{upload_url}", data=data[:half], headers={"Content-Range": f"bytes 0-{half - 1}/{len(data)}"})
+    assert response.status_code == 409
+
+    response = requests.put(f"{BASE_URL}{upload_url}", data=data[half:], headers={"Content-Range": f"bytes {half}-{len(data) - 1}/{len(data)}"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert response.json()["file_path"] == "data/test_resumable_api.tif"
+
+    response = requests.post(f"{BASE_URL}/uploads", json={"file_name": "test_resumable_api.tif", "size": 10, "convert": "false"})
+    assert response.status_code == 400
+
 def test_metadata():
     """Test fetching image metadata."""
     response = requests.get(f"{BASE_URL}/metadata?file_path=data/test_image.tif")
     assert response.status_code == 200
     assert "metadata" in response.json()
 
+def test_metadata_min_max_from_summary():
+    """Test that /metadata reports min/max once the chunk summary job has run."""
+    with open("data/test_image.tif", "rb") as file:
+        response = requests.post(f"{BASE_URL}/upload", files={"file": ("test_summary_api.tif", file)}, data={"convert": "false"})
+    assert response.status_code == 201
+    job = wait_for_job(response.json()["summary_job"]["status_url"])
+    assert job["status"] == "completed"
+
+    metadata = requests.get(f"{BASE_URL}/metadata", params={"file_path": "data/test_summary_api.tif"}).json()["metadata"]
+    image = tiff.imread("data/test_summary_api.tif")
+    assert metadata["min"] == image.min()
+    assert metadata["max"] == image.max()
+    assert metadata["axes"] == "XYZTC"
+
 def test_slice():
     """Test extracting a slice from the image."""
     response = requests.get(f"{BASE_URL}/slice?file_path=data/test_image.tif&z=5&time=2&channel=1")
     assert response.status_code == 200
 
+def test_slice_formats():
+    """Test slice encodings and conditional requests."""
+    params = {"file_path": "data/test_image.tif", "z": 5, "time": 2, "channel": 1}
+    response = requests.get(f"{BASE_URL}/slice", params={**params, "format": "raw", "compression": "zlib"})
+    assert response.status_code == 200
+    assert response.headers["X-Array-Shape"] == "100,100"
+    assert response.headers["X-Array-Dtype"] == "|u1"
+    assert len(response.content) == 100 * 100
+
+    response = requests.get(f"{BASE_URL}/slice", params={**params, "format": "png"})
+    assert response.headers["Content-Type"] == "image/png"
+    etag = response.headers["ETag"]
+    response = requests.get(f"{BASE_URL}/slice", params={**params, "format": "png"}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = requests.get(f"{BASE_URL}/slice", params={**params, "format": "jpeg"})
+    assert response.status_code == 400
+
+def test_region():
+    """Test extracting a strided sub-volume and the size limit."""
+    params = {"file_path": "data/test_image.tif", "x": "0:100:4", "y": "10:30", "z": "2", "channel": "1", "format": "npy"}
+    response = requests.get(f"{BASE_URL}/region", params=params)
+    assert response.status_code == 200
+    assert response.content.startswith(b"\x93NUMPY")
+
+    response = requests.get(f"{BASE_URL}/region", params={**params, "x": "0:10:0"})
+    assert response.status_code == 400
+
+def test_batch():
+    """Test that /batch returns a zip with one file per slice and inline statistics."""
+    operations = [
+        {"type": "slice", "file_path": "data/test_image.tif", "z": z, "time": 2, "channel": 0}
+        for z in range(3)
+    ] + [
+        {"type": "region", "file_path": "data/test_image.tif", "x": "0:50", "y": "::2", "z": 1, "time": 1},
+        {"type": "statistics", "file_path": "data/test_image.tif"},
+    ]
+    response = requests.post(f"{BASE_URL}/batch", json={"operations": operations, "format": "npy"})
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    manifest = json.loads(archive.read("results.json"))
+    assert len(manifest) == 5
+    assert np.load(io.BytesIO(archive.read(manifest[3]["file"]))).shape == (50, 50, 3)
+    assert "Channel 0" in manifest[4]["statistics"]
+
+    response = requests.post(f"{BASE_URL}/batch", json={"operations": [operations[0], {"type": "slice"}]})
+    assert response.status_code == 400
+    assert response.json()["index"] == 1
+
+    for max_size in ("x", 0, "-3"):
+        response = requests.post(f"{BASE_URL}/batch", json={"operations": [{**operations[0], "max_size": max_size}]})
+        assert response.status_code == 400
+        assert response.json() == {"error": "Operation 0: max_size must be a positive integer", "index": 0}
+
+def test_upload_with_pyramid():
+    """Test building a pyramid at upload and reading a zoomed-out slice from it."""
+    tiff.imwrite("data/test_pyramid.tif", np.random.randint(0, 256, (600, 600, 2, 1, 1), dtype=np.uint8))
+    with open("data/test_pyramid.tif", "rb") as file:
+        response = requests.post(f"{BASE_URL}/upload", files={"file": file}, data={"pyramid": "mean"})
+    assert response.status_code == 201
+    job = wait_for_job(response.json()["pyramid_job"]["status_url"])
+    assert job["status"] == "completed"
+
+    params = {"file_path": "data/test_pyramid.tif", "z": 0, "time": 0, "channel": 0, "max_size": 256, "format": "raw"}
+    response = requests.get(f"{BASE_URL}/slice", params=params)
+    assert response.headers["X-Pyramid-Level"] == "1"
+    assert response.headers["X-Array-Shape"] == "300,300"
+
 def test_pca():
     """Test performing PCA analysis."""
     payload = {"file_path": "data/test_image.tif", "components": 3}
@@ -33,12 +173,77 @@ def test_pca():
     assert response.status_code == 200
     assert "PCA analysis completed" in response.json()["message"]
 
+def test_pca_covariance_method():
+    """Test PCA with the covariance engine and an invalid method."""
+    payload = {"file_path": "data/test_image.tif", "components": 2, "method": "covariance"}
+    response = requests.post(f"{BASE_URL}/analyze", json=payload)
+    assert response.status_code == 200
+
+    payload["method"] = "unknown"
+    response = requests.post(f"{BASE_URL}/analyze", json=payload)
+    assert response.status_code == 400
+
+def test_pca_invalid_components():
+    """Test that component counts that are not integers between 1 and the channel count are rejected."""
+    for components in (10, 0, "x", True):
+        payload = {"file_path": "data/test_image.tif", "components": components, "method": "covariance"}
+        response = requests.post(f"{BASE_URL}/analyze", json=payload)
+        assert response.status_code == 400
+        assert response.json()["error"] == "components must be an integer between 1 and 3"
+
 def test_statistics():
     """Test retrieving image statistics."""
     response = requests.get(f"{BASE_URL}/statistics?file_path=data/test_image.tif")
     assert response.status_code == 200
     assert "statistics" in response.json()
 
+def test_statistics_cached():
+    """Test that repeat statistics calls are served from the database cache."""
+    requests.get(f"{BASE_URL}/statistics?file_path=data/test_image.tif")
+    response = requests.get(f"{BASE_URL}/statistics?file_path=data/test_image.tif")
+    assert response.status_code == 200
+    assert response.json()["cached"] is True
+
+    response = requests.get(f"{BASE_URL}/statistics?file_path=data/test_image.tif&refresh=true")
+    assert response.status_code == 200
+    assert response.json()["cached"] is False
+
+def test_region_statistics():
+    """Test statistics of a sub-region and rejected regions."""
+    params = {"file_path": "data/test_image.tif", "x": "10:60", "y": "0:30", "time": "2"}
+    response = requests.get(f"{BASE_URL}/statistics/region", params=params)
+    assert response.status_code == 200
+    region = tiff.imread("data/test_image.tif")[10:60, 0:30, :, 2]
+    for channel, stats in enumerate(response.json()["channels"]):
+        assert stats["min"] == region[..., channel].min()
+        assert stats["max"] == region[..., channel].max()
+        assert stats["count"] == region[..., channel].size
+
+    for bad in ({"x": "0:100:2"}, {"x": "abc"}, {"time": "7"}):
+        response = requests.get(f"{BASE_URL}/statistics/region", params={**params, **bad})
+        assert response.status_code == 400
+
+def test_metadata_cached():
+    """Test that repeat metadata calls are served from the database cache."""
+    requests.get(f"{BASE_URL}/metadata?file_path=data/test_image.tif")
+    response = requests.get(f"{BASE_URL}/metadata?file_path=data/test_image.tif")
+    assert response.status_code == 200
+    assert response.json()["cached"] is True
+    assert response.json()["metadata"]["shape"] == [100, 100, 10, 5, 3]
+
+def test_timeseries_statistics():
+    """Test per-frame statistics and that a repeat request reads no frames."""
+    params = {"file_path": "data/test_image.tif"}
+    requests.get(f"{BASE_URL}/statistics/timeseries", params={**params, "refresh": "true"})
+    response = requests.get(f"{BASE_URL}/statistics/timeseries", params=params)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["new_frames"] == 0
+    assert result["frames"] == 5
+    image = tiff.imread("data/test_image.tif")
+    np.testing.assert_allclose(result["timeseries"]["Channel 2"]["mean"], image[..., 2].mean(axis=(0, 1, 2)))
+    np.testing.assert_allclose(result["statistics"]["Channel 2"]["mean"], image[..., 2].mean())
+
 def test_kmeans_segmentation():
     """Test performing K-Means segmentation."""
     params = {
@@ -54,6 +259,116 @@ def test_kmeans_segmentation():
     assert "file_path" in result  
     assert os.path.exists(result["file_path"])  
 
+def test_feature_kmeans_segmentation():
+    """Test K-Means on PCA-reduced channels and its parameter validation."""
+    params = {"file_path": "data/test_image.tif", "channels": "all", "components": 2, "k": 3}
+    response = requests.get(f"{BASE_URL}/segment/kmeans", params=params)
+    assert response.status_code == 200
+    labels = tiff.imread(response.json()["file_path"])
+    assert labels.shape == (100, 100, 10, 5)
+    assert labels.max() == 2
+
+    response = requests.get(f"{BASE_URL}/segment/kmeans", params={**params, "components": 5})
+    assert response.status_code == 400
+    response = requests.get(f"{BASE_URL}/segment/kmeans", params={**params, "method": "histogram"})
+    assert response.status_code == 400
+    response = requests.get(f"{BASE_URL}/segment/kmeans", params={**params, "k": 0})
+    assert response.status_code == 400
+    for invalid in ({"k": "x"}, {"channel": "abc"}):
+        response = requests.get(f"{BASE_URL}/segment/kmeans", params={"file_path": "data/test_image.tif", **invalid})
+        assert response.status_code == 400
+        assert "must be an integer" in response.json()["error"]
+    response = requests.get(f"{BASE_URL}/segment/kmeans", params={"k": 3})
+    assert response.status_code == 400
+
+def test_otsu_segmentation():
+    """Test Otsu segmentation and its parameter validation."""
+    params = {"file_path": "data/test_image.tif", "channel": 1, "classes": 3, "mode": "plane"}
+    response = requests.get(f"{BASE_URL}/segment/otsu", params=params)
+    assert response.status_code == 200
+    labels = tiff.imread(response.json()["file_path"])
+    assert labels.shape == (100, 100, 10, 5)
+    assert labels.max() == 2
+
+    response = requests.get(f"{BASE_URL}/segment/otsu", params={**params, "classes": 9})
+    assert response.status_code == 400
+    response = requests.get(f"{BASE_URL}/segment/otsu", params={**params, "channel": 3})
+    assert response.status_code == 400
+    for invalid in ({"channel": "abc"}, {"classes": "x"}):
+        response = requests.get(f"{BASE_URL}/segment/otsu", params={**params, **invalid})
+        assert response.status_code == 400
+        assert "must be an integer" in response.json()["error"]
+    response = requests.get(f"{BASE_URL}/segment/otsu")
+    assert response.status_code == 400
+    assert response.json()["error"] == "File not found"
+    response = requests.get(f"{BASE_URL}/segment/kmeans", params={"file_path": "data/test_image.tif", "channel": -1})
+    assert response.status_code == 400
+    response = requests.get(f"{BASE_URL}/segment/kmeans", params={"file_path": "data/test_image.tif", "channels": "0,5"})
+    assert response.status_code == 400
+
+def test_filter_pipeline():
+    """Test filtering an image and segmenting the filtered channel directly."""
+    params = {"file_path": "data/test_image.tif", "filters": "gaussian:1,median:3"}
+    response = requests.get(f"{BASE_URL}/filter", params=params)
+    assert response.status_code == 200
+    filtered = tiff.imread(response.json()["file_path"])
+    assert filtered.shape == (100, 100, 10, 5, 3)
+    assert filtered.dtype == np.uint8
+
+    response = requests.get(f"{BASE_URL}/segment/otsu", params={"file_path": "data/test_image.tif", "filters": "median:3"})
+    assert response.status_code == 200
+    assert tiff.imread(response.json()["file_path"]).shape == (100, 100, 10, 5)
+
+    response = requests.get(f"{BASE_URL}/filter", params={**params, "filters": "sharpen:2"})
+    assert response.status_code == 400
+
+def test_async_kmeans_job():
+    """Test queuing K-Means as a job and polling it to completion."""
+    params = {"file_path": "data/test_image.tif", "channel": 1, "k": 2, "async": "true"}
+    response = requests.get(f"{BASE_URL}/segment/kmeans", params=params)
+    assert response.status_code == 202
+    status_url = response.json()["status_url"]
+
+    for _ in range(120):
+        job = requests.get(f"{BASE_URL}{status_url}").json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.5)
+
+    assert job["status"] == "completed"
+    assert os.path.exists(job["result_path"])
+
+def test_artifacts_reused():
+    """Test that a repeated segmentation is served from the artifact store."""
+    params = {"file_path": "data/test_image.tif", "channel": 2, "k": 2}
+    first = requests.get(f"{BASE_URL}/segment/kmeans", params=params)
+    before = requests.get(f"{BASE_URL}/artifacts/metrics").json()
+    second = requests.get(f"{BASE_URL}/segment/kmeans", params=params)
+    after = requests.get(f"{BASE_URL}/artifacts/metrics").json()
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["file_path"] == second.json()["file_path"]
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"]
+
+def test_metrics():
+    """Test the X-Timing header and the Prometheus metrics endpoint."""
+    params = {"file_path": "data/test_image.tif", "z": 1, "time": 1, "channel": 0}
+    response = requests.get(f"{BASE_URL}/slice", params=params, headers={"X-Timing": "1"})
+    assert response.status_code == 200
+    assert "compute;dur=" in response.headers["X-Timing"]
+    assert "X-Timing" not in requests.get(f"{BASE_URL}/slice", params=params).headers
+
+    response = requests.get(f"{BASE_URL}/metrics")
+    assert response.status_code == 200
+    assert 'image_api_stage_seconds_count{stage="encode"}' in response.text
+    assert 'image_api_request_seconds_count{endpoint="/slice",method="GET",status="200"}' in response.text
+
+def test_unknown_job():
+    """Test that unknown job ids return 404."""
+    response = requests.get(f"{BASE_URL}/jobs/does-not-exist")
+    assert response.status_code == 404
+
 if __name__ == "__main__":
     print("Running API tests...")
     test_upload()
@@ -0,0 +1,87 @@
+import os
+import numpy as np
+import tifffile as tiff
+from artifacts import ArtifactStore
+
+image = np.random.randint(0, 256, (20, 20, 4, 3, 3), dtype=np.uint8)
+
+
+def write_image(path, data=image):
+    tiff.imwrite(path, data)
+    return path
+
+
+def write_bytes(size):
+    def produce(path):
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+    return produce
+
+
+def test_artifact_reused_until_input_changes(tmp_path):
+    """Test that an artifact is produced once and rebuilt when its input changes."""
+    path = write_image("data/test_artifact_input.tif")
+    store = ArtifactStore(root=str(tmp_path))
+    calls = []
+
+    def produce(output_path):
+        calls.append(output_path)
+        tiff.imwrite(output_path, image[..., 0])
+
+    key = store.key(path, "slice", {"z": 0})
+    first = store.get_or_create(key, produce)
+    assert store.get_or_create(store.key(path, "slice", {"z": 0}), produce) == first
+    assert len(calls) == 1
+    assert store.stats()["hits"] == 1
+
+    # Different parameters or a modified input file get their own artifact.
+    assert store.key(path, "slice", {"z": 1}) != key
+    write_image(path, image[:10])
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert store.key(path, "slice", {"z": 0}) != key
+
+
+def test_failed_write_leaves_no_artifact(tmp_path):
+    """Test that a failing producer leaves neither the artifact nor its temp file."""
+    store = ArtifactStore(root=str(tmp_path))
+
+    def produce(output_path):
+        write_bytes(10)(output_path)
+        raise RuntimeError("boom")
+
+    try:
+        store.get_or_create("ab" * 32, produce)
+    except RuntimeError:
+        pass
+    assert store.get("ab" * 32) is None
+    assert not any(files for _, _, files in os.walk(tmp_path))
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    """Test that the size budget evicts the least recently used artifacts."""
+    store = ArtifactStore(root=str(tmp_path), max_bytes=250)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    store.get_or_create(keys[0], write_bytes(100))
+    store.get_or_create(keys[1], write_bytes(100))
+    os.utime(store.path_for(keys[0]), ns=(0, 1))
+    os.utime(store.path_for(keys[1]), ns=(0, 2))
+    store.get_or_create(keys[2], write_bytes(100))
+
+    assert store.get(keys[0]) is None
+    assert store.get(keys[1]) is not None
+    assert store.stats()["bytes"] == 200
+    assert store.stats()["evictions"] == 1
+
+
+def test_store_keeps_recently_used(tmp_path):
+    """Test that artifacts used within the grace window survive eviction, even over budget."""
+    store = ArtifactStore(root=str(tmp_path), max_bytes=150, grace_seconds=60)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    returned = store.get_or_create(keys[0], write_bytes(100))
+    store.get_or_create(keys[1], write_bytes(100))
+    os.utime(store.path_for(keys[1]), ns=(0, 1))
+    store.get_or_create(keys[2], write_bytes(100))
+
+    assert os.path.exists(returned)
+    assert store.get(keys[1]) is None
+    assert store.stats()["evictions"] == 1
@@ -0,0 +1,51 @@
+import io
+import json
+import zipfile
+import numpy as np
+import pytest
+import tifffile as tiff
+from batch import BatchError, compute_batch, plan_batch, write_archive
+from image_cache import get_processor
+from image_processor import RegionTooLarge
+
+image = np.random.randint(0, 256, (60, 40, 6, 4, 3), dtype=np.uint8)
+
+
+def test_batch_reads_shared_pages_once():
+    """Test that a batch returns every result and decodes pages shared by several slices once."""
+    path = "data/test_batch.tif"
+    tiff.imwrite(path, image, compression="zlib")
+    processor = get_processor(path)
+    pages_read = []
+    read_pages = processor._tiff.asarray
+    processor._tiff.asarray = lambda key, **kwargs: pages_read.append(len(key)) or read_pages(key=key, **kwargs)
+
+    operations = [
+        {"type": "slice", "file_path": path, "z": 2, "time": 1, "channel": 0},
+        {"type": "slice", "file_path": path, "z": 2, "time": 3, "channel": 1},
+        {"type": "region", "file_path": path, "x": slice(10, 30), "time": 0},
+        {"type": "statistics", "file_path": path},
+    ]
+    archive = zipfile.ZipFile(write_archive(compute_batch(plan_batch(operations)), "npy"))
+    assert sum(pages_read) == 60 * 40
+
+    manifest = json.loads(archive.read("results.json"))
+    assert [record["type"] for record in manifest] == ["slice", "slice", "region", "statistics"]
+    expected = [image[:, :, 2, 1, 0], image[:, :, 2, 3, 1], image[10:30, :, :, 0]]
+    for record, array in zip(manifest, expected):
+        np.testing.assert_array_equal(np.load(io.BytesIO(archive.read(record["file"]))), array)
+    assert manifest[3]["statistics"]["Channel 2"]["max"] == image[..., 2].max()
+
+
+def test_batch_validation():
+    """Test that invalid operations name their index and oversized batches are rejected."""
+    path = "data/test_batch.tif"
+    tiff.imwrite(path, image)
+    with pytest.raises(BatchError) as error:
+        plan_batch([{"type": "slice", "file_path": path}, {"type": "histogram", "file_path": path}])
+    assert error.value.index == 1
+    for max_size in ("x", 0, -4, 2.5, True):
+        with pytest.raises(BatchError, match="max_size must be a positive integer"):
+            plan_batch([{"type": "slice", "file_path": path, "z": 0, "time": 0, "channel": 0, "max_size": max_size}])
+    with pytest.raises(RegionTooLarge):
+        plan_batch([{"type": "region", "file_path": path}] * 3, max_bytes=2 * image.nbytes)
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+import tifffile as tiff
+import chunk_summary
+import metrics
+from chunk_summary import build_summary, load_summary
+from image_processor import ImageProcessor
+
+image = np.random.rand(90, 60, 10, 4, 2).astype(np.float32)
+image[5, 7, 1, 0, 1] = np.nan
+
+
+def expected_channels(data):
+    return [
+        {"min": np.nanmin(c), "max": np.nanmax(c), "mean": np.nanmean(c, dtype=np.float64), "count": np.count_nonzero(~np.isnan(c))}
+        for c in np.moveaxis(data, -1, 0)
+    ]
+
+
+def assert_channels_equal(actual, expected):
+    for got, want in zip(actual, expected):
+        assert got["count"] == want["count"]
+        np.testing.assert_allclose([got["min"], got["max"], got["mean"]], [want["min"], want["max"], want["mean"]], rtol=1e-6)
+
+
+def test_metadata_from_header_and_summary(monkeypatch):
+    """Test that metadata reads no pixels and takes min/max from the chunk summary once built."""
+    path = "data/test_summary.tif"
+    tiff.imwrite(path, image)
+    monkeypatch.setattr(chunk_summary, "SUMMARY_CHUNK_BYTES", 64 * 1024)
+    processor = ImageProcessor(path)
+
+    with metrics.trace() as trace:
+        metadata = processor.get_metadata()
+    assert metadata["shape"] == image.shape
+    assert metadata["compression"] == "none"
+    assert metadata["min"] is None
+    assert trace.bytes_read == 0
+
+    build_summary(path, processor.channel_image)
+    assert load_summary(path).summaries.shape[:-2] != (1, 1, 1, 1)
+    assert_channels_equal(chunk_summary.to_dict(load_summary(path).total()), expected_channels(image))
+    metadata = processor.get_metadata()
+    assert metadata["min"] == np.nanmin(image)
+    assert metadata["max"] == np.nanmax(image)
+
+    tiff.imwrite(path, image[:80])
+    assert load_summary(path) is None
+
+
+def test_region_summary_reads_only_cut_chunks(monkeypatch):
+    """Test region statistics against numpy and that chunks inside the region are not read."""
+    path = "data/test_summary_region.tif"
+    tiff.imwrite(path, image)
+    monkeypatch.setattr(chunk_summary, "SUMMARY_CHUNK_BYTES", 64 * 1024)
+    processor = ImageProcessor(path)
+    build_summary(path, processor.channel_image)
+
+    with metrics.trace() as trace:
+        summary = processor.region_summary(x=slice(None, 80), y=slice(None, 50), time=2)
+    region = image[:80, :50, :, 2]
+    assert_channels_equal(summary, expected_channels(region))
+    assert 0 < trace.bytes_read < region.nbytes
+
+    os.remove(chunk_summary.summary_path(path))
+    assert_channels_equal(processor.region_summary(z=4), expected_channels(image[:, :, 4]))
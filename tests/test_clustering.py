@@ -0,0 +1,61 @@
+import numpy as np
+import dask.array as da
+import pytest
+import clustering
+
+rng = np.random.default_rng(0)
+values = np.concatenate([rng.normal(40, 5, 5000), rng.normal(120, 5, 5000), rng.normal(200, 5, 5000)])
+image = da.from_array(np.clip(values, 0, 255).astype(np.uint8).reshape(50, 30, 10), chunks=(20, 30, 10))
+
+
+def test_histogram_kmeans_finds_mixture_centers():
+    """Test that histogram K-Means recovers well separated intensity clusters."""
+    centers = clustering.fit_centers(image, 3)
+    np.testing.assert_allclose(centers, [40, 120, 200], atol=1)
+
+
+def test_float_histogram_matches_integer():
+    """Test that binned float data clusters like the exact integer histogram."""
+    exact = clustering.fit_centers(image, 3)
+    binned = clustering.fit_centers(image.astype(np.float32), 3)
+    np.testing.assert_allclose(binned, exact, atol=0.1)
+
+
+def test_assign_labels_orders_by_intensity():
+    """Test that labels follow the sorted centers."""
+    labels = clustering.assign_labels(np.array([0, 79, 81, 255]), np.array([40.0, 120.0, 200.0]))
+    assert labels.tolist() == [0, 0, 1, 2]
+    assert labels.dtype == np.uint8
+
+
+def test_feature_kmeans_separates_channel_mixture():
+    """Test that sampled K-Means recovers clusters that differ only jointly across channels."""
+    means = np.array([[50, 200], [200, 50], [200, 200]])
+    component = rng.integers(0, 3, 20000)
+    features = rng.normal(means[component], 5).reshape(100, 200, 2)
+    volume = da.from_array(features, chunks=(25, 50, 2))
+
+    centers = clustering.fit_feature_centers(volume, 3, sample_rows=2000)
+    np.testing.assert_allclose(centers, means[np.argsort(means.mean(axis=1), kind="stable")], atol=2)
+
+    labels = clustering.assign_feature_labels(volume, centers).compute()
+    assert labels.shape == (100, 200)
+    expected = clustering.nearest_centers(features.reshape(-1, 2), centers).reshape(100, 200)
+    np.testing.assert_array_equal(labels, expected)
+
+
+def test_cluster_count_is_validated():
+    """Test that k outside 1..256 is rejected instead of collapsing or overflowing uint8 labels."""
+    for k in (0, 257):
+        with pytest.raises(ValueError):
+            clustering.kmeans_features(np.ones((10, 2)), k)
+        with pytest.raises(ValueError):
+            clustering.fit_centers(image, k)
+
+
+def test_feature_sample_is_bounded_and_deterministic():
+    """Test that the sample size follows the budget and does not change between runs."""
+    volume = da.from_array(rng.random((200, 200, 3)), chunks=(50, 50, 3))
+    first = clustering.sample_features(volume, 4000)
+    assert 3000 < len(first) < 5000
+    np.testing.assert_array_equal(first, clustering.sample_features(volume, 4000))
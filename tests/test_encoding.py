@@ -0,0 +1,51 @@
+import zlib
+import cv2
+import numpy as np
+import pytest
+import tifffile as tiff
+from encoding import encode_array
+
+image = np.random.randint(0, 65536, (30, 20), dtype=np.uint16)
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib", "lzma"])
+def test_tiff_roundtrip(compression):
+    """Test that TIFF output decodes to the original array."""
+    buffer, mimetype, extension, _ = encode_array(image, "tiff", compression)
+    assert mimetype == "image/tiff" and extension == ".tif"
+    np.testing.assert_array_equal(tiff.imread(buffer), image)
+
+
+def test_png_roundtrip():
+    """Test 16-bit grayscale and RGB PNG output."""
+    buffer, _, _, _ = encode_array(image, "png")
+    decoded = cv2.imdecode(np.frombuffer(buffer.getvalue(), np.uint8), cv2.IMREAD_UNCHANGED)
+    np.testing.assert_array_equal(decoded, image)
+
+    rgb = np.random.randint(0, 256, (10, 12, 3), dtype=np.uint8)
+    buffer, _, _, _ = encode_array(rgb, "png")
+    decoded = cv2.imdecode(np.frombuffer(buffer.getvalue(), np.uint8), cv2.IMREAD_UNCHANGED)
+    np.testing.assert_array_equal(decoded[..., ::-1], rgb)
+
+
+def test_npy_and_raw():
+    """Test npy output and raw bytes with their shape/dtype headers."""
+    buffer, _, _, headers = encode_array(image, "npy")
+    np.testing.assert_array_equal(np.load(buffer), image)
+    assert headers == {}
+
+    buffer, _, _, headers = encode_array(image, "raw", "zlib")
+    assert headers["Content-Encoding"] == "deflate"
+    shape = tuple(int(n) for n in headers["X-Array-Shape"].split(","))
+    decoded = np.frombuffer(zlib.decompress(buffer.getvalue()), headers["X-Array-Dtype"])
+    np.testing.assert_array_equal(decoded.reshape(shape), image)
+
+
+def test_invalid_requests():
+    """Test that unknown formats and unsupported combinations are rejected."""
+    with pytest.raises(ValueError):
+        encode_array(image, "jpeg")
+    with pytest.raises(ValueError):
+        encode_array(image, "png", "lzma")
+    with pytest.raises(ValueError):
+        encode_array(image.astype(np.float32), "png")
@@ -0,0 +1,125 @@
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+import dask.array as da
+import numpy as np
+import pytest
+import tifffile as tiff
+import execution
+from image_processor import TiffPageArray
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+
+PROCESSES_SCRIPT = """
+import sys
+from image_processor import ImageProcessor
+processor = ImageProcessor(sys.argv[1])
+stats = processor.compute_statistics()
+print(stats["Channel 1"]["mean"])
+print(float(processor.extract_slice(z=3, time=1, channel=1).mean()))
+"""
+
+DISTRIBUTED_SCRIPT = """
+import importlib.machinery, sys, types
+import dask, dask.array as da
+clusters = []
+class LocalCluster:
+    def __init__(self, **options):
+        clusters.append(options)
+class Client:
+    def __init__(self, cluster, set_as_default):
+        pass
+    def get(self, dsk, keys, priority, **kwargs):
+        print(priority)
+        return dask.get(dsk, keys, **kwargs)
+distributed = types.ModuleType("distributed")
+distributed.__spec__ = importlib.machinery.ModuleSpec("distributed", None)
+distributed.Client, distributed.LocalCluster = Client, LocalCluster
+sys.modules["distributed"] = distributed
+import execution
+execution.configure("distributed", workers=3, memory_limit="2GB")
+print(len(clusters))
+print(int(da.ones(8, chunks=2).sum().compute()))
+print(int(da.ones(8, chunks=2).sum().compute()))
+print(clusters)
+"""
+
+
+def thread_names(block):
+    return np.array([threading.current_thread().name], dtype=object)
+
+
+def test_priority_selects_pool():
+    """Test that computations run on the interactive pool by default and on the batch pool when heavy."""
+    execution.configure("threads", workers=2, interactive_workers=1)
+    array = da.zeros(4, chunks=1).map_blocks(thread_names, dtype=object, chunks=(1,))
+
+    interactive = set(array.compute())
+    with execution.heavy():
+        batch = set(array.compute())
+
+    assert all(name.startswith("dask-interactive") for name in interactive)
+    assert all(name.startswith("dask-batch") for name in batch)
+
+
+def test_heavy_limits_concurrency():
+    """Test that no more than HEAVY_CONCURRENCY heavy sections run at once."""
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with execution.heavy():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == execution.HEAVY_CONCURRENCY
+
+
+def test_tiff_pages_pickle():
+    """Test that a TIFF page view pickles by path and reads the same pages after unpickling."""
+    image = np.arange(4 * 3 * 8 * 8, dtype=np.uint16).reshape(4, 3, 8, 8)
+    for compression in (None, "zlib"):
+        tiff.imwrite("data/test_pickle.tif", image, compression=compression, photometric="minisblack")
+        with tiff.TiffFile("data/test_pickle.tif") as tif:
+            pages = TiffPageArray(tif)
+            copy = pickle.loads(pickle.dumps(pages))
+        np.testing.assert_array_equal(copy[1:3, 2], image[1:3, 2])
+        del copy
+
+
+def test_processes_scheduler_reads_tiff():
+    """Test that statistics and slices of an unconverted TIFF run on the processes scheduler."""
+    image = np.random.default_rng(0).integers(0, 256, (40, 30, 6, 2, 3), dtype=np.uint8)
+    tiff.imwrite("data/test_processes.tif", image, compression="zlib")
+    env = {**os.environ, "PYTHONPATH": APP_DIR, "DASK_SCHEDULER": "processes", "DASK_WORKERS": "2"}
+    output = subprocess.run(
+        [sys.executable, "-c", PROCESSES_SCRIPT, "data/test_processes.tif"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout.splitlines()
+    assert float(output[-2]) == pytest.approx(image[..., 1].mean())
+    assert float(output[-1]) == image[:, :, 3, 1, 1].mean()
+
+
+def test_distributed_cluster_starts_on_first_compute():
+    """Test that configuring the distributed scheduler starts no cluster until something is computed."""
+    env = {**os.environ, "PYTHONPATH": APP_DIR}
+    output = subprocess.run(
+        [sys.executable, "-c", DISTRIBUTED_SCRIPT], env=env, capture_output=True, text=True, check=True,
+    ).stdout.splitlines()
+    assert output[0] == "0"
+    assert output[1:3] == ["10", "8"]
+    assert output[3:5] == ["10", "8"]
+    assert output[5] == "[{'n_workers': 3, 'threads_per_worker': 1, 'memory_limit': '2GB'}]"
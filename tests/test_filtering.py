@@ -0,0 +1,58 @@
+import dask.array as da
+import numpy as np
+import pytest
+import tifffile as tiff
+from scipy import ndimage
+from skimage.filters import threshold_otsu
+from filtering import apply_pipeline, format_pipeline, parse_pipeline
+from image_processor import ImageProcessor
+
+image = np.random.randint(0, 256, (70, 50, 3, 2, 2), dtype=np.uint8)
+
+
+def reference(data, steps):
+    """The pipeline with scipy on whole planes."""
+    data = data.astype(np.float32)
+    for name, value in steps:
+        if name in ("gaussian", "background"):
+            smooth = ndimage.gaussian_filter(data, sigma=(value, value, 0, 0, 0))
+            data = smooth if name == "gaussian" else np.maximum(data - smooth, 0)
+        elif name == "median":
+            data = ndimage.median_filter(data, size=(value, value, 1, 1, 1))
+        else:
+            size = (value, value, 1, 1, 1)
+            first, second = (ndimage.minimum_filter, ndimage.maximum_filter)[::1 if name == "opening" else -1]
+            data = second(first(data, size=size), size=size)
+    return np.clip(np.round(data), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("pipeline", ["gaussian:2", "median:5", "opening:3,closing:3", "gaussian:1,background:4"])
+def test_pipeline_matches_scipy_across_chunks(pipeline):
+    """Test that halos make small chunks give the same result as whole planes."""
+    steps = parse_pipeline(pipeline)
+    filtered = apply_pipeline(da.from_array(image, chunks=(16, 12, 1, 1, 1)), steps)
+    assert filtered.dtype == image.dtype
+    np.testing.assert_array_equal(filtered.compute(), reference(image, steps))
+
+
+def test_parse_pipeline():
+    """Test pipeline parsing, its canonical form and rejected steps."""
+    steps = parse_pipeline(" Gaussian:1.50, median:3 ")
+    assert steps == [("gaussian", 1.5), ("median", 3)]
+    assert format_pipeline(steps) == "gaussian:1.5,median:3"
+    assert parse_pipeline(None) == []
+    for invalid in ("sharpen:2", "median:2.5", "gaussian", "median:0", "median:1000"):
+        with pytest.raises(ValueError):
+            parse_pipeline(invalid)
+
+
+def test_segmentation_consumes_filtered_image():
+    """Test that segmentation with filters equals segmenting the filtered image."""
+    path = "data/test_filtering.tif"
+    tiff.imwrite(path, image, photometric="minisblack")
+    processor = ImageProcessor(path)
+    labels = processor.apply_otsu_segmentation(channel=1, filters="median:3").compute()
+    filtered = reference(image, [("median", 3)])[..., 1]
+    np.testing.assert_array_equal(labels, filtered > threshold_otsu(filtered.ravel()))
+    assert processor.apply_pca(2, filters="gaussian:1").shape == image.shape[:-1] + (2,)
+
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import tifffile as tiff
+from image_cache import ImageCache
+
+image = np.random.randint(0, 256, (20, 20, 4, 3, 3), dtype=np.uint8)
+
+
+def write_image(path, data=image):
+    tiff.imwrite(path, data)
+    return path
+
+
+def test_cache_hit_returns_same_processor():
+    """Test that repeated lookups of an unchanged file share one handle."""
+    path = write_image("data/test_cache_hit.tif")
+    cache = ImageCache()
+    first = cache.get(path)
+    assert cache.get(path) is first
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_reopens_modified_file():
+    """Test that a changed mtime/size invalidates the cached handle."""
+    path = write_image("data/test_cache_modified.tif")
+    cache = ImageCache()
+    first = cache.get(path)
+    write_image(path, image[:10])
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    second = cache.get(path)
+    assert second is not first
+    assert second.image.shape[0] == 10
+    assert cache.stats()["entries"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    """Test that the byte budget evicts the least recently used image."""
+    paths = [write_image(f"data/test_cache_lru_{i}.tif") for i in range(3)]
+    cache = ImageCache(max_bytes=2 * image.nbytes)
+    first = cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])
+    cache.get(paths[2])
+    assert cache.stats()["evictions"] == 1
+    assert cache.get(paths[0]) is first
+    assert cache.stats()["misses"] == 3
+
+
+def test_cache_invalidate():
+    """Test explicit invalidation, as done by /upload."""
+    path = write_image("data/test_cache_invalidate.tif")
+    cache = ImageCache()
+    first = cache.get(path)
+    cache.invalidate(path)
+    assert cache.get(path) is not first
+    assert cache.stats()["bytes"] == image.nbytes
+
+
+def test_cache_closes_dropped_handles():
+    """Test that evicted and invalidated images release their files and still read after closing."""
+    paths = [write_image(f"data/test_cache_close_{i}.tif") for i in range(2)]
+    cache = ImageCache(max_bytes=image.nbytes)
+    first = cache.get(paths[0])
+    cache.get(paths[1])
+    assert first._tiff.filehandle.closed
+    np.testing.assert_array_equal(first.extract_slice(z=1, time=2, channel=0), image[:, :, 1, 2, 0])
+
+    second = cache.get(paths[1])
+    cache.invalidate(paths[1])
+    assert second._tiff.filehandle.closed
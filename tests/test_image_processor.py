@@ -1,7 +1,8 @@
 import pytest
 import numpy as np
 import tifffile as tiff
-from image_processor import ImageProcessor
+import metrics
+from image_processor import ImageProcessor, RegionTooLarge, save_image
 
 # Generate a dummy 5D image (X, Y, Z, Time, Channels)
 dummy_image = np.random.randint(0, 256, (100, 100, 10, 5, 3), dtype=np.uint8)
@@ -22,11 +23,34 @@ def test_extract_slice(processor):
     slice_img = processor.extract_slice(z=5, time=2, channel=1)
     assert slice_img.shape == (100, 100)
 
+def test_extract_region():
+    """Test cropped, ranged and strided reads touch only the selected pages."""
+    tiff.imwrite("data/test_image_zlib.tif", dummy_image, compression="zlib")
+    compressed = ImageProcessor("data/test_image_zlib.tif")
+    pages_read = []
+    read_pages = compressed._tiff.asarray
+    compressed._tiff.asarray = lambda key, **kwargs: pages_read.append(len(key)) or read_pages(key=key, **kwargs)
+
+    region = compressed.extract_region(x=slice(10, 50, 4), y=slice(None, None, 10), z=slice(2, 8), channel=0)
+    np.testing.assert_array_equal(region, dummy_image[10:50:4, ::10, 2:8, :, 0])
+    assert sum(pages_read) == 10 * 10
+
+    with pytest.raises(RegionTooLarge):
+        compressed.extract_region(max_bytes=1000)
+
 def test_pca(processor):
     """Test PCA transformation."""
     reduced = processor.apply_pca(2)
     assert reduced.shape[-1] == 2
 
+def test_pca_streams_to_tiff(processor):
+    """Test that PCA output is lazy and can be written chunk by chunk."""
+    reduced = processor.apply_pca(2)
+    assert reduced.shape == (100, 100, 10, 5, 2)
+    save_image(reduced, "data/test_pca_output.tif", dtype=np.float32)
+    written = tiff.imread("data/test_pca_output.tif")
+    np.testing.assert_allclose(written, reduced.compute().astype(np.float32))
+
 def test_statistics(processor):
     """Test computing image statistics."""
     stats = processor.compute_statistics()
@@ -37,4 +61,49 @@ def test_statistics(processor):
 def test_kmeans_segmentation(processor):
     """Test K-Means segmentation."""
     segmented = processor.apply_kmeans_segmentation(channel=0, k=3)
-    assert segmented.shape == (100, 100, 10)
+    assert segmented.shape == (100, 100, 10, 5)
+
+def test_feature_kmeans_segmentation(processor):
+    """Test K-Means on all channels and on their PCA projection keeps the full volume."""
+    for components in (None, 2):
+        segmented = processor.apply_kmeans_segmentation(k=4, method="sample", channels="all", components=components)
+        assert segmented.shape == (100, 100, 10, 5)
+        labels = segmented.compute()
+        assert labels.dtype == np.uint8
+        assert set(np.unique(labels)) == {0, 1, 2, 3}
+
+    with pytest.raises(ValueError):
+        processor.apply_kmeans_segmentation(channels=[0, 1])
+    with pytest.raises(ValueError):
+        processor.apply_kmeans_segmentation(method="sample", channels=[0, 3])
+
+def test_lazy_loading_compressed():
+    """Test that compressed TIFFs are decoded lazily and match the source."""
+    tiff.imwrite("data/test_image_zlib.tif", dummy_image, compression="zlib")
+    compressed = ImageProcessor("data/test_image_zlib.tif")
+    assert compressed.image.chunks[2:] == ((10,), (5,), (3,))
+    np.testing.assert_array_equal(compressed.extract_slice(z=5, time=2, channel=1), dummy_image[:, :, 5, 2, 1])
+
+def test_statistics_match_numpy(processor):
+    """Test that the single-pass statistics agree with numpy."""
+    stats = processor.compute_statistics()
+    for c in range(dummy_image.shape[-1]):
+        channel = dummy_image[..., c]
+        assert stats[f"Channel {c}"]["mean"] == pytest.approx(channel.mean())
+        assert stats[f"Channel {c}"]["std"] == pytest.approx(channel.std())
+        assert stats[f"Channel {c}"]["min"] == channel.min()
+        assert stats[f"Channel {c}"]["max"] == channel.max()
+        assert stats[f"Channel {c}"]["count"] == channel.size
+
+def test_metrics_trace():
+    """Test that library calls report their stages, bytes read and Dask tasks to the active trace."""
+    tiff.imwrite("data/test_image_zlib.tif", dummy_image, compression="zlib")
+    with metrics.trace() as trace:
+        region = ImageProcessor("data/test_image_zlib.tif").extract_region(z=2, time=1)
+
+    assert {"open", "read", "compute"} <= set(trace.stages)
+    # TIFF pages hold (Z, Time, Channel) blocks, so fixing z and time still reads every page.
+    assert trace.bytes_read == dummy_image.nbytes
+    assert region.shape == (100, 100, 3)
+    assert trace.tasks > 0
+    assert trace.peak_rss > 0
@@ -0,0 +1,97 @@
+import time
+import uuid
+import dask.array as da
+import pytest
+from database import session_scope, Job
+from jobs import JobCancelled, JobManager, JobProgress, _run_job
+
+
+class RecordingManager(JobManager):
+    """A job manager that records enqueued jobs instead of running them."""
+
+    def __init__(self):
+        super().__init__()
+        self.enqueued = []
+
+    def _enqueue(self, job_id, operation, parameters):
+        self.enqueued.append(job_id)
+
+
+def create_job(**fields):
+    with session_scope() as db:
+        job = Job(
+            id=uuid.uuid4().hex,
+            operation="kmeans",
+            parameters={"file_path": "data/test_image.tif"},
+            dedupe_key=uuid.uuid4().hex,
+            **{"status": "queued", **fields},
+        )
+        db.add(job)
+        db.commit()
+        return job.id
+
+
+def load_job(job_id):
+    with session_scope() as db:
+        return db.get(Job, job_id)
+
+
+def test_progress_is_recorded():
+    """Test that the Dask callback writes finished and total task counts."""
+    job_id = create_job()
+    with JobProgress(job_id) as progress:
+        da.ones((100, 100), chunks=10).sum().compute()
+    progress._update(force=True)
+    job = load_job(job_id)
+    assert job.progress_total > 0
+    assert job.progress_done == job.progress_total
+
+
+def test_cancel_requested_stops_computation():
+    """Test that a cancellation flag aborts a running computation."""
+    job_id = create_job(cancel_requested=True)
+    with pytest.raises(JobCancelled):
+        with JobProgress(job_id):
+            da.ones((100, 100), chunks=10).sum().compute()
+
+
+def test_cancelled_before_start():
+    """Test that a job cancelled while queued never runs."""
+    job_id = create_job(cancel_requested=True)
+    _run_job(job_id, "kmeans", {"file_path": "data/test_image.tif"})
+    assert load_job(job_id).status == "cancelled"
+
+
+def test_resume_skips_live_leases():
+    """Test that only jobs whose lease expired are claimed and requeued."""
+    live = create_job(status="running", owner="other-host:1", lease_expires=time.time() + 60)
+    expired = create_job(status="running", owner="other-host:2", lease_expires=time.time() - 1)
+    manager = RecordingManager()
+    manager.resume_pending()
+
+    assert expired in manager.enqueued
+    assert live not in manager.enqueued
+    assert load_job(live).owner == "other-host:1"
+    job = load_job(expired)
+    assert job.status == "queued"
+    assert job.owner != "other-host:2"
+    assert job.lease_expires > time.time()
+
+    # A second process sees the fresh lease and leaves the job alone.
+    sibling = RecordingManager()
+    sibling.resume_pending()
+    assert expired not in sibling.enqueued
+
+
+def test_submissions_deduplicated_across_processes():
+    """Test that identical submissions from separate managers share one job until it finishes."""
+    parameters = {"file_path": "data/test_image.tif", "channel": 0, "k": 7, "nonce": uuid.uuid4().hex}
+    first, second = RecordingManager(), RecordingManager()
+    job = first.submit("kmeans", parameters)
+    assert second.submit("kmeans", parameters)["id"] == job["id"]
+    assert second.enqueued == []
+
+    with session_scope() as db:
+        db.get(Job, job["id"]).active_key = None
+        db.commit()
+    assert second.submit("kmeans", parameters)["id"] != job["id"]
@@ -0,0 +1,30 @@
+import numpy as np
+import dask.array as da
+import pytest
+from sklearn.decomposition import PCA
+from pca import CovariancePCA
+
+rng = np.random.default_rng(0)
+# Correlated channels so the components are well separated.
+pixels = rng.normal(size=(20, 30, 4, 3, 5)) @ rng.normal(size=(5, 5)) * 10 + 50
+image = da.from_array(pixels, chunks=(7, 11, 4, 3, 5))
+
+
+def test_covariance_pca_matches_sklearn():
+    """Test that the covariance engine reproduces sklearn's exact PCA."""
+    reference = PCA(n_components=3).fit(pixels.reshape(-1, 5))
+    pca = CovariancePCA(3).fit(image)
+
+    np.testing.assert_allclose(pca.mean_, reference.mean_)
+    np.testing.assert_allclose(pca.explained_variance_, reference.explained_variance_)
+    np.testing.assert_allclose(pca.explained_variance_ratio_, reference.explained_variance_ratio_)
+    np.testing.assert_allclose(pca.components_, reference.components_, atol=1e-8)
+    np.testing.assert_allclose(
+        pca.transform(pixels.reshape(-1, 5)), reference.transform(pixels.reshape(-1, 5)), atol=1e-6
+    )
+
+
+def test_covariance_pca_rejects_too_many_components():
+    """Test that asking for more components than channels fails clearly."""
+    with pytest.raises(ValueError):
+        CovariancePCA(6).fit(image)
@@ -0,0 +1,52 @@
+import os
+import numpy as np
+import tifffile as tiff
+from image_processor import ImageProcessor
+from pyramid import build_pyramid, choose_level, downsample, open_pyramid, scale_index
+import dask.array as da
+
+labels = np.random.randint(0, 4, (301, 200, 2, 2, 1), dtype=np.uint8)
+
+
+def test_downsample_mean_and_mode():
+    """Test that mean and mode reduce every 2x2 block and drop odd edges."""
+    image = da.from_array(labels, chunks=(51, 37, 1, 2, 1))
+    blocks = labels[:300].reshape(150, 2, 100, 2, 2, 2, 1)
+
+    mean = downsample(image, "mean").compute()
+    expected = np.round(blocks.mean(axis=(1, 3))).astype(np.uint8)
+    np.testing.assert_array_equal(mean, expected)
+
+    mode = downsample(image, "mode").compute()
+    assert mode.shape == (150, 100, 2, 2, 1)
+    values = np.moveaxis(blocks, (1, 3), (-2, -1)).reshape(150, 100, 2, 2, 1, 4)
+    counts = (values[..., :, None] == values[..., None, :]).sum(axis=-1)
+    winners = np.take_along_axis(values, counts.argmax(axis=-1)[..., None], axis=-1)[..., 0]
+    np.testing.assert_array_equal(mode, winners)
+
+
+def test_build_and_read_pyramid():
+    """Test building levels, reading through them and ignoring a stale pyramid."""
+    path = "data/test_pyramid_levels.tif"
+    tiff.imwrite(path, labels)
+    processor = ImageProcessor(path)
+    build_pyramid(path, processor.image, method="mode", min_size=80)
+
+    levels = processor.pyramid_levels()
+    assert [level.shape[:2] for level in levels] == [(301, 200), (150, 100), (75, 50)]
+    assert processor.choose_level(60) == 2
+    assert processor.choose_level(1000) == 0
+    region = processor.extract_region(x=slice(40, 200), z=0, time=1, channel=0, level=2)
+    np.testing.assert_array_equal(region, levels[2][10:50, :, 0, 1, 0].compute())
+
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert open_pyramid(path) == []
+
+
+def test_level_selection_helpers():
+    """Test level choice and the mapping of full-resolution indices."""
+    assert choose_level([1024, 512], 256, 4) == 2
+    assert choose_level([100, 100], 256, 4) == 0
+    assert scale_index(slice(10, 101, 8), 4) == slice(2, 26, 2)
+    assert scale_index(slice(None, None, 2), 4) == slice(None, None, 1)
+    assert scale_index(37, 4) == 9
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+LAZY_MODULES = ("cv2", "sklearn", "skimage", "dask_image", "scipy.stats", "scipy.ndimage")
+# Seconds allowed for importing main and building the app; generous for slow
+# machines, while an analysis library back on the import path roughly doubles it.
+IMPORT_BUDGET = float(os.environ.get("IMPORT_BUDGET", 4.0))
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import main
+main.create_app()
+print(time.perf_counter() - start)
+print(",".join(name for name in sys.argv[1:] if name in sys.modules))
+"""
+
+
+def test_startup_skips_analysis_libraries():
+    """Test that building the app loads no analysis library and stays within the import budget."""
+    env = {**os.environ, "PYTHONPATH": APP_DIR}
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT, *LAZY_MODULES], env=env, capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    assert output[-1] == ""
+    assert float(output[-2]) < IMPORT_BUDGET
@@ -0,0 +1,45 @@
+import dask.array as da
+import numpy as np
+import pytest
+from skimage.filters import threshold_multiotsu, threshold_otsu
+from thresholding import PLANE_BINS, apply_thresholds, fit_thresholds, thresholds_from_histogram
+
+image = np.random.randint(0, 256, (64, 48, 6, 3), dtype=np.uint8)
+chunked = da.from_array(image, chunks=(20, 16, 2, 1))
+
+
+def test_global_thresholds_match_skimage():
+    """Test that streamed global thresholds equal skimage on the whole array."""
+    assert fit_thresholds(chunked, 2)[0] == threshold_otsu(image.ravel())
+    np.testing.assert_array_equal(fit_thresholds(chunked, 3), threshold_multiotsu(image.ravel(), classes=3))
+
+
+def test_labels_count_exceeded_thresholds():
+    """Test that two classes give image > threshold and more classes count thresholds."""
+    threshold = fit_thresholds(chunked, 2)
+    np.testing.assert_array_equal(apply_thresholds(chunked, threshold).compute(), image > threshold[0])
+    thresholds = fit_thresholds(chunked, 4)
+    np.testing.assert_array_equal(apply_thresholds(chunked, thresholds).compute(), np.digitize(image, thresholds, right=True))
+
+
+def test_plane_thresholds():
+    """Test that plane mode thresholds every (z, time) plane separately."""
+    planes = image.astype(np.float32) * np.arange(1, 4, dtype=np.float32)
+    thresholds = fit_thresholds(da.from_array(planes, chunks=(20, 16, 2, 1)), 2, mode="plane")
+    assert thresholds.shape == (6, 3, 1)
+    bin_width = (planes.max() - planes.min()) / PLANE_BINS
+    for z in range(6):
+        for t in range(3):
+            assert abs(thresholds[z, t, 0] - threshold_otsu(planes[:, :, z, t])) <= bin_width
+
+    labels = apply_thresholds(da.from_array(planes, chunks=(20, 16, 2, 1)), thresholds).compute()
+    np.testing.assert_array_equal(labels[:, :, 4, 2], planes[:, :, 4, 2] > thresholds[4, 2, 0])
+
+
+def test_threshold_validation():
+    """Test invalid class counts and modes, and images with fewer values than classes."""
+    with pytest.raises(ValueError):
+        fit_thresholds(chunked, 6)
+    with pytest.raises(ValueError):
+        fit_thresholds(chunked, 2, mode="slice")
+    np.testing.assert_array_equal(thresholds_from_histogram(np.array([3.0, 7.0]), np.array([5.0, 5.0]), 4), [3, 7, 7])
@@ -0,0 +1,63 @@
+import numpy as np
+import tifffile as tiff
+import timeseries
+from timeseries import summarize_timeseries, update_frames
+
+image = np.random.randint(0, 256, (40, 30, 4, 5, 2), dtype=np.uint8)
+
+
+def test_frame_statistics_match_numpy():
+    """Test per-frame curves and merged global statistics against numpy."""
+    path = "data/test_timeseries.tif"
+    tiff.imwrite(path, image, photometric="minisblack")
+    frames, new_frames = update_frames(path, refresh=True)
+    assert new_frames == 5
+    result = summarize_timeseries(frames, image.dtype, histograms=True)
+
+    assert result["frames"] == 5
+    curves = result["timeseries"]["Channel 1"]
+    np.testing.assert_allclose(curves["mean"], image[..., 1].mean(axis=(0, 1, 2)))
+    np.testing.assert_allclose(curves["std"], image[..., 1].std(axis=(0, 1, 2)))
+    assert curves["max"] == image[..., 1].max(axis=(0, 1, 2)).tolist()
+    assert sum(curves["histogram"][3]["counts"]) == image[:, :, :, 3, 1].size
+
+    statistics = result["statistics"]["Channel 0"]
+    np.testing.assert_allclose(statistics["mean"], image[..., 0].mean())
+    histogram = statistics["histogram"]
+    assert (histogram["width"], histogram["start"]) == (1.0, float(image[..., 0].min()))
+    expected = np.bincount(image[..., 0].ravel() - image[..., 0].min(), minlength=256)[:256]
+    assert histogram["counts"] == expected.tolist()
+
+
+def test_appended_frames_only_are_read(monkeypatch):
+    """Test that a file grown along time reads only its new frames, and a rewrite all of them."""
+    path = "data/test_timeseries_append.tif"
+    tiff.imwrite(path, image[:, :, :, :3], photometric="minisblack")
+    update_frames(path)
+
+    computed = []
+    compute_frames = timeseries.compute_frames
+    monkeypatch.setattr(timeseries, "compute_frames", lambda data, frames: computed.append(frames) or compute_frames(data, frames))
+    tiff.imwrite(path, image, photometric="minisblack")
+    frames, new_frames = update_frames(path)
+    assert (new_frames, computed) == (2, [[3, 4]])
+    means = summarize_timeseries(frames, image.dtype)["timeseries"]["Channel 0"]["mean"]
+    np.testing.assert_allclose(means, image[..., 0].mean(axis=(0, 1, 2)))
+
+    assert update_frames(path)[1] == 0
+    tiff.imwrite(path, image[::-1], photometric="minisblack")
+    assert update_frames(path)[1] == 5
+
+
+def test_float_histograms():
+    """Test that float frames get histograms over their own range, ignoring NaNs."""
+    data = np.random.rand(20, 10, 2, 3, 1).astype(np.float32) * np.arange(1, 4, dtype=np.float32)[:, None]
+    data[0, 0, 0, 1, 0] = np.nan
+    path = "data/test_timeseries_float.tif"
+    tiff.imwrite(path, data)
+    result = summarize_timeseries(update_frames(path, refresh=True)[0], data.dtype, histograms=True)
+    frame = result["timeseries"]["Channel 0"]["histogram"][1]
+    assert sum(frame["counts"]) == data[:, :, :, 1].size - 1
+    assert frame["start"] == np.nanmin(data[:, :, :, 1])
+    assert sum(result["statistics"]["Channel 0"]["histogram"]["counts"]) == data.size - 1
+    assert result["timeseries"]["Channel 0"]["nan_count"] == [0, 1, 0]
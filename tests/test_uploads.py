@@ -0,0 +1,98 @@
+import hashlib
+import io
+import os
+import numpy as np
+import pytest
+import tifffile as tiff
+import uploads
+from database import engine
+from uploads import UploadConflict, copy_stream, create_upload, get_upload, read_header, write_range
+
+image = np.random.randint(0, 256, (20, 20, 4, 3, 3), dtype=np.uint8)
+
+
+def tiff_bytes(data=image):
+    buffer = io.BytesIO()
+    tiff.imwrite(buffer, data)
+    return buffer.getvalue()
+
+
+class CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.largest_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.largest_read = max(self.largest_read, len(chunk))
+        return chunk
+
+
+def test_copy_stream_is_chunked(monkeypatch):
+    """Test that streams are copied in bounded reads and hashed on the way."""
+    import uploads
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_BYTES", 1000)
+    data = os.urandom(10_500)
+    stream, out, hasher = CountingStream(data), io.BytesIO(), hashlib.sha256()
+    assert copy_stream(stream, out, hasher) == len(data)
+    assert stream.largest_read == 1000
+    assert out.getvalue() == data
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_read_header_validates_without_pixels():
+    """Test that the header check reports shape/dtype and rejects bad files."""
+    with open("data/test_header.tif", "wb") as f:
+        f.write(tiff_bytes())
+    assert read_header("data/test_header.tif") == ((20, 20, 4, 3, 3), np.dtype(np.uint8))
+
+    tiff.imwrite("data/test_header_4d.tif", image[..., 0])
+    with pytest.raises(ValueError, match="5D"):
+        read_header("data/test_header_4d.tif")
+
+    with open("data/test_header_garbage.tif", "wb") as f:
+        f.write(b"not a tiff")
+    with pytest.raises(ValueError):
+        read_header("data/test_header_garbage.tif")
+
+
+def test_resumable_upload():
+    """Test sequential ranges, out-of-order rejection and checksum-verified ingestion."""
+    data = tiff_bytes()
+    upload = create_upload("test_resumable.tif", len(data), sha256=hashlib.sha256(data).hexdigest())
+    upload_id = upload["upload_id"]
+
+    write_range(upload_id, 0, 1000, io.BytesIO(data[:1000]))
+    with pytest.raises(UploadConflict):
+        write_range(upload_id, 2000, 1000, io.BytesIO(data[2000:3000]))
+    assert get_upload(upload_id)["offset"] == 1000
+
+    result = write_range(upload_id, 1000, len(data) - 1000, io.BytesIO(data[1000:]))
+    assert result["status"] == "completed"
+    np.testing.assert_array_equal(tiff.imread(result["file_path"]), image)
+
+
+def test_resumable_upload_checksum_mismatch():
+    """Test that a wrong checksum fails the upload and discards the data."""
+    data = tiff_bytes()
+    upload = create_upload("test_resumable_bad.tif", len(data), sha256="0" * 64)
+    result = write_range(upload["upload_id"], 0, len(data), io.BytesIO(data))
+    assert result["status"] == "failed"
+    assert result["error"] == "Checksum mismatch"
+
+
+def test_write_range_streams_without_session():
+    """Test that no database connection is held while a range streams in, and that upload locks are released."""
+    data = tiff_bytes()
+    upload = create_upload("test_resumable_session.tif", len(data))
+    checked_out = []
+
+    class ObservedStream(io.BytesIO):
+        def read(self, size=-1):
+            checked_out.append(engine.pool.checkedout())
+            return super().read(size)
+
+    result = write_range(upload["upload_id"], 0, len(data), ObservedStream(data))
+    assert result["status"] == "completed"
+    assert set(checked_out) == {0}
+    assert upload["upload_id"] not in uploads._locks
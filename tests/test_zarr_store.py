@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pytest
+import tifffile as tiff
+import zarr_store
+from image_cache import ImageCache
+from image_processor import ImageProcessor
+from zarr_store import COMPRESSIONS, convert_to_zarr, open_store, store_path
+
+image = np.random.randint(0, 4096, (60, 40, 4, 3, 3), dtype=np.uint16)
+
+
+def write_image(path):
+    tiff.imwrite(path, image)
+    return path
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSIONS))
+def test_convert_round_trip(compression):
+    """Test that both layouts hold the image, chunked for their access pattern."""
+    path = write_image(f"data/test_zarr_{compression}.tif")
+    convert_to_zarr(path, ImageProcessor(path).image, compression=compression)
+
+    layouts = open_store(path)
+    np.testing.assert_array_equal(layouts["planes"].compute(), image)
+    np.testing.assert_array_equal(layouts["channels"].compute(), image)
+    assert layouts["channels"].chunks[1:] == tuple((n,) for n in image.shape[1:])
+
+
+def test_processor_uses_working_copy():
+    """Test that ImageProcessor and the cache switch to the store and ignore it once stale."""
+    path = write_image("data/test_zarr_processor.tif")
+    cache = ImageCache()
+    before = cache.get(path)
+    expected = before.compute_statistics()
+
+    convert_to_zarr(path, before.image)
+    processor = cache.get(path)
+    assert processor is not before
+    assert processor.image.name.startswith("from-zarr")
+    assert processor.compute_statistics() == expected
+    np.testing.assert_array_equal(processor.extract_slice(z=1, time=2, channel=0), image[:, :, 1, 2, 0])
+
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert open_store(path) == {}
+    assert not cache.get(path).image.name.startswith("from-zarr")
+
+
+def test_rebuild_never_exposes_partial_store(monkeypatch):
+    """Test that a rebuilt store replaces the old one before the old one is deleted."""
+    path = write_image("data/test_zarr_rebuild.tif")
+    convert_to_zarr(path, ImageProcessor(path).image)
+    updated = image[::-1].copy()
+    tiff.imwrite(path, updated)
+
+    seen = []
+    rmtree = zarr_store.shutil.rmtree
+
+    def checked_rmtree(target, *args, **kwargs):
+        # While the old group is deleted, readers of the store path already
+        # see the complete new store.
+        if str(target).startswith(store_path(path) + ".") and str(target).endswith(".old"):
+            seen.append(target)
+            np.testing.assert_array_equal(open_store(path)["planes"].compute(), updated)
+        return rmtree(target, *args, **kwargs)
+
+    monkeypatch.setattr(zarr_store.shutil, "rmtree", checked_rmtree)
+    convert_to_zarr(path, ImageProcessor(path).image)
+    assert len(seen) == 1
+    assert not [name for name in os.listdir("data") if name.startswith(os.path.basename(store_path(path)) + ".")]